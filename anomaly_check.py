@@ -0,0 +1,201 @@
+"""
+Post-run anomaly pass with a targeted verification re-scrape.
+
+Parsing mistakes show up as outliers against an ASIN's own history. This
+pass reads the day's daily_amazon_data rows and the previous `history_days`
+of scans in bulk, then flags, column-wise:
+
+    min_above_price   minimum_price greater than the price it should bound
+    fraction_price    price below $1, e.g. only the fraction of '$12.99' was read
+    price_outlier     price under a fifth or over five times the ASIN's median
+    default_offers    the '1' offers fallback for an ASIN that usually has 3 or more
+    rank_lost         'Not ranked' for an ASIN ranked in most of its history
+
+History rules need at least `min_history` earlier scans. Only the flagged
+ASINs, at most `max_rescrapes` of them with the most reasons first, are
+scraped a second time. The verified values replace the stored row. The
+second scrape is checked against the same rules, and each ASIN's outcome is
+recorded in daily_anomalies:
+
+    corrected    the second scrape cleared the flags
+    confirmed    the second scrape reproduced them, so the value is probably real
+    unverified   the second scrape failed, so the original row is kept
+
+    run_anomaly_pass(conn, rescrape, save, 'US', '11229')
+
+rescrape(asins) returns {asin: product data} for the ASINs it could scrape.
+save(results) writes them the way the scraper saves a batch.
+"""
+import logging
+import os
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+
+from daily_movers import SNAPSHOT_COLUMNS, copy_frame, main_rank
+
+logger = logging.getLogger("AnomalyCheck")
+
+MAX_RESCRAPES = int(os.getenv('SCRAPER_ANOMALY_MAX', '200'))
+
+
+def create_anomaly_table(conn):
+    """Create the anomaly outcome table if it does not exist"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS daily_anomalies (
+                scan_date DATE NOT NULL,
+                asin VARCHAR(10) NOT NULL,
+                marketplace VARCHAR(5) NOT NULL,
+                zip_code VARCHAR(12) NOT NULL,
+                reasons TEXT NOT NULL,
+                outcome VARCHAR(20) NOT NULL,
+                old_price DECIMAL(10,2),
+                new_price DECIMAL(10,2),
+                old_minimum_price DECIMAL(10,2),
+                new_minimum_price DECIMAL(10,2),
+                old_offers INTEGER,
+                new_offers INTEGER,
+                old_best_seller_rank TEXT,
+                new_best_seller_rank TEXT,
+                checked_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (scan_date, asin, marketplace, zip_code)
+            )
+        """)
+    conn.commit()
+
+
+def history_stats(history, min_history=3):
+    """Per-ASIN medians and ranked share over earlier scans, for ASINs with enough of them"""
+    if history.empty:
+        return pd.DataFrame(columns=['median_price', 'median_offers', 'ranked_share']).rename_axis('asin')
+    history = history.assign(
+        price=pd.to_numeric(history['price'], errors='coerce'),
+        offers=pd.to_numeric(history['offers'], errors='coerce'),
+        ranked=main_rank(history['best_seller_rank']).notna()
+    )
+    stats = history.groupby('asin').agg(
+        scans=('asin', 'size'),
+        median_price=('price', 'median'),
+        median_offers=('offers', 'median'),
+        ranked_share=('ranked', 'mean'),
+    )
+    return stats[stats['scans'] >= min_history].drop(columns='scans')
+
+
+def flag_anomalies(rows, stats):
+    """Rows with a 'reasons' column listing every rule they break; rows breaking none are dropped"""
+    df = rows.drop_duplicates('asin').merge(stats, left_on='asin', right_index=True, how='left')
+    price = pd.to_numeric(df['price'], errors='coerce')
+    minimum = pd.to_numeric(df['minimum_price'], errors='coerce')
+    offers = pd.to_numeric(df['offers'], errors='coerce')
+    median_price = df['median_price'].astype(float)
+    rules = {
+        'min_above_price': minimum > price * 1.01,
+        'fraction_price': price < 1,
+        'price_outlier': (price < median_price * 0.2) | (price > median_price * 5),
+        'default_offers': (offers == 1) & (df['median_offers'].astype(float) >= 3),
+        'rank_lost': main_rank(df['best_seller_rank']).isna() & (df['ranked_share'].astype(float) >= 0.8),
+    }
+    hits = pd.DataFrame({name: rule.fillna(False).to_numpy(dtype=bool) for name, rule in rules.items()},
+                        index=df.index)
+    names = np.array(list(rules))
+    flagged = hits.any(axis=1)
+    df = df[flagged].copy()
+    df['reasons'] = [','.join(names[row]) for row in hits[flagged].to_numpy()]
+    df['reason_count'] = hits[flagged].sum(axis=1)
+    return df[SNAPSHOT_COLUMNS + ['reasons', 'reason_count']]
+
+
+def _value(value):
+    return None if value is None or (isinstance(value, float) and np.isnan(value)) else value
+
+
+def _offers(value):
+    try:
+        return int(value) if value not in (None, '') and not pd.isna(value) else None
+    except (TypeError, ValueError):
+        return None
+
+
+def run_anomaly_pass(conn, rescrape, save, marketplace='US', zip_code='11229', scan_date=None,
+                     history_days=14, min_history=3, max_rescrapes=None):
+    """
+    Flag the day's anomalous rows, re-scrape them and store the verified
+    values. Returns {outcome: count}.
+    """
+    scan_date = scan_date or date.today()
+    max_rescrapes = MAX_RESCRAPES if max_rescrapes is None else max_rescrapes
+    create_anomaly_table(conn)
+    today = copy_frame(conn, """
+        SELECT asin, price, minimum_price, offers, best_seller_rank
+        FROM daily_amazon_data
+        WHERE scan_date = %s AND marketplace = %s AND zip_code = %s AND best_seller_rank IS DISTINCT FROM 'Error'
+    """, (scan_date, marketplace, zip_code), SNAPSHOT_COLUMNS)
+    history = copy_frame(conn, """
+        SELECT asin, price, minimum_price, offers, best_seller_rank
+        FROM daily_amazon_data
+        WHERE scan_date >= %s AND scan_date < %s AND marketplace = %s AND zip_code = %s
+          AND best_seller_rank IS DISTINCT FROM 'Error'
+    """, (scan_date - timedelta(days=history_days), scan_date, marketplace, zip_code), SNAPSHOT_COLUMNS)
+    stats = history_stats(history, min_history)
+    flagged = flag_anomalies(today, stats)
+    if flagged.empty:
+        logger.info(f"Anomaly pass for {marketplace}/{zip_code} {scan_date}: {len(today)} rows, none flagged")
+        return {}
+
+    flagged = flagged.sort_values('reason_count', ascending=False, kind='stable')
+    if len(flagged) > max_rescrapes:
+        logger.warning(f"{len(flagged)} anomalous rows, verifying only the {max_rescrapes} with the most reasons")
+        flagged = flagged.head(max_rescrapes)
+    counts = flagged['reasons'].str.split(',').explode().value_counts()
+    logger.info(f"Anomaly pass for {marketplace}/{zip_code} {scan_date}: {len(flagged)} of {len(today)} rows flagged "
+                f"({', '.join(f'{reason} {count}' for reason, count in counts.items())}), re-scraping them")
+
+    verified = rescrape(flagged['asin'].tolist())
+    results = [verified[asin] for asin in flagged['asin'] if verified.get(asin)]
+    if results:
+        save(results)
+        still = flag_anomalies(pd.DataFrame(results).reindex(columns=SNAPSHOT_COLUMNS), stats)
+        still_reasons = dict(zip(still['asin'], still['reasons']))
+    else:
+        still_reasons = {}
+
+    outcomes, records = {}, []
+    for row in flagged.itertuples(index=False):
+        result = verified.get(row.asin)
+        if not result:
+            outcome = 'unverified'
+        elif row.asin in still_reasons:
+            outcome = 'confirmed'
+        else:
+            outcome = 'corrected'
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        result = result or {}
+        records.append((
+            scan_date, row.asin, marketplace, zip_code, row.reasons, outcome,
+            _value(row.price), result.get('price'), _value(row.minimum_price), result.get('minimum_price'),
+            _offers(row.offers), _offers(result.get('offers')),
+            _value(row.best_seller_rank), result.get('best_seller_rank')
+        ))
+
+    with conn.cursor() as cur:
+        execute_values(cur, """
+            INSERT INTO daily_anomalies
+            (scan_date, asin, marketplace, zip_code, reasons, outcome, old_price, new_price, old_minimum_price,
+             new_minimum_price, old_offers, new_offers, old_best_seller_rank, new_best_seller_rank)
+            VALUES %s
+            ON CONFLICT (scan_date, asin, marketplace, zip_code) DO UPDATE SET
+                reasons = EXCLUDED.reasons,
+                outcome = EXCLUDED.outcome,
+                new_price = EXCLUDED.new_price,
+                new_minimum_price = EXCLUDED.new_minimum_price,
+                new_offers = EXCLUDED.new_offers,
+                new_best_seller_rank = EXCLUDED.new_best_seller_rank,
+                checked_at = NOW()
+        """, records)
+    conn.commit()
+    logger.info(f"Anomaly pass done: {', '.join(f'{outcome} {count}' for outcome, count in sorted(outcomes.items()))}")
+    return outcomes
@@ -0,0 +1,240 @@
+"""
+Fault-injection harness for the recovery paths of the daily scraper.
+
+Runs scriptfinal2.run_scraper_with_recovery against the mock storefront and a
+disposable database while injecting one fault type per scenario at a scripted
+point (the Nth product page request):
+
+    captcha_storm   every product page is a captcha for a stretch of requests
+    driver_crash    the browser dies mid-run and every later driver call fails
+    db_disconnect   all server connections of the scraper are terminated
+    slow_pages      product pages stall for several seconds each
+
+For each scenario it reports wall-clock time lost against a fault-free
+baseline, pages re-fetched, restarts, rows lost or duplicated, and the time
+spent in the checkpoint and already-scraped lookups used to resume:
+
+    python -m benchmarks.fault_injection --asins 40 --fault-at 12 --output faults.json
+"""
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import psycopg2
+from selenium.common.exceptions import WebDriverException
+
+from benchmarks.mock_storefront import MockStorefront, StorefrontConfig, LocalCaptchaSolver
+from benchmarks.run_benchmark import (
+    Stopwatch, disposable_database, git_revision, server_params, write_asin_workbook
+)
+
+logger = logging.getLogger("FaultInjection")
+
+SCENARIOS = ('baseline', 'captcha_storm', 'driver_crash', 'db_disconnect', 'slow_pages')
+
+
+class FaultScript:
+    """Decides, per served request, whether a fault fires"""
+
+    def __init__(self, scenario, fault_at, length, slow_delay, db_params):
+        self.scenario = scenario
+        self.fault_at = fault_at
+        self.length = length
+        self.slow_delay = slow_delay
+        self.db_params = db_params
+        self.product_requests = 0
+        self.fired_at = None
+        self._lock = threading.Lock()
+
+    def storefront_hook(self, kind, asin):
+        if kind != 'product':
+            return None
+        with self._lock:
+            self.product_requests += 1
+            n = self.product_requests
+        in_window = self.fault_at <= n < self.fault_at + self.length
+        if self.scenario == 'captcha_storm' and in_window:
+            self._mark_fired()
+            return {'captcha': True}
+        if self.scenario == 'slow_pages' and in_window:
+            self._mark_fired()
+            return {'delay': self.slow_delay}
+        if self.scenario == 'db_disconnect' and n == self.fault_at:
+            self._mark_fired()
+            terminate_connections(self.db_params['dbname'])
+        return None
+
+    def _mark_fired(self):
+        if self.fired_at is None:
+            self.fired_at = time.perf_counter()
+
+
+def terminate_connections(dbname):
+    """Kill every backend attached to dbname, as a server restart or network drop would"""
+    conn = psycopg2.connect(dbname='postgres', **server_params())
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = %s AND pid <> pg_backend_pid()",
+                (dbname,)
+            )
+            logger.warning(f"Injected DB disconnect: terminated {cur.rowcount} connection(s)")
+    finally:
+        conn.close()
+
+
+class CrashingDriver:
+    """Delegates to a real driver until the scripted page load, then kills it"""
+
+    def __init__(self, driver, script):
+        self._driver = driver
+        self._script = script
+
+    def get(self, url):
+        if self._script.scenario == 'driver_crash' and '/dp/' in url:
+            with self._script._lock:
+                due = self._script.product_requests + 1 >= self._script.fault_at and self._script.fired_at is None
+            if due:
+                self._script._mark_fired()
+                logger.warning("Injected driver crash")
+                try:
+                    self._driver.quit()
+                except Exception:
+                    pass
+                raise WebDriverException("chrome not reachable (injected crash)")
+        return self._driver.get(url)
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+
+def run_scenario(scenario, asins, args, workdir):
+    import scriptfinal2
+    from scraper_metrics import RESTARTS_TOTAL
+
+    config = StorefrontConfig(product_latency=args.product_latency, offers_latency=args.offers_latency)
+    with MockStorefront(config) as storefront, disposable_database('amazon_faults') as db_params:
+        script = FaultScript(scenario, args.fault_at, args.length, args.slow_delay, db_params)
+        config.fault_hook = script.storefront_hook
+
+        scriptfinal2.AMAZON_BASE_URL = storefront.base_url
+        scriptfinal2.TwoCaptcha = LocalCaptchaSolver
+        original_init = scriptfinal2.initialize_driver
+        scriptfinal2.initialize_driver = lambda proxy=None: CrashingDriver(original_init(proxy), script)
+
+        manager_cls = scriptfinal2.SimpleDatabaseManager
+        originals = {
+            name: getattr(manager_cls, name)
+            for name in ('save_product_data', 'get_last_checkpoint', 'get_scraped_asins_for_today')
+        }
+        timers = {name: Stopwatch(func) for name, func in originals.items()}
+        submitted = []
+
+        def counting_save(self, batch_results):
+            result = timers['save_product_data'](self, batch_results)
+            submitted.extend(r['asin'] for r in batch_results if r.get('asin'))
+            return result
+
+        manager_cls.save_product_data = counting_save
+        manager_cls.get_last_checkpoint = lambda self: timers['get_last_checkpoint'](self)
+        manager_cls.get_scraped_asins_for_today = lambda self: timers['get_scraped_asins_for_today'](self)
+
+        restarts_before = RESTARTS_TOTAL.get(scraper='daily')
+        excel_file = write_asin_workbook(asins, 'ASIN', workdir)
+        start = time.perf_counter()
+        try:
+            outcome = scriptfinal2.run_scraper_with_recovery(excel_file=excel_file, db_params=db_params)
+        finally:
+            elapsed = time.perf_counter() - start
+            scriptfinal2.initialize_driver = original_init
+            for name, func in originals.items():
+                setattr(manager_cls, name, func)
+
+        conn = psycopg2.connect(**db_params)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT asin, best_seller_rank FROM daily_amazon_data")
+                rows = cur.fetchall()
+        finally:
+            conn.close()
+
+        stored = {asin for asin, rank in rows if rank != 'Error'}
+        fetches = storefront.requests.snapshot()['product_fetches']
+        return {
+            'scenario': scenario,
+            'outcome': outcome,
+            'wall_seconds': round(elapsed, 3),
+            'recovery_seconds': round(time.perf_counter() - script.fired_at, 3) if script.fired_at else 0,
+            'fault_fired': script.fired_at is not None,
+            'restarts': RESTARTS_TOTAL.get(scraper='daily') - restarts_before,
+            'product_requests': sum(fetches.values()),
+            'pages_refetched': sum(count - 1 for count in fetches.values() if count > 1),
+            'rows_stored': len(stored),
+            'rows_error': sum(1 for _, rank in rows if rank == 'Error'),
+            'rows_lost': len(set(asins) - stored),
+            'rows_duplicated': len(submitted) - len(set(submitted)),
+            'checkpoint_lookup_seconds': round(sum(timers['get_last_checkpoint'].durations), 4),
+            'checkpoint_lookups': len(timers['get_last_checkpoint'].durations),
+            'scraped_today_lookup_seconds': round(sum(timers['get_scraped_asins_for_today'].durations), 4),
+            'scraped_today_lookups': len(timers['get_scraped_asins_for_today'].durations)
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the cost of recovery paths under injected faults')
+    parser.add_argument('--asins', type=int, default=30)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma separated: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--fault-at', type=int, default=10, help='Product page request at which the fault fires')
+    parser.add_argument('--length', type=int, default=12, help='Requests affected by captcha storms and slow pages')
+    parser.add_argument('--slow-delay', type=float, default=8.0, help='Extra seconds per slow page')
+    parser.add_argument('--product-latency', type=float, default=0.3)
+    parser.add_argument('--offers-latency', type=float, default=0.15)
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    if 'baseline' in scenarios:
+        # Baseline first so the other scenarios can be expressed as time lost
+        scenarios.remove('baseline')
+        scenarios.insert(0, 'baseline')
+
+    asins = [f"B0FAULT{i:03d}" for i in range(args.asins)]
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for scenario in scenarios:
+            logger.info(f"Running scenario {scenario}")
+            results[scenario] = run_scenario(scenario, asins, args, workdir)
+
+    baseline = results.get('baseline')
+    if baseline:
+        for result in results.values():
+            result['seconds_lost'] = round(result['wall_seconds'] - baseline['wall_seconds'], 3)
+
+    report = {
+        'commit': git_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'config': vars(args),
+        'results': results
+    }
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+        logger.info(f"Fault-injection report written to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""
+Local stand-in for the Amazon storefront used by the benchmark suite.
+
+Serves recorded page templates from benchmarks/pages: the home page with the
+delivery location block, /dp/<asin> product pages, the /gp/aod/ajax offers
+fragment and captcha pages, each with configurable latency. Product data is
+derived deterministically from the ASIN so repeated runs are comparable.
+"""
+import hashlib
+import os
+import random
+import threading
+import time
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+CAPTCHA_IMAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'captcha.png')
+
+# Answer accepted by /errors/validateCaptcha; LocalCaptchaSolver returns it
+CAPTCHA_CODE = 'BENCH'
+
+
+def _load_template(name):
+    with open(os.path.join(PAGES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def render(template, **values):
+    """Fill {key} placeholders without touching the braces of inline scripts"""
+    for key, value in values.items():
+        template = template.replace('{' + key + '}', str(value))
+    return template
+
+
+def product_fixture(asin):
+    """Deterministic product values for an ASIN"""
+    seed = int(hashlib.md5(asin.encode('utf-8')).hexdigest(), 16)
+    rng = random.Random(seed)
+    price = rng.randint(500, 9999)
+    min_price = max(100, price - rng.randint(0, 400))
+    return {
+        'asin': asin,
+        'title': f'Benchmark Product {asin}',
+        'rating': f"{rng.randint(30, 50) / 10:.1f}",
+        'reviews': f"{rng.randint(1, 25000):,}",
+        'price_whole': price // 100,
+        'price_fraction': f"{price % 100:02d}",
+        'min_whole': min_price // 100,
+        'min_fraction': f"{min_price % 100:02d}",
+        'offer_count': rng.randint(1, 12),
+        'seller': rng.choice(['Amazon.com', 'Acme Goods', 'Brooklyn Supply Co']),
+        'rank_main': rng.randint(1, 500000),
+        'rank_sub': rng.randint(1, 5000),
+        # Roughly one listing in ten has no BuyBox, BSR or rating
+        'layout': 'product_no_buybox.html' if seed % 10 == 0 else 'product_full.html'
+    }
+
+
+class StorefrontConfig:
+    """Latency and captcha settings; may be changed while the server runs"""
+
+    def __init__(self, product_latency=0.3, offers_latency=0.15, captcha_latency=0.1,
+                 home_latency=0.1, jitter=0.2, captcha_rate=0.0, seed=1234):
+        self.product_latency = product_latency
+        self.offers_latency = offers_latency
+        self.captcha_latency = captcha_latency
+        self.home_latency = home_latency
+        self.jitter = jitter
+        self.captcha_rate = captcha_rate
+        self.rng = random.Random(seed)
+        # Hook used by the fault-injection harness: called with (kind, asin)
+        # before a response is produced and may return a directive dict.
+        self.fault_hook = None
+
+    def delay(self, base):
+        if base <= 0:
+            return
+        spread = base * self.jitter
+        time.sleep(max(0.0, base + self.rng.uniform(-spread, spread)))
+
+
+class RequestLog:
+    """Thread-safe counters of served requests, used to count re-fetches"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_kind = {}
+        self.product_fetches = {}
+
+    def record(self, kind, asin=None):
+        with self._lock:
+            self.by_kind[kind] = self.by_kind.get(kind, 0) + 1
+            if kind == 'product' and asin:
+                self.product_fetches[asin] = self.product_fetches.get(asin, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'by_kind': dict(self.by_kind),
+                'product_fetches': dict(self.product_fetches)
+            }
+
+
+class _StorefrontHandler(BaseHTTPRequestHandler):
+    server_version = 'MockStorefront/1.0'
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type='text/html; charset=utf-8', headers=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _apply_fault(self, kind, asin):
+        """Run the fault hook; returns True when the hook already answered"""
+        hook = self.config.fault_hook
+        if not hook:
+            return False
+        directive = hook(kind, asin) or {}
+        if directive.get('delay'):
+            time.sleep(directive['delay'])
+        if directive.get('status'):
+            self.server.requests.record(f"{kind}_fault")
+            self._send(directive['status'], directive.get('body', ''))
+            return True
+        if directive.get('captcha'):
+            self._serve_captcha()
+            return True
+        return False
+
+    def _serve_captcha(self):
+        self.server.requests.record('captcha')
+        self.config.delay(self.config.captcha_latency)
+        page = render(self.server.templates['captcha.html'], return_to=escape(self.path, quote=True))
+        self._send(200, page)
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        path = parsed.path
+        query = parse_qs(parsed.query)
+
+        if path in ('/', ''):
+            self.server.requests.record('home')
+            if self._apply_fault('home', None):
+                return
+            self.config.delay(self.config.home_latency)
+            self._send(200, self.server.templates['home.html'])
+        elif path.startswith('/dp/'):
+            asin = path[len('/dp/'):].strip('/').split('/')[0]
+            self.server.requests.record('product', asin)
+            if self._apply_fault('product', asin):
+                return
+            if self.config.captcha_rate and self.config.rng.random() < self.config.captcha_rate:
+                self._serve_captcha()
+                return
+            self.config.delay(self.config.product_latency)
+            fixture = product_fixture(asin)
+            self._send(200, render(self.server.templates[fixture['layout']], **fixture))
+        elif path.startswith('/gp/aod/ajax'):
+            asin = query.get('asin', [''])[0]
+            self.server.requests.record('offers', asin)
+            if self._apply_fault('offers', asin):
+                return
+            self.config.delay(self.config.offers_latency)
+            self._send(200, self._offers_fragment(asin))
+        elif path == '/errors/validateCaptcha':
+            self.server.requests.record('captcha_submit')
+            return_to = query.get('amzn-r', ['/'])[0]
+            if query.get('field-keywords', [''])[0].upper() == CAPTCHA_CODE:
+                self._send(302, '', headers={'Location': return_to})
+            else:
+                self._serve_captcha()
+        elif path == '/captcha.png':
+            with open(CAPTCHA_IMAGE, 'rb') as f:
+                self._send(200, f.read(), content_type='image/png')
+        else:
+            self.server.requests.record('not_found')
+            self._send(404, '<html><body>Looking for something? We\'re sorry.</body></html>')
+
+    def _offers_fragment(self, asin):
+        fixture = product_fixture(asin)
+        rng = random.Random(asin)
+        offers = []
+        for _ in range(fixture['offer_count']):
+            cents = fixture['min_whole'] * 100 + int(fixture['min_fraction']) + rng.randint(0, 900)
+            offers.append(render(
+                self.server.templates['offer.html'],
+                price_whole=cents // 100,
+                price_fraction=f"{cents % 100:02d}",
+                ships_from=rng.choice(['Amazon.com', 'Acme Goods']),
+                seller=rng.choice(['Acme Goods', 'Brooklyn Supply Co', 'Deal Depot', 'Amazon.com'])
+            ))
+        # The buy box comes back as the pinned offer, same seller and price as the product page
+        pinned = ''
+        if fixture['layout'] == 'product_full.html':
+            pinned = render(
+                self.server.templates['offer.html'],
+                price_whole=fixture['price_whole'],
+                price_fraction=fixture['price_fraction'],
+                ships_from='Amazon.com',
+                seller=fixture['seller']
+            ).replace('id="aod-offer"', 'id="aod-pinned-offer"', 1)
+        return render(self.server.templates['offers.html'], pinned=pinned, offers='\n'.join(offers))
+
+
+class MockStorefront:
+    """Runs the mock storefront on a background thread"""
+
+    def __init__(self, config=None, host='127.0.0.1', port=0):
+        self.config = config or StorefrontConfig()
+        self.httpd = ThreadingHTTPServer((host, port), _StorefrontHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.config = self.config
+        self.httpd.requests = RequestLog()
+        self.httpd.templates = {
+            name: _load_template(name) for name in os.listdir(PAGES_DIR) if name.endswith('.html')
+        }
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='mock-storefront', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+class LocalCaptchaSolver:
+    """Drop-in for TwoCaptcha that answers the mock storefront's captcha"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def normal(self, image_path):
+        return {'code': CAPTCHA_CODE}
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serve the mock Amazon storefront')
+    parser.add_argument('--port', type=int, default=8808)
+    parser.add_argument('--product-latency', type=float, default=0.3)
+    parser.add_argument('--offers-latency', type=float, default=0.15)
+    parser.add_argument('--captcha-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    storefront = MockStorefront(StorefrontConfig(
+        product_latency=args.product_latency,
+        offers_latency=args.offers_latency,
+        captcha_rate=args.captcha_rate
+    ), port=args.port)
+    print(f"Mock storefront listening on {storefront.base_url}")
+    try:
+        storefront.httpd.serve_forever()
+    except KeyboardInterrupt:
+        storefront.stop()
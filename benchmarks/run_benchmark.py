@@ -0,0 +1,267 @@
+"""
+End-to-end throughput benchmark against the local mock storefront.
+
+Runs AmazonProductScraper.scrape_all_products (scriptfinal2) and the realtime
+scrape_all_asins path (realtimedata) against benchmarks.mock_storefront with a
+disposable Postgres database, and writes a machine-readable JSON report:
+
+    python -m benchmarks.run_benchmark --asins 50 --output bench.json
+    python -m benchmarks.run_benchmark --asins 50 --compare bench.json
+
+Postgres connection settings come from the usual PGHOST/PGPORT/PGUSER/
+PGPASSWORD variables; a throwaway database is created and dropped per run.
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+import psycopg2
+
+from benchmarks.mock_storefront import MockStorefront, StorefrontConfig, LocalCaptchaSolver
+from run_ledger import percentile
+
+logger = logging.getLogger("ScraperBenchmark")
+
+# Metrics where a larger value is an improvement; everything else is lower-is-better
+HIGHER_IS_BETTER = {'asins_per_minute', 'success_rate'}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def server_params():
+    return {
+        'user': os.getenv('PGUSER', 'postgres'),
+        'password': os.getenv('PGPASSWORD', 'Talha'),
+        'host': os.getenv('PGHOST', 'localhost'),
+        'port': os.getenv('PGPORT', '5432')
+    }
+
+
+@contextmanager
+def disposable_database(prefix='amazon_bench'):
+    """Create a throwaway database and drop it afterwards; yields connection params"""
+    params = server_params()
+    dbname = f"{prefix}_{uuid.uuid4().hex[:8]}"
+    admin = psycopg2.connect(dbname='postgres', **params)
+    admin.autocommit = True
+    try:
+        with admin.cursor() as cur:
+            cur.execute(f'CREATE DATABASE "{dbname}"')
+        logger.info(f"Created disposable database {dbname}")
+        yield dict(params, dbname=dbname)
+    finally:
+        try:
+            with admin.cursor() as cur:
+                cur.execute(
+                    "SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = %s AND pid <> pg_backend_pid()",
+                    (dbname,)
+                )
+                cur.execute(f'DROP DATABASE IF EXISTS "{dbname}"')
+            logger.info(f"Dropped disposable database {dbname}")
+        finally:
+            admin.close()
+
+
+def write_asin_workbook(asins, column, directory):
+    path = os.path.join(directory, f"asins_{column}.xlsx")
+    pd.DataFrame({column: asins}).to_excel(path, index=False)
+    return path
+
+
+class Stopwatch:
+    """Wraps a callable and records the duration of each call"""
+
+    def __init__(self, func):
+        self.func = func
+        self.durations = []
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.func(*args, **kwargs)
+        finally:
+            self.durations.append(time.perf_counter() - start)
+
+
+def summarize(name, elapsed, asin_timer, db_timer, succeeded, attempted, storefront):
+    served = storefront.requests.snapshot()
+    return {
+        'path': name,
+        'asins_attempted': attempted,
+        'asins_succeeded': succeeded,
+        'success_rate': round(succeeded / attempted, 4) if attempted else 0,
+        'wall_seconds': round(elapsed, 3),
+        'asins_per_minute': round(attempted * 60.0 / elapsed, 3) if elapsed else 0,
+        'asin_latency_p50': round(percentile(asin_timer.durations, 50) or 0, 3),
+        'asin_latency_p95': round(percentile(asin_timer.durations, 95) or 0, 3),
+        'db_write_seconds': round(sum(db_timer.durations), 4),
+        'db_write_calls': len(db_timer.durations),
+        'db_write_mean': round(sum(db_timer.durations) / len(db_timer.durations), 4) if db_timer.durations else 0,
+        'requests': served['by_kind']
+    }
+
+
+def run_daily(storefront, db_params, asins, workdir, pipeline_depth=0, tabs=1):
+    """Benchmark scriptfinal2.AmazonProductScraper.scrape_all_products"""
+    import scriptfinal2
+
+    scriptfinal2.AMAZON_BASE_URL = storefront.base_url
+    scriptfinal2.TwoCaptcha = LocalCaptchaSolver
+
+    excel_file = write_asin_workbook(asins, 'ASIN', workdir)
+    db_manager = scriptfinal2.SimpleDatabaseManager(**db_params)
+    driver = scriptfinal2.initialize_driver()
+    try:
+        scriptfinal2.login_and_setup(driver)
+        scraper = scriptfinal2.AmazonProductScraper(
+            driver, db_manager, excel_file=excel_file, pipeline_depth=pipeline_depth, tabs=tabs
+        )
+        asin_timer = Stopwatch(scraper.scrape_product)
+        db_timer = Stopwatch(db_manager.save_product_data)
+        scraper.scrape_product = asin_timer
+        db_manager.save_product_data = db_timer
+
+        start = time.perf_counter()
+        scraper.scrape_all_products()
+        elapsed = time.perf_counter() - start
+
+        with db_manager.conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM daily_amazon_data WHERE best_seller_rank IS DISTINCT FROM 'Error'")
+            succeeded = cur.fetchone()[0]
+    finally:
+        driver.quit()
+        db_manager.close()
+    return summarize('daily', elapsed, asin_timer, db_timer, succeeded, len(asins), storefront)
+
+
+def run_realtime(storefront, db_params, asins, workdir):
+    """Benchmark realtimedata.scrape_all_asins"""
+    import realtimedata
+
+    realtimedata.AMAZON_BASE_URL = storefront.base_url
+    realtimedata.TwoCaptcha = LocalCaptchaSolver
+    realtimedata.DB_CONFIG.update(db_params)
+    realtimedata.create_realtimedata_table()
+
+    excel_file = write_asin_workbook(asins, 'asin', workdir)
+    scraper_cls = realtimedata.RealtimeAmazonScraper
+    original_scrape, original_save = scraper_cls.scrape_product, scraper_cls.save_to_database
+    asin_timer = Stopwatch(original_scrape)
+    db_timer = Stopwatch(original_save)
+    scraper_cls.scrape_product = lambda self, asin, **kwargs: asin_timer(self, asin, **kwargs)
+    scraper_cls.save_to_database = lambda self, data: db_timer(self, data)
+    try:
+        start = time.perf_counter()
+        realtimedata.scrape_all_asins(excel_file)
+        elapsed = time.perf_counter() - start
+    finally:
+        scraper_cls.scrape_product, scraper_cls.save_to_database = original_scrape, original_save
+
+    conn = realtimedata.get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM realtimedata")
+            succeeded = cur.fetchone()[0]
+    finally:
+        conn.close()
+    return summarize('realtime', elapsed, asin_timer, db_timer, succeeded, len(asins), storefront)
+
+
+def compare(report, baseline):
+    """Print per-metric deltas of report against a baseline report"""
+    print(f"Comparing {report.get('commit')} against baseline {baseline.get('commit')}")
+    for path, result in report['results'].items():
+        base = baseline.get('results', {}).get(path)
+        if not base:
+            continue
+        print(f"[{path}]")
+        for metric in ('asins_per_minute', 'asin_latency_p50', 'asin_latency_p95', 'db_write_seconds', 'success_rate'):
+            new, old = result.get(metric), base.get(metric)
+            if new is None or not old:
+                continue
+            change = (new - old) / old * 100
+            better = change > 0 if metric in HIGHER_IS_BETTER else change < 0
+            marker = '+' if better else '-' if change else '='
+            print(f"  {marker} {metric:<18} {old:>10} -> {new:<10} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the scrapers against a local mock storefront')
+    parser.add_argument('--asins', type=int, default=30, help='Number of synthetic ASINs to scrape')
+    parser.add_argument('--paths', default='daily,realtime', help='Comma separated: daily, realtime')
+    parser.add_argument('--product-latency', type=float, default=0.3, help='Seconds per product page')
+    parser.add_argument('--offers-latency', type=float, default=0.15, help='Seconds per offers fragment')
+    parser.add_argument('--captcha-rate', type=float, default=0.0, help='Fraction of product pages served as captcha')
+    parser.add_argument('--pipeline-depth', type=int, default=0,
+                        help='Pages the daily path prefetches in background tabs')
+    parser.add_argument('--tabs', type=int, default=1, help='Product tabs the daily path keeps in flight')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    parser.add_argument('--compare', help='Baseline JSON report to compare against')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    asins = [f"B0BENCH{i:03d}" for i in range(args.asins)]
+    config = StorefrontConfig(
+        product_latency=args.product_latency,
+        offers_latency=args.offers_latency,
+        captcha_rate=args.captcha_rate
+    )
+    report = {
+        'commit': git_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'config': {
+            'asins': args.asins,
+            'product_latency': args.product_latency,
+            'offers_latency': args.offers_latency,
+            'captcha_rate': args.captcha_rate,
+            'pipeline_depth': args.pipeline_depth,
+            'tabs': args.tabs
+        },
+        'results': {}
+    }
+
+    runners = {'daily': run_daily, 'realtime': run_realtime}
+    runner_options = {'daily': {'pipeline_depth': args.pipeline_depth, 'tabs': args.tabs}}
+    with tempfile.TemporaryDirectory() as workdir:
+        for path in [p.strip() for p in args.paths.split(',') if p.strip()]:
+            if path not in runners:
+                parser.error(f"Unknown path: {path}")
+            # Fresh storefront and database per path so request counts and rows are isolated
+            with MockStorefront(config) as storefront, disposable_database() as db_params:
+                logger.info(f"Running {path} benchmark with {len(asins)} ASINs against {storefront.base_url}")
+                report['results'][path] = runners[path](
+                    storefront, db_params, asins, workdir, **runner_options.get(path, {})
+                )
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+        logger.info(f"Benchmark report written to {args.output}")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
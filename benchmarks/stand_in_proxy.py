@@ -0,0 +1,119 @@
+"""
+Local stand-in HTTP proxies for exercising proxy_pool without real proxies.
+
+Each StandInProxy forwards plain-HTTP GET requests (absolute-URI form, as sent
+to a proxy) and can misbehave on demand: add latency, answer with errors, or
+replace responses with a captcha page, so pool scoring, resting and eviction
+can be observed against the mock storefront:
+
+    python -m benchmarks.stand_in_proxy --ports 8901,8902,8903 --modes ok,slow,captcha
+    SCRAPER_PROXIES=127.0.0.1:8901,127.0.0.1:8902,127.0.0.1:8903 \\
+        python proxy_pool.py check --url http://127.0.0.1:8808/dp/B0TEST
+"""
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MODES = ('ok', 'slow', 'error', 'captcha')
+
+CAPTCHA_BODY = (
+    b"<html><body><form action='/errors/validateCaptcha'>"
+    b"Type the characters you see in this image:</form></body></html>"
+)
+
+# Never route the forwarded request through another proxy
+_direct = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+
+class _ProxyHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body, content_type='text/html; charset=utf-8'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        mode = server.mode
+        if mode == 'error':
+            self._reply(502, b'Bad Gateway')
+            return
+        if mode == 'captcha':
+            self._reply(200, CAPTCHA_BODY)
+            return
+        if mode == 'slow':
+            time.sleep(server.slow_delay)
+        try:
+            with _direct.open(self.path, timeout=30) as upstream:
+                body = upstream.read()
+                self._reply(upstream.status, body, upstream.headers.get('Content-Type', 'text/html'))
+        except urllib.error.HTTPError as e:
+            self._reply(e.code, e.read())
+        except Exception as e:
+            self._reply(502, str(e).encode('utf-8'))
+
+
+class StandInProxy:
+    def __init__(self, mode='ok', port=0, slow_delay=3.0, host='127.0.0.1'):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode {mode}, expected one of {MODES}")
+        self.httpd = ThreadingHTTPServer((host, port), _ProxyHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.mode = mode
+        self.httpd.slow_delay = slow_delay
+        self.httpd.requests = 0
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    def set_mode(self, mode):
+        self.httpd.mode = mode
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name='stand-in-proxy', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run local stand-in proxies')
+    parser.add_argument('--ports', default='8901,8902,8903')
+    parser.add_argument('--modes', default='ok,slow,captcha', help='One mode per port: ' + ', '.join(MODES))
+    parser.add_argument('--slow-delay', type=float, default=3.0)
+    args = parser.parse_args()
+
+    ports = [int(p) for p in args.ports.split(',')]
+    modes = args.modes.split(',')
+    proxies = [StandInProxy(mode, port, args.slow_delay).start() for port, mode in zip(ports, modes)]
+    for proxy in proxies:
+        print(f"{proxy.httpd.mode:<8} {proxy.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for proxy in proxies:
+            proxy.stop()
@@ -0,0 +1,205 @@
+"""
+Fleet-wide block detection and circuit breaker.
+
+Every scraper worker in the process (both jobs and every shard thread) reports
+the outcome of each product page load to the shared BREAKER. When block
+signals (captcha pages, 503 "sorry" pages, pages with no product markup)
+spike across the recent window, the breaker throttles or pauses all workers
+instead of letting each one keep hammering Amazon and burning solver credits:
+
+    closed     normal operation
+    throttled  block rate elevated, every request waits an extra delay
+    open       blocked, all workers pause for a cooldown that doubles per trip
+    half_open  cooldown over, a single probe request decides whether to resume
+
+Each state change is logged and counted in scraper_breaker_transitions_total.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from retry_queue import CAPTCHA_MARKER, NOT_FOUND_MARKERS, SORRY_MARKERS, UNAVAILABLE_MARKERS
+from scraper_metrics import REGISTRY, Counter, Gauge
+
+logger = logging.getLogger("CircuitBreaker")
+
+CLOSED, THROTTLED, OPEN, HALF_OPEN = 'closed', 'throttled', 'open', 'half_open'
+STATE_VALUES = {CLOSED: 0, THROTTLED: 1, HALF_OPEN: 2, OPEN: 3}
+BLOCK_OUTCOMES = ('captcha', 'sorry', 'empty')
+
+BREAKER_STATE = REGISTRY.register(Gauge(
+    'scraper_breaker_state', 'Circuit breaker state (0 closed, 1 throttled, 2 half-open, 3 open)'
+))
+BREAKER_TRANSITIONS_TOTAL = REGISTRY.register(Counter(
+    'scraper_breaker_transitions_total', 'Circuit breaker state changes', ['from_state', 'to_state']
+))
+BREAKER_PAGES_TOTAL = REGISTRY.register(Counter(
+    'scraper_breaker_pages_total', 'Page outcomes seen by the circuit breaker', ['scraper', 'outcome']
+))
+BREAKER_PAUSED_SECONDS = REGISTRY.register(Counter(
+    'scraper_breaker_paused_seconds_total', 'Seconds workers spent held by the circuit breaker', ['scraper']
+))
+
+
+def page_outcome(page_source, has_product_markup):
+    """Classify a loaded page as ok or one of the block signals"""
+    page_source = page_source or ''
+    if CAPTCHA_MARKER in page_source:
+        return 'captcha'
+    if any(marker in page_source for marker in SORRY_MARKERS):
+        return 'sorry'
+    if has_product_markup or any(marker in page_source for marker in NOT_FOUND_MARKERS + UNAVAILABLE_MARKERS):
+        return 'ok'
+    return 'empty'
+
+
+class CircuitBreaker:
+    def __init__(self, window=40, window_seconds=600, min_samples=10, throttle_rate=0.2, open_rate=0.4,
+                 sorry_streak=3, throttle_delay=8.0, cooldown=120.0, max_cooldown=1800.0, probe_timeout=120.0):
+        """
+        :param window: Most recent page outcomes considered
+        :param window_seconds: Outcomes older than this are ignored
+        :param min_samples: Outcomes needed before the block rate is acted on
+        :param throttle_rate: Block rate at which all workers are slowed down
+        :param open_rate: Block rate at which all workers are paused
+        :param sorry_streak: Consecutive "sorry" pages that open the breaker regardless of rate
+        :param throttle_delay: Extra seconds before each request while throttled
+        :param cooldown: First pause length; doubles on each trip without a clean recovery
+        :param max_cooldown: Cap on the pause length
+        :param probe_timeout: Seconds before an unanswered probe is handed to another worker
+        """
+        self.window = window
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.throttle_rate = throttle_rate
+        self.open_rate = open_rate
+        self.sorry_streak = sorry_streak
+        self.throttle_delay = throttle_delay
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.probe_timeout = probe_timeout
+
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._sorry_run = 0
+        self._cooldown = cooldown
+        self._open_until = 0.0
+        self._probe_started = None
+        self._cond = threading.Condition()
+        BREAKER_STATE.set(STATE_VALUES[CLOSED])
+
+    def _transition(self, state, reason):
+        previous, self.state = self.state, state
+        BREAKER_STATE.set(STATE_VALUES[state])
+        BREAKER_TRANSITIONS_TOTAL.inc(from_state=previous, to_state=state)
+        log = logger.warning if state in (OPEN, THROTTLED) else logger.info
+        log(f"Circuit breaker {previous} -> {state}: {reason}")
+        self._cond.notify_all()
+
+    def _trip(self, reason):
+        self._open_until = time.monotonic() + self._cooldown
+        self._outcomes.clear()
+        self._sorry_run = 0
+        self._probe_started = None
+        self._transition(OPEN, f"{reason}; pausing all workers for {self._cooldown:.0f}s")
+        self._cooldown = min(self.max_cooldown, self._cooldown * 2)
+
+    def _block_rate(self):
+        cutoff = time.monotonic() - self.window_seconds
+        while self._outcomes and self._outcomes[0][0] < cutoff:
+            self._outcomes.popleft()
+        if len(self._outcomes) < self.min_samples:
+            return None, {}
+        counts = {}
+        for _, outcome in self._outcomes:
+            counts[outcome] = counts.get(outcome, 0) + 1
+        blocked = sum(counts.get(outcome, 0) for outcome in BLOCK_OUTCOMES)
+        return blocked / len(self._outcomes), counts
+
+    def before_request(self, scraper):
+        """
+        Called by a worker before each page load. Blocks while the breaker is
+        open or another worker is probing, sleeps the throttle delay while
+        throttled, and returns True if this request is the recovery probe.
+        """
+        waited_from = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self.state == OPEN:
+                    if now >= self._open_until:
+                        self._transition(HALF_OPEN, "cooldown over, probing")
+                        continue
+                    self._cond.wait(self._open_until - now)
+                    continue
+                if self.state == HALF_OPEN:
+                    if self._probe_started is None or now - self._probe_started > self.probe_timeout:
+                        self._probe_started = now
+                        is_probe = True
+                        break
+                    self._cond.wait(min(5.0, self.probe_timeout))
+                    continue
+                is_probe = False
+                delay = self.throttle_delay if self.state == THROTTLED else 0.0
+                break
+        if is_probe:
+            logger.info(f"Circuit breaker probe request from {scraper} worker")
+            delay = 0.0
+        if delay:
+            time.sleep(delay)
+        held = time.monotonic() - waited_from
+        if held >= 1.0:
+            BREAKER_PAUSED_SECONDS.inc(held, scraper=scraper)
+        return is_probe
+
+    def record(self, scraper, outcome):
+        """Report a page outcome: ok, captcha, sorry, empty, or error (a failed load, not a block signal)"""
+        BREAKER_PAGES_TOTAL.inc(scraper=scraper, outcome=outcome)
+        with self._cond:
+            if self.state == HALF_OPEN:
+                if outcome == 'ok':
+                    self._cooldown = max(self.base_cooldown, self._cooldown / 2)
+                    self._probe_started = None
+                    self._transition(CLOSED, "probe succeeded, resuming")
+                elif outcome in BLOCK_OUTCOMES:
+                    self._trip(f"probe hit a {outcome} page")
+                else:
+                    # Inconclusive; let the next worker probe
+                    self._probe_started = None
+                    self._cond.notify_all()
+                return
+            if self.state == OPEN or outcome == 'error':
+                return
+
+            self._outcomes.append((time.monotonic(), outcome))
+            self._sorry_run = self._sorry_run + 1 if outcome == 'sorry' else 0
+            if self._sorry_run >= self.sorry_streak:
+                self._trip(f"{self._sorry_run} consecutive 503 sorry pages")
+                return
+
+            rate, counts = self._block_rate()
+            if rate is None:
+                return
+            summary = ', '.join(f"{k} {v}" for k, v in sorted(counts.items()))
+            if rate >= self.open_rate:
+                self._trip(f"block rate {rate:.0%} over last {len(self._outcomes)} pages ({summary})")
+            elif rate >= self.throttle_rate and self.state == CLOSED:
+                self._transition(THROTTLED, f"block rate {rate:.0%} over last {len(self._outcomes)} pages ({summary})")
+            elif rate < self.throttle_rate / 2 and self.state == THROTTLED:
+                self._transition(CLOSED, f"block rate back to {rate:.0%}")
+
+    def snapshot(self):
+        with self._cond:
+            rate, counts = self._block_rate()
+            return {
+                'state': self.state,
+                'block_rate': rate,
+                'outcomes': counts,
+                'next_cooldown': self._cooldown,
+                'open_for': max(0.0, self._open_until - time.monotonic()) if self.state == OPEN else 0.0
+            }
+
+
+# Shared by every worker in the process
+BREAKER = CircuitBreaker()
@@ -0,0 +1,220 @@
+"""
+Post-run daily deltas ("movers") for the daily scrape.
+
+Once a daily run completes, today's and the previous scan of the shard are
+each read from daily_amazon_data in a single COPY. The day-over-day deltas are
+computed as whole columns with pandas/NumPy, with no per-ASIN queries:
+
+    price_change, price_change_pct      price against the previous scan
+    offers_change                       offer count against the previous scan
+    min_price_spread, min_price_spread_pct
+                                        price minus the lowest offer price
+    bsr, bsr_change, bsr_change_pct     main Best Sellers Rank (first '#n'), negative = climbed
+
+The rows are written to daily_movers in one bulk insert, replacing any
+earlier result for the same day and shard. ASINs with no previous scan get
+NULL deltas.
+
+    python daily_movers.py                          # today, default shard
+    python daily_movers.py --date 2024-05-01 --marketplace UK --zip-code "SW1A 1AA"
+"""
+import argparse
+import io
+import logging
+import sys
+import time
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import psycopg2
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger("DailyMovers")
+
+SNAPSHOT_COLUMNS = ['asin', 'price', 'minimum_price', 'offers', 'best_seller_rank']
+COUNT_COLUMNS = ['offers', 'prev_offers', 'offers_change', 'bsr', 'prev_bsr', 'bsr_change']
+MOVER_COLUMNS = [
+    'asin', 'price', 'prev_price', 'price_change', 'price_change_pct', 'offers', 'prev_offers', 'offers_change',
+    'minimum_price', 'min_price_spread', 'min_price_spread_pct', 'bsr', 'prev_bsr', 'bsr_change', 'bsr_change_pct'
+]
+
+
+def create_movers_table(conn):
+    """Create the daily movers table if it does not exist"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS daily_movers (
+                scan_date DATE NOT NULL,
+                prev_scan_date DATE,
+                asin VARCHAR(10) NOT NULL,
+                marketplace VARCHAR(5) NOT NULL,
+                zip_code VARCHAR(12) NOT NULL,
+                price DECIMAL(10,2),
+                prev_price DECIMAL(10,2),
+                price_change DECIMAL(10,2),
+                price_change_pct DECIMAL(10,2),
+                offers INTEGER,
+                prev_offers INTEGER,
+                offers_change INTEGER,
+                minimum_price DECIMAL(10,2),
+                min_price_spread DECIMAL(10,2),
+                min_price_spread_pct DECIMAL(10,2),
+                bsr INTEGER,
+                prev_bsr INTEGER,
+                bsr_change INTEGER,
+                bsr_change_pct DECIMAL(10,2),
+                PRIMARY KEY (scan_date, asin, marketplace, zip_code)
+            )
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_daily_movers_price_change
+            ON daily_movers (scan_date, marketplace, zip_code, price_change_pct)
+        """)
+    conn.commit()
+
+
+def copy_frame(conn, query, params, columns):
+    """Result of query as a DataFrame, streamed with a single COPY instead of fetched row by row"""
+    with conn.cursor() as cur:
+        query = cur.mogrify(query, params).decode()
+        buffer = io.StringIO()
+        cur.copy_expert(f"COPY ({query}) TO STDOUT WITH CSV HEADER", buffer)
+    buffer.seek(0)
+    return pd.read_csv(buffer, dtype={'asin': str, 'best_seller_rank': str}).reindex(columns=columns)
+
+
+def load_snapshot(conn, scan_date, marketplace, zip_code):
+    """One day of a shard's daily_amazon_data as a DataFrame"""
+    return copy_frame(conn, """
+        SELECT asin, price, minimum_price, offers, best_seller_rank
+        FROM daily_amazon_data
+        WHERE scan_date = %s AND marketplace = %s AND zip_code = %s
+    """, (scan_date, marketplace, zip_code), SNAPSHOT_COLUMNS)
+
+
+def previous_scan_date(conn, scan_date, marketplace, zip_code):
+    """The latest scan of the shard before scan_date, or None"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT MAX(scan_date) FROM daily_amazon_data
+            WHERE scan_date < %s AND marketplace = %s AND zip_code = %s
+        """, (scan_date, marketplace, zip_code))
+        return cur.fetchone()[0]
+
+
+def main_rank(ranks):
+    """Numeric main Best Sellers Rank ('#1,234 in ..., #5 in ...' -> 1234); NaN for 'Not ranked' or 'Error'"""
+    digits = ranks.astype('string').str.extract(r'^\s*#\s*([\d,]+)', expand=False)
+    return pd.to_numeric(digits.str.replace(',', '', regex=False), errors='coerce')
+
+
+def _pct(change, base):
+    base = base.to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(base > 0, change.to_numpy(dtype=float) / base * 100.0, np.nan)
+
+
+def compute_deltas(today, previous):
+    """Day-over-day deltas for every ASIN in today's snapshot, computed column-wise"""
+    today = today.drop_duplicates('asin').copy()
+    previous = previous.drop_duplicates('asin')
+    today['bsr'] = main_rank(today['best_seller_rank'])
+    prev = pd.DataFrame({
+        'asin': previous['asin'],
+        'prev_price': pd.to_numeric(previous['price'], errors='coerce'),
+        'prev_offers': pd.to_numeric(previous['offers'], errors='coerce'),
+        'prev_bsr': main_rank(previous['best_seller_rank']),
+    })
+    movers = today.merge(prev, on='asin', how='left')
+    for column in ('price', 'minimum_price', 'offers'):
+        movers[column] = pd.to_numeric(movers[column], errors='coerce')
+
+    movers['price_change'] = movers['price'] - movers['prev_price']
+    movers['price_change_pct'] = _pct(movers['price_change'], movers['prev_price'])
+    movers['offers_change'] = movers['offers'] - movers['prev_offers']
+    movers['min_price_spread'] = movers['price'] - movers['minimum_price']
+    movers['min_price_spread_pct'] = _pct(movers['min_price_spread'], movers['price'])
+    movers['bsr_change'] = movers['bsr'] - movers['prev_bsr']
+    movers['bsr_change_pct'] = _pct(movers['bsr_change'], movers['prev_bsr'])
+
+    rounded = ['price_change', 'price_change_pct', 'min_price_spread', 'min_price_spread_pct', 'bsr_change_pct']
+    movers[rounded] = movers[rounded].round(2)
+    return movers[MOVER_COLUMNS]
+
+
+def _rows(movers, scan_date, prev_date, marketplace, zip_code):
+    """DataFrame rows as tuples for execute_values, with NaN as NULL and counts as int"""
+    out = movers.copy()
+    out[COUNT_COLUMNS] = out[COUNT_COLUMNS].round().astype('Int64')
+    out = out.astype(object).where(out.notna(), None)
+    return [(scan_date, prev_date, row[0], marketplace, zip_code, *row[1:])
+            for row in out.itertuples(index=False, name=None)]
+
+
+def write_movers(conn, movers, scan_date, prev_date, marketplace, zip_code):
+    """Replace the day's movers for the shard with one bulk insert"""
+    rows = _rows(movers, scan_date, prev_date, marketplace, zip_code)
+    with conn.cursor() as cur:
+        cur.execute(
+            "DELETE FROM daily_movers WHERE scan_date = %s AND marketplace = %s AND zip_code = %s",
+            (scan_date, marketplace, zip_code)
+        )
+        if rows:
+            execute_values(cur, f"""
+                INSERT INTO daily_movers
+                (scan_date, prev_scan_date, asin, marketplace, zip_code, {', '.join(MOVER_COLUMNS[1:])})
+                VALUES %s
+            """, rows, page_size=len(rows))
+    conn.commit()
+    return len(rows)
+
+
+def build_daily_movers(conn, marketplace='US', zip_code='11229', scan_date=None):
+    """Compute and store the movers of one day and shard; returns the number of rows written"""
+    scan_date = scan_date or date.today()
+    started = time.perf_counter()
+    create_movers_table(conn)
+    today = load_snapshot(conn, scan_date, marketplace, zip_code)
+    if today.empty:
+        logger.info(f"No daily data for {marketplace}/{zip_code} on {scan_date}, no movers computed")
+        return 0
+    prev_date = previous_scan_date(conn, scan_date, marketplace, zip_code)
+    previous = (load_snapshot(conn, prev_date, marketplace, zip_code) if prev_date
+                else pd.DataFrame(columns=SNAPSHOT_COLUMNS))
+    loaded = time.perf_counter()
+    movers = compute_deltas(today, previous)
+    computed = time.perf_counter()
+    written = write_movers(conn, movers, scan_date, prev_date, marketplace, zip_code)
+    logger.info(
+        f"Daily movers for {marketplace}/{zip_code} {scan_date} vs {prev_date or 'no previous scan'}: "
+        f"{written} ASINs, {int((movers['price_change'].fillna(0) != 0).sum())} price changes, "
+        f"{int((movers['bsr_change'].fillna(0) != 0).sum())} rank moves "
+        f"(load {loaded - started:.2f}s, compute {computed - loaded:.2f}s, write {time.perf_counter() - computed:.2f}s)"
+    )
+    return written
+
+
+def main():
+    from history_export import DAILY_DB
+
+    parser = argparse.ArgumentParser(description='Compute day-over-day movers from daily_amazon_data')
+    parser.add_argument('--date', type=lambda s: datetime.strptime(s, '%Y-%m-%d').date(), default=None,
+                        help='Scan date to compute (default today)')
+    parser.add_argument('--marketplace', default='US')
+    parser.add_argument('--zip-code', default='11229')
+    parser.add_argument('--dsn', default=None, help='libpq DSN overriding the daily database')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    conn = psycopg2.connect(args.dsn) if args.dsn else psycopg2.connect(**DAILY_DB)
+    try:
+        build_daily_movers(conn, args.marketplace, args.zip_code, args.date)
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
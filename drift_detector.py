@@ -0,0 +1,281 @@
+"""
+Selector drift detection on scraped product records.
+
+When Amazon changes the product page layout, pages still load and pass the
+product markup check, but the fields come back empty: prices are None, the
+rank is 'Not ranked' and offers fall back to '1'. Every fallback also burns
+its wait. DriftDetector watches the finished records rather than individual
+selectors. For each field it keeps the share of recent pages where the field
+was missing or held its fallback value, and compares it with a slowly
+learned baseline that is persisted between runs.
+
+When a field's default rate rises `jump` above its baseline, or reaches the
+field's absolute ceiling (so a layout already broken when the baseline was
+first learned is still caught):
+
+    - the page that tripped, and the next pages where a drifting field
+      defaulted, are saved to snapshot_dir with their records, along with a
+      summary.json of the rates and the recent ASINs with defaulted fields,
+      for whoever updates FIELD_SELECTORS;
+    - an alert is logged, counted in scraper_drift_alerts_total and, when
+      SCRAPER_ALERT_WEBHOOK is set, POSTed there as JSON;
+    - with action 'stop', stop_requested is set and the run ends cleanly
+      after the current ASIN. With 'throttle', every request waits
+      throttle_delay until the rates recover.
+
+    drift = DriftDetector('daily', DAILY_FIELD_DEFAULTS, ceilings=DAILY_FIELD_CEILINGS, shard=shard.name)
+    drift.before_request()              # in pace(); sleeps while throttled
+    drift.observe(asin, record, lambda: driver.page_source)
+    if drift.stop_requested: ...
+"""
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import deque
+from datetime import datetime
+
+from scraper_metrics import REGISTRY, Counter, Gauge
+
+logger = logging.getLogger("DriftDetector")
+
+# Fallback values the scrapers store when a field's selectors all missed
+DAILY_FIELD_DEFAULTS = {
+    'price': None,
+    'best_seller_rank': 'Not ranked',
+    'offers': '1',
+    'minimum_price': None,
+}
+REALTIME_FIELD_DEFAULTS = {
+    'title': None,
+    'price': None,
+    'rating': None,
+    'reviews_count': None,
+    'best_seller_rank': 'Not ranked',
+    'buybox_offer': None,
+}
+
+# Default rates that are drift whatever the baseline says; only fields nearly every product page has
+DAILY_FIELD_CEILINGS = {
+    'price': 0.9,
+}
+REALTIME_FIELD_CEILINGS = {
+    'title': 0.5,
+    'price': 0.9,
+}
+
+DRIFT_DEFAULT_RATE = REGISTRY.register(Gauge(
+    'scraper_field_default_rate', 'Share of recent records where the field was missing or a fallback value',
+    ['scraper', 'field']
+))
+DRIFT_ALERTS_TOTAL = REGISTRY.register(Counter(
+    'scraper_drift_alerts_total', 'Selector drift alerts raised per field', ['scraper', 'field']
+))
+DRIFT_SNAPSHOTS_TOTAL = REGISTRY.register(Counter(
+    'scraper_drift_snapshots_total', 'Product pages saved for selector drift diagnosis', ['scraper']
+))
+
+
+class DriftDetector:
+    def __init__(self, scraper, fields, window=100, min_samples=40, jump=0.35, action=None,
+                 throttle_delay=30.0, snapshot_dir=None, snapshots=5, state_file=None, ceilings=None, shard=None):
+        """
+        :param scraper: Label used in logs, metrics and file names ('daily' or 'realtime')
+        :param fields: {field: fallback value}; None, '' and [] always count as missing
+        :param window: Recent records the default rates are computed over
+        :param min_samples: Records needed before drift is considered
+        :param jump: Absolute rise of a default rate over its baseline that counts as drift
+        :param action: 'stop', 'throttle' or 'alert' (default SCRAPER_DRIFT_ACTION, else 'stop')
+        :param throttle_delay: Extra seconds before each request while throttled
+        :param snapshot_dir: Directory for page snapshots (default SCRAPER_DRIFT_DIR, else drift_snapshots)
+        :param snapshots: Pages saved per drift incident
+        :param state_file: JSON file the baselines are persisted to (default drift_baseline_<shard>.json)
+        :param ceilings: {field: default rate}; reaching it counts as drift regardless of the baseline
+        :param shard: Shard name; each shard learns its own baselines
+        """
+        self.scraper = scraper
+        self.fields = fields
+        self.window = window
+        self.min_samples = min_samples
+        self.jump = jump
+        self.action = action or os.getenv('SCRAPER_DRIFT_ACTION', 'stop')
+        if self.action not in ('stop', 'throttle', 'alert'):
+            raise ValueError(f"Unknown drift action {self.action}, expected stop, throttle or alert")
+        self.throttle_delay = throttle_delay
+        self.snapshot_dir = snapshot_dir or os.getenv('SCRAPER_DRIFT_DIR', 'drift_snapshots')
+        self.snapshots = snapshots
+        self.ceilings = ceilings or {}
+        self.state_file = state_file or f'drift_baseline_{shard or scraper}.json'
+        self.webhook = os.getenv('SCRAPER_ALERT_WEBHOOK')
+
+        self._lock = threading.Lock()
+        self._recent = {field: deque(maxlen=window) for field in fields}
+        self._defaulted_asins = deque(maxlen=20)
+        self._baseline = {}
+        self._drifting = set()
+        self._incident_dir = None
+        self._snapshots_left = 0
+        self._observed = 0
+        self.stop_requested = False
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file) as f:
+                self._baseline = json.load(f).get('baseline', {})
+        except Exception as e:
+            logger.warning(f"Could not load drift baselines from {self.state_file}: {str(e)}")
+
+    def save(self):
+        try:
+            with self._lock:
+                payload = {'baseline': dict(self._baseline)}
+            # Written aside and swapped in, so a crash mid-write cannot leave a truncated file
+            fd, tmp_path = tempfile.mkstemp(
+                prefix=os.path.basename(self.state_file) + '.', suffix='.tmp',
+                dir=os.path.dirname(self.state_file) or '.'
+            )
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(payload, f, indent=2)
+                os.replace(tmp_path, self.state_file)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        except Exception as e:
+            logger.warning(f"Could not save drift baselines to {self.state_file}: {str(e)}")
+
+    @property
+    def throttling(self):
+        return self.action == 'throttle' and bool(self._drifting)
+
+    def before_request(self):
+        """Called before each page load; sleeps the throttle delay while drift is throttling the run"""
+        if self.throttling:
+            time.sleep(self.throttle_delay)
+
+    def _defaulted(self, field, value):
+        return value is None or value == '' or value == [] or value == self.fields[field]
+
+    def observe(self, asin, record, page_source=None):
+        """
+        Record one scraped product.
+
+        :param record: The scraped field values
+        :param page_source: Optional callable returning the page HTML, only called for a snapshot
+        """
+        tripped, recovered, rates = [], [], {}
+        with self._lock:
+            self._observed += 1
+            missing = [field for field in self.fields if self._defaulted(field, record.get(field))]
+            if missing:
+                self._defaulted_asins.append({'asin': asin, 'fields': missing})
+            for field in self.fields:
+                recent = self._recent[field]
+                recent.append(1 if field in missing else 0)
+                if len(recent) < self.min_samples:
+                    continue
+                rate = sum(recent) / len(recent)
+                rates[field] = rate
+                over_ceiling = field in self.ceilings and rate >= self.ceilings[field]
+                baseline = self._baseline.setdefault(field, rate)
+                if field in self._drifting:
+                    if rate - baseline < self.jump / 2 and not over_ceiling:
+                        self._drifting.discard(field)
+                        recovered.append(field)
+                elif rate - baseline >= self.jump or over_ceiling:
+                    self._drifting.add(field)
+                    tripped.append((field, baseline, rate))
+                else:
+                    # Slow-moving baseline so a layout change is not absorbed before it is noticed
+                    self._baseline[field] = baseline * 0.995 + rate * 0.005
+            summary = None
+            if tripped and self._snapshots_left <= 0:
+                stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+                self._incident_dir = os.path.join(self.snapshot_dir, f"{self.scraper}-{stamp}")
+                self._snapshots_left = self.snapshots
+                summary = {
+                    'scraper': self.scraper,
+                    'rates': rates,
+                    'baseline': dict(self._baseline),
+                    'drifting': sorted(self._drifting),
+                    'recent_defaulted': list(self._defaulted_asins)
+                }
+            snapshot = self._snapshots_left > 0 and any(
+                self._defaulted(field, record.get(field)) for field in self._drifting
+            )
+            if snapshot:
+                self._snapshots_left -= 1
+            save_baseline = self._observed % self.window == 0
+
+        for field, rate in rates.items():
+            DRIFT_DEFAULT_RATE.set(round(rate, 3), scraper=self.scraper, field=field)
+        if summary:
+            try:
+                self._write("summary.json", summary)
+            except Exception as e:
+                logger.warning(f"Could not save drift summary: {str(e)}")
+        if snapshot:
+            self._snapshot(asin, record, page_source)
+        if tripped:
+            self._alert(tripped)
+        for field in recovered:
+            logger.info(f"[{self.scraper}] default rate for '{field}' back to {rates[field]:.0%}, drift cleared")
+        if save_baseline:
+            self.save()
+
+    def _write(self, name, payload):
+        os.makedirs(self._incident_dir, exist_ok=True)
+        with open(os.path.join(self._incident_dir, name), 'w') as f:
+            json.dump(payload, f, indent=2, default=str)
+
+    def _snapshot(self, asin, record, page_source):
+        try:
+            name = re.sub(r'[^A-Za-z0-9_-]', '_', asin)
+            self._write(f"{name}.json", record)
+            if page_source:
+                with open(os.path.join(self._incident_dir, f"{name}.html"), 'w', encoding='utf-8') as f:
+                    f.write(page_source())
+            DRIFT_SNAPSHOTS_TOTAL.inc(scraper=self.scraper)
+        except Exception as e:
+            logger.warning(f"Could not save drift snapshot for {asin}: {str(e)}")
+
+    def _alert(self, tripped):
+        summary = ', '.join(f"'{field}' {baseline:.0%} -> {rate:.0%}" for field, baseline, rate in tripped)
+        consequence = {
+            'stop': 'stopping the run',
+            'throttle': f'throttling requests by {self.throttle_delay:.0f}s',
+            'alert': 'continuing'
+        }[self.action]
+        logger.critical(
+            f"[{self.scraper}] selector drift, default rates jumped: {summary} - possible Amazon layout change, "
+            f"{consequence}; sample pages in {self._incident_dir}"
+        )
+        for field, _, _ in tripped:
+            DRIFT_ALERTS_TOTAL.inc(scraper=self.scraper, field=field)
+        if self.action == 'stop':
+            self.stop_requested = True
+        self.save()
+        if self.webhook:
+            payload = {
+                'scraper': self.scraper,
+                'fields': {field: {'baseline': round(baseline, 3), 'rate': round(rate, 3)}
+                           for field, baseline, rate in tripped},
+                'action': self.action,
+                'snapshots': self._incident_dir,
+                'at': datetime.now().isoformat(timespec='seconds')
+            }
+            try:
+                request = urllib.request.Request(
+                    self.webhook, data=json.dumps(payload).encode('utf-8'),
+                    headers={'Content-Type': 'application/json'}
+                )
+                urllib.request.urlopen(request, timeout=10).close()
+            except Exception as e:
+                logger.warning(f"Could not deliver drift alert to webhook: {str(e)}")
@@ -0,0 +1,209 @@
+"""
+Driver memory watchdog.
+
+A long run keeps one Chrome alive for thousands of page loads and its memory
+keeps growing until pages slow down or the browser crashes. DriverWatchdog
+samples the resident memory of the browser and its renderer processes every
+few pages and asks for the driver to be recycled, at the next ASIN boundary,
+once it has served max_pages pages or crossed the memory ceiling.
+
+psutil is used when installed; otherwise the process tree is read from /proc.
+Samples are exported as gauges and, when SCRAPER_MEMORY_LOG is set (or a
+log_file is given), appended as JSON lines so memory can be plotted over a run.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from scraper_metrics import REGISTRY, Counter, Gauge
+
+logger = logging.getLogger("DriverWatchdog")
+
+DRIVER_RSS_BYTES = REGISTRY.register(Gauge(
+    'scraper_driver_rss_bytes', 'Resident memory of the browser process tree', ['scraper', 'kind']
+))
+DRIVER_PAGES = REGISTRY.register(Gauge(
+    'scraper_driver_pages', 'Pages served by the current driver', ['scraper']
+))
+DRIVER_RECYCLES_TOTAL = REGISTRY.register(Counter(
+    'scraper_driver_recycles_total', 'Drivers recycled proactively by the watchdog', ['scraper', 'reason']
+))
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _proc_children():
+    """{parent pid: [child pids]} read from /proc"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces, so split after its closing parenthesis
+        ppid = int(stat.rsplit(')', 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    return children
+
+
+def _proc_rss(pid):
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def _proc_cmdline(pid):
+    try:
+        with open(f'/proc/{pid}/cmdline', 'rb') as f:
+            return f.read().replace(b'\0', b' ').decode('utf-8', 'replace')
+    except OSError:
+        return ''
+
+
+def process_tree_memory(root_pid):
+    """
+    Resident memory of root_pid and all its descendants, split into renderer
+    processes (--type=renderer) and everything else (browser, GPU, network,
+    chromedriver). Returns None if the tree cannot be read on this platform.
+    """
+    if psutil:
+        try:
+            root = psutil.Process(root_pid)
+            processes = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return None
+        usage = {'browser': 0, 'renderer': 0, 'processes': 0}
+        for proc in processes:
+            try:
+                rss = proc.memory_info().rss
+                renderer = '--type=renderer' in ' '.join(proc.cmdline())
+            except psutil.Error:
+                continue
+            usage['renderer' if renderer else 'browser'] += rss
+            usage['processes'] += 1
+        usage['total'] = usage['browser'] + usage['renderer']
+        return usage
+
+    if not os.path.isdir('/proc'):
+        return None
+    children = _proc_children()
+    usage = {'browser': 0, 'renderer': 0, 'processes': 0}
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        rss = _proc_rss(pid)
+        if not rss:
+            continue
+        usage['renderer' if '--type=renderer' in _proc_cmdline(pid) else 'browser'] += rss
+        usage['processes'] += 1
+    usage['total'] = usage['browser'] + usage['renderer']
+    return usage
+
+
+def driver_pid(driver):
+    """Best available root pid for a driver's process tree"""
+    pid = getattr(driver, 'browser_pid', None)
+    if pid:
+        return pid
+    service = getattr(driver, 'service', None)
+    process = getattr(service, 'process', None)
+    return getattr(process, 'pid', None)
+
+
+class DriverWatchdog:
+    def __init__(self, scraper, max_pages=None, max_rss_mb=None, sample_every=10, log_file=None):
+        """
+        :param scraper: Label used in logs and metrics ('daily' or 'realtime')
+        :param max_pages: Recycle after this many pages (SCRAPER_DRIVER_MAX_PAGES, default 400)
+        :param max_rss_mb: Recycle once the browser tree exceeds this many MB (SCRAPER_DRIVER_MAX_RSS_MB, default 2500)
+        :param sample_every: Pages between memory samples
+        :param log_file: JSONL file for memory samples (SCRAPER_MEMORY_LOG)
+        """
+        self.scraper = scraper
+        self.max_pages = max_pages or int(os.getenv('SCRAPER_DRIVER_MAX_PAGES', '400'))
+        self.max_rss = (max_rss_mb or int(os.getenv('SCRAPER_DRIVER_MAX_RSS_MB', '2500'))) * 1024 * 1024
+        self.sample_every = sample_every
+        self.log_file = log_file or os.getenv('SCRAPER_MEMORY_LOG')
+        self._log_lock = threading.Lock()
+        self.driver = None
+        self.pid = None
+        self.pages = 0
+        self.started = None
+        self.last_sample = None
+
+    def attach(self, driver):
+        """Start watching a freshly started driver"""
+        self.driver = driver
+        self.pid = driver_pid(driver)
+        self.pages = 0
+        self.started = time.monotonic()
+        self.last_sample = None
+        DRIVER_PAGES.set(0, scraper=self.scraper)
+        if self.pid is None:
+            logger.debug("Browser pid unavailable, only the page limit applies")
+        else:
+            self.sample()
+
+    def page_loaded(self):
+        self.pages += 1
+        DRIVER_PAGES.set(self.pages, scraper=self.scraper)
+        if self.pages % self.sample_every == 0:
+            self.sample()
+
+    def sample(self):
+        if self.pid is None:
+            return None
+        usage = process_tree_memory(self.pid)
+        if usage is None:
+            return None
+        self.last_sample = usage
+        for kind in ('browser', 'renderer', 'total'):
+            DRIVER_RSS_BYTES.set(usage[kind], scraper=self.scraper, kind=kind)
+        if self.log_file:
+            record = {
+                'ts': datetime.now().isoformat(timespec='seconds'),
+                'scraper': self.scraper,
+                'pid': self.pid,
+                'pages': self.pages,
+                'uptime_s': round(time.monotonic() - self.started, 1),
+                **usage
+            }
+            with self._log_lock, open(self.log_file, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        return usage
+
+    def should_recycle(self):
+        """
+        Reason to recycle the driver now, or None. Call only at an ASIN
+        boundary, where nothing is lost by quitting the browser.
+        """
+        if self.driver is None:
+            return None
+        reason = None
+        if self.pages >= self.max_pages:
+            reason = 'pages'
+        elif self.last_sample and self.last_sample['total'] >= self.max_rss:
+            reason = 'memory'
+        if reason:
+            rss_mb = self.last_sample['total'] / 1048576 if self.last_sample else 0
+            logger.info(
+                f"Recycling {self.scraper} driver ({reason}): {self.pages} pages, "
+                f"{rss_mb:.0f} MB across the browser process tree"
+            )
+            DRIVER_RECYCLES_TOTAL.inc(scraper=self.scraper, reason=reason)
+            self.driver = None
+        return reason
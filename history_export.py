@@ -0,0 +1,316 @@
+"""
+Columnar export and archival of scrape history.
+
+Streams daily_amazon_data and realtimedata out of Postgres through server-side
+cursors, in chunks, into Parquet datasets partitioned by date:
+
+    history/daily_amazon_data/scan_date=2024-05-01/part-20240502T010000.parquet
+    history/realtimedata/snapshot_date=2024-05-01/part-20240502T010000.parquet
+
+ASINs, marketplaces, ZIP codes and other repetitive text columns are
+dictionary encoded, prices are float32 and counts int32. Each dataset keeps a
+_manifest.json with the exported partitions and a watermark, so later runs
+only append new days (daily) or snapshots updated since the last run
+(realtime). Days of daily_amazon_data that are exported and older than
+--archive-older-than are then deleted from Postgres:
+
+    python history_export.py export --dest history
+    python history_export.py export --dest history --table daily --archive-older-than 90
+
+Requires pyarrow.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+import psycopg2
+
+from read_api import OFFERS_JSON_SQL
+
+logger = logging.getLogger("HistoryExport")
+
+# The databases the two scrapers write to (SimpleDatabaseManager defaults and realtimedata.DB_CONFIG)
+DAILY_DB = {'dbname': 'amazon_scraper', 'user': 'postgres', 'password': 'Talha', 'host': 'localhost', 'port': '5432'}
+REALTIME_DB = {'dbname': 'amazon.com', 'user': 'postgres', 'password': 'Talha', 'host': 'localhost', 'port': '5432'}
+
+CHUNK_ROWS = 50000
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        sys.exit("history_export needs pyarrow: pip install pyarrow")
+    return pyarrow, pyarrow.parquet
+
+
+def daily_schema(pa):
+    return pa.schema([
+        ('asin', pa.dictionary(pa.int32(), pa.string())),
+        ('scan_date', pa.date32()),
+        ('price', pa.float32()),
+        ('minimum_price', pa.float32()),
+        ('offers', pa.int32()),
+        ('best_seller_rank', pa.dictionary(pa.int32(), pa.string())),
+        ('marketplace', pa.dictionary(pa.int8(), pa.string())),
+        ('zip_code', pa.dictionary(pa.int16(), pa.string())),
+    ])
+
+
+def realtime_schema(pa):
+    return pa.schema([
+        ('asin', pa.dictionary(pa.int32(), pa.string())),
+        ('snapshot_date', pa.date32()),
+        ('last_updated', pa.timestamp('s')),
+        ('title', pa.string()),
+        ('price', pa.float32()),
+        ('rating', pa.float32()),
+        ('reviews_count', pa.int32()),
+        ('best_seller_rank', pa.string()),
+        ('buybox_shipped_from', pa.dictionary(pa.int32(), pa.string())),
+        ('buybox_sold_by', pa.dictionary(pa.int32(), pa.string())),
+        ('buybox_price', pa.float32()),
+        ('other_offers', pa.string()),
+        ('marketplace', pa.dictionary(pa.int8(), pa.string())),
+        ('zip_code', pa.dictionary(pa.int16(), pa.string())),
+    ])
+
+
+# Source table, database, partition column, Arrow schema and incremental query per dataset
+DATASETS = {
+    'daily': {
+        'table': 'daily_amazon_data',
+        'db': DAILY_DB,
+        'partition': 'scan_date',
+        'schema': daily_schema,
+        # Only closed days are exported, so a partition is written once and never revisited
+        'query': """
+            SELECT asin, scan_date, price, minimum_price, offers, best_seller_rank, marketplace, zip_code
+            FROM daily_amazon_data
+            WHERE scan_date > %s AND scan_date < CURRENT_DATE
+            ORDER BY scan_date
+        """,
+    },
+    'realtime': {
+        'table': 'realtimedata',
+        'db': REALTIME_DB,
+        'partition': 'snapshot_date',
+        'schema': realtime_schema,
+        # Rows are upserted in place, so each run captures the snapshots changed since the last one
+        # Offers are folded back into a JSON column from the normalized product_offers table
+        'query': f"""
+            SELECT r.asin, r.last_updated::date AS snapshot_date, r.last_updated, r.title, r.price, r.rating,
+                   r.reviews_count, r.best_seller_rank, r.buybox_shipped_from, r.buybox_sold_by, r.buybox_price,
+                   {OFFERS_JSON_SQL}::text AS other_offers, r.marketplace, r.zip_code
+            FROM realtimedata r
+            WHERE r.last_updated > %s
+            ORDER BY r.last_updated
+        """,
+    },
+}
+
+
+class Manifest:
+    """Exported partitions and the incremental watermark of one dataset"""
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {'watermark': None, 'partitions': {}}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.data = json.load(f)
+
+    @property
+    def watermark(self):
+        return self.data.get('watermark')
+
+    @watermark.setter
+    def watermark(self, value):
+        self.data['watermark'] = value
+
+    @property
+    def partitions(self):
+        return self.data['partitions']
+
+    def add_file(self, partition, filename, rows):
+        entry = self.partitions.setdefault(partition, {'rows': 0, 'files': []})
+        entry['rows'] += rows
+        entry['files'].append(filename)
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.data, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def _to_float(value):
+    return float(value) if value is not None else None
+
+
+def _columns(rows, names):
+    """Transpose a fetchmany chunk into per-column lists, converting Decimals for float columns"""
+    columns = {name: [] for name in names}
+    for row in rows:
+        for name, value in zip(names, row):
+            columns[name].append(value)
+    for name in ('price', 'minimum_price', 'buybox_price', 'rating'):
+        if name in columns:
+            columns[name] = [_to_float(v) for v in columns[name]]
+    if 'last_updated' in columns:
+        columns['last_updated'] = [v.replace(microsecond=0) if v else v for v in columns['last_updated']]
+    return columns
+
+
+def export_dataset(kind, dest, dsn=None, chunk_rows=CHUNK_ROWS):
+    """Append new history of one dataset to dest; returns {partition: rows written}"""
+    pa, pq = _require_pyarrow()
+    spec = DATASETS[kind]
+    schema = spec['schema'](pa)
+    names = schema.names
+    partition_col = spec['partition']
+    root = os.path.join(dest, spec['table'])
+    os.makedirs(root, exist_ok=True)
+    manifest = Manifest(os.path.join(root, '_manifest.json'))
+    run_id = datetime.now().strftime('%Y%m%dT%H%M%S')
+
+    if kind == 'daily':
+        watermark = manifest.watermark or '1970-01-01'
+    else:
+        watermark = manifest.watermark or '1970-01-01T00:00:00'
+
+    conn = psycopg2.connect(dsn) if dsn else psycopg2.connect(**spec['db'])
+    written = {}
+    writer = None
+    current = None
+    filename = f"part-{run_id}.parquet"
+    # Files are written under a '_' prefix, which dataset readers skip, and renamed once the run succeeds
+    pending = []
+    last_seen = None
+    try:
+        # A named cursor keeps the result set on the server and streams it in chunks
+        with conn.cursor(name=f"export_{kind}_{run_id}") as cur:
+            cur.itersize = chunk_rows
+            cur.execute(spec['query'], (watermark,))
+            while True:
+                rows = cur.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                columns = _columns(rows, names)
+                part_index = names.index(partition_col)
+                # Chunks are ordered by the partition column; split them where the date changes
+                start = 0
+                for i in range(1, len(rows) + 1):
+                    if i < len(rows) and rows[i][part_index] == rows[start][part_index]:
+                        continue
+                    partition = rows[start][part_index].isoformat()
+                    if partition != current:
+                        if writer:
+                            writer.close()
+                            manifest.add_file(current, filename, written[current])
+                        current = partition
+                        part_dir = os.path.join(root, f"{partition_col}={partition}")
+                        os.makedirs(part_dir, exist_ok=True)
+                        pending.append(part_dir)
+                        writer = pq.ParquetWriter(
+                            os.path.join(part_dir, '_' + filename), schema, compression='zstd',
+                            use_dictionary=True
+                        )
+                        written.setdefault(current, 0)
+                    table = pa.Table.from_pydict(
+                        {name: values[start:i] for name, values in columns.items()}, schema=schema
+                    )
+                    writer.write_table(table)
+                    written[current] += i - start
+                    start = i
+                last_seen = rows[-1][names.index('last_updated' if kind == 'realtime' else 'scan_date')]
+                logger.info(f"{spec['table']}: streamed {sum(written.values())} rows")
+        if writer:
+            writer.close()
+            writer = None
+            manifest.add_file(current, filename, written[current])
+    finally:
+        if writer:
+            writer.close()
+        conn.close()
+
+    for part_dir in pending:
+        os.replace(os.path.join(part_dir, '_' + filename), os.path.join(part_dir, filename))
+    if last_seen is not None:
+        manifest.watermark = last_seen.isoformat()
+    manifest.save()
+    logger.info(f"{spec['table']}: exported {sum(written.values())} rows into {len(written)} partitions")
+    return written
+
+
+def archive_daily(dest, older_than_days, dsn=None):
+    """
+    Delete exported days older than older_than_days from daily_amazon_data.
+    A day is only deleted when its row count still matches what was exported.
+    """
+    spec = DATASETS['daily']
+    manifest = Manifest(os.path.join(dest, spec['table'], '_manifest.json'))
+    cutoff = date.today() - timedelta(days=older_than_days)
+    candidates = sorted(p for p in manifest.partitions if date.fromisoformat(p) < cutoff)
+    if not candidates:
+        logger.info("Nothing to archive")
+        return 0
+
+    conn = psycopg2.connect(dsn) if dsn else psycopg2.connect(**spec['db'])
+    archived = 0
+    try:
+        for partition in candidates:
+            expected = manifest.partitions[partition]['rows']
+            with conn.cursor() as cur:
+                cur.execute("SELECT COUNT(*) FROM daily_amazon_data WHERE scan_date = %s", (partition,))
+                present = cur.fetchone()[0]
+                if present == 0:
+                    continue
+                if present != expected:
+                    logger.warning(
+                        f"Skipping {partition}: {present} rows in Postgres but {expected} exported"
+                    )
+                    continue
+                cur.execute("DELETE FROM daily_amazon_data WHERE scan_date = %s", (partition,))
+                archived += cur.rowcount
+            conn.commit()
+            logger.info(f"Archived {expected} rows of {partition}")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return archived
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export scrape history to partitioned Parquet')
+    sub = parser.add_subparsers(dest='command', required=True)
+    export = sub.add_parser('export', help='Append new history to the Parquet datasets')
+    export.add_argument('--dest', default='history', help='Root directory of the Parquet datasets')
+    export.add_argument('--table', choices=('daily', 'realtime', 'all'), default='all')
+    export.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help='Rows fetched per round trip')
+    export.add_argument('--daily-dsn', default=None, help='libpq DSN overriding the daily database')
+    export.add_argument('--realtime-dsn', default=None, help='libpq DSN overriding the realtime database')
+    export.add_argument('--archive-older-than', type=int, metavar='DAYS', default=None,
+                        help='After exporting, delete exported daily rows older than DAYS from Postgres')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    kinds = ('daily', 'realtime') if args.table == 'all' else (args.table,)
+    dsns = {'daily': args.daily_dsn, 'realtime': args.realtime_dsn}
+    for kind in kinds:
+        export_dataset(kind, args.dest, dsn=dsns[kind], chunk_rows=args.chunk_rows)
+    if args.archive_older_than is not None:
+        if 'daily' not in kinds:
+            parser.error('--archive-older-than only applies to the daily table')
+        archive_daily(args.dest, args.archive_older_than, dsn=args.daily_dsn)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+"""
+Load-leveled scheduling of a run across a time window.
+
+Without a window, a run scrapes the whole catalog as fast as the pacing
+limits allow. That creates a burst that attracts captchas, followed by idle
+hours. LoadPlanner spreads the run's ASINs evenly over `window_hours`
+instead:
+
+    planner = LoadPlanner('daily', shard, window_hours=20)
+    planner.plan(asins, conn)           # per-slot quotas from each ASIN's historical cost
+    for asin in asins:
+        planner.wait(asin)              # idles just enough to stay on plan
+        ...scrape...
+        planner.done(asin, seconds)
+    planner.save_costs(conn)            # feeds the next run's plan
+
+A cost is the wall time an ASIN took in recent runs, including probes and
+retries. It is kept per ASIN in asin_costs as a moving average. The window is
+cut into slots of `slot_minutes`, and each slot gets a quota: the ASINs whose
+cumulative cost falls in it. Before each fresh ASIN, wait() applies two rules:
+
+    - the live controller: the ASIN gets a share of the time left equal to
+      its share of the remaining cost. It idles for whatever part of that
+      share its measured run time will not use. The measured rate is busy
+      seconds per planned cost second, so slower pages, captchas and driver
+      restarts shrink the idle time and a late run does not idle at all;
+    - the slot ceiling: once the ASINs started reach the quotas of every
+      slot so far, wait for the next slot, so catching up never turns into
+      a burst.
+
+The planner publishes the projected finish time (ETA) as metrics and logs it
+once per slot.
+"""
+import logging
+import math
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from psycopg2.extras import execute_values
+
+from scraper_metrics import REGISTRY, Gauge
+
+logger = logging.getLogger("LoadPlanner")
+
+# Seconds assumed for an ASIN without history when no ASIN has history either
+DEFAULT_COST = 10.0
+# Weight of the latest run in an ASIN's moving-average cost
+COST_ALPHA = 0.3
+
+PLAN_ETA_SECONDS = REGISTRY.register(Gauge(
+    'scraper_plan_eta_seconds', 'Projected seconds until the planned run finishes', ['scraper', 'shard']
+))
+PLAN_SLACK_SECONDS = REGISTRY.register(Gauge(
+    'scraper_plan_slack_seconds', 'Seconds between the projected finish and the window end (negative = late)',
+    ['scraper', 'shard']
+))
+PLAN_IDLE_SECONDS = REGISTRY.register(Gauge(
+    'scraper_plan_idle_seconds', 'Seconds the planner has idled to spread the run', ['scraper', 'shard']
+))
+
+
+def create_cost_table(conn):
+    """Create the per-ASIN cost table if it does not exist"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS asin_costs (
+                scraper VARCHAR(20) NOT NULL,
+                shard VARCHAR(100) NOT NULL,
+                asin VARCHAR(20) NOT NULL,
+                cost_seconds DECIMAL(10,3) NOT NULL,
+                samples INTEGER NOT NULL DEFAULT 1,
+                updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (scraper, shard, asin)
+            )
+        """)
+    conn.commit()
+
+
+def load_costs(conn, scraper, shard_name):
+    """{asin: cost seconds} from earlier runs of this scraper and shard"""
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT asin, cost_seconds FROM asin_costs WHERE scraper = %s AND shard = %s",
+            (scraper, shard_name)
+        )
+        return {asin: float(cost) for asin, cost in cur.fetchall()}
+
+
+class LoadPlanner:
+    def __init__(self, scraper, shard, window_hours, slot_minutes=15, max_idle=600):
+        """
+        :param scraper: 'daily' or 'realtime'
+        :param shard: ShardConfig of the run
+        :param window_hours: Hours, from now, the run is spread over
+        :param slot_minutes: Length of a quota slot
+        :param max_idle: Upper bound on a single idle period, in seconds
+        """
+        self.scraper = scraper
+        self.shard = shard
+        self.window = window_hours * 3600.0
+        self.slot_length = slot_minutes * 60.0
+        self.max_idle = max_idle
+        self.started = time.monotonic()
+        self.deadline = self.started + self.window
+        self.window_end = datetime.now() + timedelta(seconds=self.window)
+        self.slots = max(1, math.ceil(self.window / self.slot_length))
+        self.costs = {}
+        self.quotas = []
+        self._cumulative = []
+        self.remaining_cost = 0.0
+        self.cost_done = 0.0
+        self.started_count = 0
+        self.idle = 0.0
+        self.observed = {}
+        self._pending = set()
+        self._reported_slot = -1
+
+    @property
+    def planned(self):
+        return bool(self.quotas)
+
+    def plan(self, asins, conn=None):
+        """Spread asins over the window; conn supplies the historical costs (optional)"""
+        history = {}
+        if conn is not None:
+            try:
+                history = load_costs(conn, self.scraper, self.shard.name)
+            except Exception as e:
+                logger.warning(f"Could not load ASIN costs, planning with equal costs: {str(e)}")
+                conn.rollback()
+        default = statistics.median(history.values()) if history else DEFAULT_COST
+        self.costs = {asin: history.get(asin, default) for asin in asins}
+        self._pending = set(self.costs)
+        total = sum(self.costs.values()) or 1.0
+        self.remaining_cost = total
+
+        self.quotas = [0] * self.slots
+        before = 0.0
+        for asin in asins:
+            slot = min(self.slots - 1, int(before / total * self.slots))
+            self.quotas[slot] += 1
+            before += self.costs[asin]
+        running = 0
+        self._cumulative = []
+        for quota in self.quotas:
+            running += quota
+            self._cumulative.append(running)
+
+        known = sum(1 for asin in asins if asin in history)
+        logger.info(
+            f"Plan for {self.scraper}/{self.shard.name}: {len(asins)} ASINs ({known} with history), "
+            f"{total / 3600:.1f}h of expected work over {self.window / 3600:.1f}h in {self.slots} slots of "
+            f"{self.slot_length / 60:.0f}m, ~{len(asins) / self.slots:.0f} ASINs per slot, "
+            f"window ends {self.window_end:%Y-%m-%d %H:%M}"
+        )
+
+    def _rate(self):
+        """Busy seconds per planned cost second so far (1.0 before anything finished)"""
+        busy = time.monotonic() - self.started - self.idle
+        return busy / self.cost_done if self.cost_done > 0 else 1.0
+
+    def _sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+            self.idle += seconds
+            PLAN_IDLE_SECONDS.set(round(self.idle), scraper=self.scraper, shard=self.shard.name)
+
+    def wait(self, asin):
+        """Block until asin, a fresh ASIN of the plan, may start"""
+        if not self.planned:
+            return
+        now = time.monotonic()
+        slot = min(self.slots - 1, int((now - self.started) / self.slot_length))
+        self._report(slot)
+
+        # Slot ceiling: everything planned up to this slot has been started already
+        if now < self.deadline and self.started_count >= self._cumulative[slot] and slot < self.slots - 1:
+            next_slot = self.started + (slot + 1) * self.slot_length
+            self._sleep(min(next_slot - now, self.max_idle))
+            now = time.monotonic()
+
+        # Live controller: the idle part of this ASIN's share of the remaining window
+        cost = self.costs.get(asin)
+        if cost is not None and self.remaining_cost > 0:
+            share = (self.deadline - now) * cost / self.remaining_cost
+            self._sleep(min(share - cost * self._rate(), self.max_idle))
+        self.started_count += 1
+
+    def done(self, asin, seconds):
+        """Record the time asin took; call again for each retry attempt"""
+        self.observed[asin] = self.observed.get(asin, 0.0) + seconds
+        if asin in self._pending:
+            self._pending.discard(asin)
+            self.cost_done += self.costs[asin]
+            self.remaining_cost = max(0.0, self.remaining_cost - self.costs[asin])
+        eta = self.eta()
+        if eta is not None:
+            PLAN_ETA_SECONDS.set(round(eta), scraper=self.scraper, shard=self.shard.name)
+            PLAN_SLACK_SECONDS.set(round(self.deadline - time.monotonic() - eta),
+                                   scraper=self.scraper, shard=self.shard.name)
+
+    def eta(self):
+        """Projected seconds until the run finishes, or None without a plan"""
+        if not self.planned:
+            return None
+        now = time.monotonic()
+        work_left = self.remaining_cost * self._rate()
+        # On plan, the controller stretches the remaining work to the window end
+        return max(work_left, self.deadline - now) if self.remaining_cost else 0.0
+
+    def _report(self, slot):
+        if slot == self._reported_slot:
+            return
+        self._reported_slot = slot
+        eta = self.eta()
+        finish = datetime.now() + timedelta(seconds=eta)
+        late = time.monotonic() + eta - self.deadline
+        logger.info(
+            f"Slot {slot + 1}/{self.slots} of {self.scraper}/{self.shard.name}: "
+            f"{self.started_count}/{self._cumulative[slot]} planned ASINs started, {len(self._pending)} left, "
+            f"ETA {finish:%H:%M}" + (f", {late / 60:.0f}m past the window" if late > 60 else '')
+        )
+
+    def save_costs(self, conn):
+        """Fold this run's per-ASIN times into asin_costs; never raises"""
+        if conn is None or not self.observed:
+            return
+        rows = [(self.scraper, self.shard.name, asin, round(seconds, 3)) for asin, seconds in self.observed.items()]
+        try:
+            with conn.cursor() as cur:
+                execute_values(cur, f"""
+                    INSERT INTO asin_costs (scraper, shard, asin, cost_seconds)
+                    VALUES %s
+                    ON CONFLICT (scraper, shard, asin) DO UPDATE SET
+                        cost_seconds = asin_costs.cost_seconds * {1 - COST_ALPHA} + EXCLUDED.cost_seconds * {COST_ALPHA},
+                        samples = asin_costs.samples + 1,
+                        updated_at = NOW()
+                """, rows)
+            conn.commit()
+            logger.info(f"Saved costs of {len(rows)} ASINs for the next plan")
+        except Exception as e:
+            logger.error(f"Error saving ASIN costs: {str(e)}")
+            try:
+                conn.rollback()
+            except Exception:
+                pass
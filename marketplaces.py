@@ -0,0 +1,149 @@
+"""
+Marketplace and delivery-location settings for sharded scraper runs.
+
+A shard is one (job, marketplace, ZIP code) combination with its own browser
+session and proxy pool, its own request rate limit and its own result
+partition (rows are keyed by marketplace and ZIP code). Shards are listed in a
+JSON file and run concurrently:
+
+    [
+        {"name": "us-brooklyn", "job": "daily", "marketplace": "US", "zip_code": "11229"},
+        {"name": "uk-london", "job": "daily", "marketplace": "UK", "zip_code": "SW1A 1AA",
+         "requests_per_minute": 12, "proxies": ["http://10.0.0.5:3128"]}
+    ]
+
+    python marketplaces.py --shards shards.json
+"""
+import json
+import logging
+import threading
+
+from proxy_pool import ProxyPool, TokenBucket
+
+logger = logging.getLogger("Marketplaces")
+
+MARKETPLACES = {
+    'US': {'domain': 'www.amazon.com', 'zip_code': '11229'},
+    'CA': {'domain': 'www.amazon.ca', 'zip_code': 'M5V 3L9'},
+    'MX': {'domain': 'www.amazon.com.mx', 'zip_code': '06600'},
+    'UK': {'domain': 'www.amazon.co.uk', 'zip_code': 'SW1A 1AA'},
+    'DE': {'domain': 'www.amazon.de', 'zip_code': '10115'},
+    'FR': {'domain': 'www.amazon.fr', 'zip_code': '75001'},
+    'IT': {'domain': 'www.amazon.it', 'zip_code': '00118'},
+    'ES': {'domain': 'www.amazon.es', 'zip_code': '28001'},
+}
+
+DEFAULT_MARKETPLACE = 'US'
+JOBS = ('daily', 'realtime')
+
+
+class ShardConfig:
+    def __init__(self, name=None, job='daily', marketplace=DEFAULT_MARKETPLACE, zip_code=None,
+                 base_url=None, excel_file='cleaned_asin.xlsx', requests_per_minute=None, proxies=None):
+        """
+        :param name: Shard name used in logs (defaults to job-marketplace-zip)
+        :param job: 'daily' (scriptfinal2) or 'realtime' (realtimedata)
+        :param marketplace: Key of MARKETPLACES
+        :param zip_code: Delivery location; defaults to the marketplace's default
+        :param base_url: Override the storefront root (e.g. a mock storefront)
+        :param excel_file: Workbook with the shard's ASINs
+        :param requests_per_minute: Page rate limit for the shard when it has no proxies
+        :param proxies: Proxy URLs reserved for this shard
+        """
+        if marketplace not in MARKETPLACES:
+            raise ValueError(f"Unknown marketplace {marketplace}, expected one of {', '.join(MARKETPLACES)}")
+        if job not in JOBS:
+            raise ValueError(f"Unknown job {job}, expected one of {', '.join(JOBS)}")
+        self.job = job
+        self.marketplace = marketplace
+        self.zip_code = zip_code or MARKETPLACES[marketplace]['zip_code']
+        self.name = name or f"{job}-{marketplace.lower()}-{self.zip_code.replace(' ', '')}"
+        self._base_url = base_url.rstrip('/') if base_url else None
+        self.excel_file = excel_file
+        self.requests_per_minute = requests_per_minute
+        self.proxies = proxies or []
+
+    @property
+    def base_url(self):
+        return self._base_url or f"https://{MARKETPLACES[self.marketplace]['domain']}"
+
+    @classmethod
+    def default(cls, job='daily', base_url=None):
+        """The single US/11229 shard the scrapers have always run"""
+        return cls(job=job, base_url=base_url)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def proxy_pool(self):
+        """The shard's own proxy pool, falling back to the environment-wide one"""
+        if self.proxies:
+            return ProxyPool(self.proxies)
+        return ProxyPool.from_env()
+
+    def rate_limiter(self):
+        return TokenBucket(self.requests_per_minute, burst=1) if self.requests_per_minute else None
+
+    def __repr__(self):
+        return f"<Shard {self.name} {self.base_url} zip={self.zip_code}>"
+
+
+def load_shards(path):
+    with open(path) as f:
+        entries = json.load(f)
+    shards = [ShardConfig.from_dict(entry) for entry in entries]
+    names = [s.name for s in shards]
+    if len(set(names)) != len(names):
+        raise ValueError("Shard names must be unique")
+    return shards
+
+
+def _run_shard(shard, results, pipeline_depth=None, tabs=None, window_hours=None):
+    try:
+        if shard.job == 'daily':
+            import scriptfinal2
+            results[shard.name] = scriptfinal2.run_scraper_with_recovery(
+                excel_file=shard.excel_file, shard=shard, pipeline_depth=pipeline_depth, tabs=tabs,
+                window_hours=window_hours
+            )
+        else:
+            import realtimedata
+            realtimedata.create_realtimedata_table()
+            realtimedata.scrape_all_asins(shard.excel_file, shard=shard, window_hours=window_hours)
+            results[shard.name] = "Completed"
+    except Exception as e:
+        logger.error(f"Shard {shard.name} failed: {str(e)}")
+        results[shard.name] = f"Failed with error: {str(e)}"
+
+
+def run_shards(shards, pipeline_depth=None, tabs=None, window_hours=None):
+    """
+    Run every shard concurrently in its own thread; returns {shard name: outcome}
+
+    pipeline_depth and tabs apply to daily shards only; None keeps each scraper's environment default.
+    """
+    results = {}
+    threads = []
+    options = {'pipeline_depth': pipeline_depth, 'tabs': tabs, 'window_hours': window_hours}
+    for shard in shards:
+        logger.info(f"Starting shard {shard}")
+        thread = threading.Thread(target=_run_shard, args=(shard, results), kwargs=options, name=shard.name)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    for name, outcome in results.items():
+        logger.info(f"Shard {name}: {outcome}")
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run scraper shards per marketplace and delivery location')
+    parser.add_argument('--shards', default='shards.json', help='JSON file listing the shards to run')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(threadName)s - %(name)s - %(levelname)s - %(message)s')
+    run_shards(load_shards(args.shards))
@@ -0,0 +1,175 @@
+"""
+Navigation pipelining for one browser.
+
+A worker normally sits idle through every driver.get and the fixed sleeps
+after it, then the network sits idle while the page is extracted and saved.
+NavigationPipeline overlaps the two: while ASIN n is being extracted in the
+active tab, the next `depth` product pages are already loading in background
+tabs opened with window.open. When the worker moves on, take() switches to the
+prefetched tab (waiting only for whatever is left of its load) and closes the
+tab that was just finished with, so the browser never holds more than
+depth + 1 tabs.
+
+Every prefetch goes through the same pacing as a direct navigation (the
+circuit breaker, the proxy or shard token bucket) plus a randomized minimum
+gap between navigations, so pipelining hides latency without raising the
+request rate. Prefetched pages that sit unused longer than max_age are thrown
+away and loaded again normally.
+
+    pipeline = NavigationPipeline(driver, 'daily', depth=1, pace=scraper.pace)
+    pipeline.fill([(next_asin, f'{base_url}/dp/{next_asin}')])
+    if pipeline.take(asin) is None:
+        driver.get(url)
+"""
+import logging
+import random
+import time
+from collections import OrderedDict
+
+from scraper_metrics import REGISTRY, Counter, Gauge
+
+logger = logging.getLogger("NavigationPipeline")
+
+PREFETCH_TOTAL = REGISTRY.register(Counter(
+    'scraper_prefetch_total', 'Background page loads by outcome (issued, used, stale, discarded)',
+    ['scraper', 'result']
+))
+PREFETCH_PENDING = REGISTRY.register(Gauge(
+    'scraper_prefetch_pending', 'Prefetched pages waiting to be used', ['scraper']
+))
+
+
+class _Prefetch:
+    __slots__ = ('handle', 'url', 'issued')
+
+    def __init__(self, handle, url, issued):
+        self.handle = handle
+        self.url = url
+        self.issued = issued
+
+
+class NavigationPipeline:
+    def __init__(self, driver, scraper, depth=1, pace=None, min_interval=(1.5, 3.0),
+                 ready_timeout=30, max_age=180):
+        """
+        :param driver: The worker's WebDriver; the pipeline manages its tabs
+        :param scraper: Label used in logs and metrics ('daily' or 'realtime')
+        :param depth: Pages kept loading ahead of the active one (0 disables prefetching)
+        :param pace: Called before every prefetch; blocks until the global pacing limits allow a request
+        :param min_interval: Random range of seconds kept between the starts of two navigations
+        :param ready_timeout: Seconds take() waits for a prefetched page to finish loading
+        :param max_age: Prefetched pages older than this are discarded instead of used
+        """
+        self.driver = driver
+        self.scraper = scraper
+        self.depth = max(0, depth)
+        self.pace = pace
+        self.min_interval = min_interval
+        self.ready_timeout = ready_timeout
+        self.max_age = max_age
+        self._pending = OrderedDict()
+        self._last_navigation = 0.0
+
+    def __contains__(self, key):
+        return key in self._pending
+
+    def __len__(self):
+        return len(self._pending)
+
+    def navigated(self):
+        """Record a navigation made outside the pipeline, so prefetches keep their distance from it"""
+        self._last_navigation = time.monotonic()
+
+    def _space_out(self):
+        gap = random.uniform(*self.min_interval)
+        wait = self._last_navigation + gap - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+    def prefetch(self, key, url):
+        """Start loading url in a background tab; returns False if the pipeline is full or the tab failed to open"""
+        if not self.depth or key in self._pending or len(self._pending) >= self.depth:
+            return False
+        if self.pace:
+            self.pace()
+        self._space_out()
+        try:
+            before = set(self.driver.window_handles)
+            # window.open starts the load without switching tabs, so the active page stays usable
+            self.driver.execute_script("window.open(arguments[0], '_blank');", url)
+            opened = [h for h in self.driver.window_handles if h not in before]
+        except Exception as e:
+            logger.warning(f"Could not open prefetch tab for {key}: {str(e)}")
+            return False
+        if not opened:
+            logger.warning(f"Prefetch tab for {key} did not open, prefetching disabled")
+            self.depth = 0
+            return False
+        self._last_navigation = time.monotonic()
+        self._pending[key] = _Prefetch(opened[0], url, self._last_navigation)
+        PREFETCH_TOTAL.inc(scraper=self.scraper, result='issued')
+        PREFETCH_PENDING.set(len(self._pending), scraper=self.scraper)
+        logger.debug(f"Prefetching {key} ({len(self._pending)}/{self.depth} in flight)")
+        return True
+
+    def _drop_stale(self):
+        now = time.monotonic()
+        for key in [k for k, entry in self._pending.items() if now - entry.issued > self.max_age]:
+            logger.debug(f"Prefetched page for {key} was never used, closing it")
+            PREFETCH_TOTAL.inc(scraper=self.scraper, result='stale')
+            self._close_tab(self._pending.pop(key).handle)
+
+    def fill(self, items):
+        """Prefetch (key, url) pairs in order until the pipeline is full"""
+        self._drop_stale()
+        for key, url in items:
+            if len(self._pending) >= self.depth:
+                break
+            self.prefetch(key, url)
+
+    def take(self, key):
+        """
+        Make key's prefetched tab the active one and close the previous active
+        tab. Returns the seconds from issuing the prefetch until the page was
+        ready, or None if key was not prefetched (navigate normally then).
+        """
+        entry = self._pending.pop(key, None)
+        PREFETCH_PENDING.set(len(self._pending), scraper=self.scraper)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.issued > self.max_age:
+            logger.debug(f"Prefetched page for {key} is stale, loading it again")
+            PREFETCH_TOTAL.inc(scraper=self.scraper, result='stale')
+            self._close_tab(entry.handle)
+            return None
+
+        # The finished page's tab is closed before moving to the prefetched one
+        self.driver.close()
+        self.driver.switch_to.window(entry.handle)
+        deadline = time.monotonic() + self.ready_timeout
+        while time.monotonic() < deadline:
+            try:
+                if self.driver.execute_script("return document.readyState") == "complete":
+                    break
+            except Exception:
+                pass
+            time.sleep(0.2)
+        PREFETCH_TOTAL.inc(scraper=self.scraper, result='used')
+        return time.monotonic() - entry.issued
+
+    def _close_tab(self, handle):
+        try:
+            active = self.driver.current_window_handle
+            self.driver.switch_to.window(handle)
+            self.driver.close()
+            self.driver.switch_to.window(active)
+        except Exception as e:
+            logger.debug(f"Error closing prefetch tab: {str(e)}")
+
+    def discard(self):
+        """Close every pending prefetch tab, e.g. before the driver is recycled"""
+        while self._pending:
+            _, entry = self._pending.popitem(last=False)
+            PREFETCH_TOTAL.inc(scraper=self.scraper, result='discarded')
+            self._close_tab(entry.handle)
+        PREFETCH_PENDING.set(0, scraper=self.scraper)
@@ -0,0 +1,317 @@
+"""
+Negative cache for dead and unavailable ASINs.
+
+A delisted, suppressed or "page not found" ASIN fails the same way every day.
+Without this cache it goes through the whole retry path each time: several
+attempts, backoff sleeps, possibly captcha solves. NegativeCache remembers
+ASINs whose retries ended in a dead category (DEAD_CATEGORIES), and runs skip
+them until their entry expires.
+
+Each entry's TTL doubles with every failed check, from
+SCRAPER_NEGATIVE_TTL_HOURS (24) up to SCRAPER_NEGATIVE_MAX_TTL_DAYS (30).
+When an entry has expired, the next run re-probes the ASIN with a single
+attempt and no retry path:
+
+    - if the ASIN is still dead, the entry is renewed with a longer TTL;
+    - if the page scrapes, the entry is removed;
+    - if the check is inconclusive (captcha, timeout), the ASIN goes through
+      the normal retry path and is probed again next run.
+
+    cache = NegativeCache('daily', 'US')
+    cache.load(conn)
+    if cache.skip(asin): continue
+    ...
+    cache.flush(conn)
+
+Entries live in negative_cache, one row per ASIN and marketplace:
+
+    python negative_cache.py list [--db daily|realtime|all] [--marketplace US]
+    python negative_cache.py clear B000123456 B000654321
+    python negative_cache.py clear --all --db realtime
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+from datetime import datetime, timedelta
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from scraper_metrics import REGISTRY, Counter, Gauge
+
+logger = logging.getLogger("NegativeCache")
+
+# Retry categories that mean the ASIN itself is gone, not that the request failed
+DEAD_CATEGORIES = ('not_found', 'unavailable')
+
+BASE_TTL = timedelta(hours=float(os.getenv('SCRAPER_NEGATIVE_TTL_HOURS', '24')))
+MAX_TTL = timedelta(days=float(os.getenv('SCRAPER_NEGATIVE_MAX_TTL_DAYS', '30')))
+
+NEGATIVE_SKIPS_TOTAL = REGISTRY.register(Counter(
+    'scraper_negative_cache_skips_total', 'ASINs skipped because they are cached as dead', ['scraper']
+))
+NEGATIVE_PROBES_TOTAL = REGISTRY.register(Counter(
+    'scraper_negative_cache_probes_total', 'Re-probes of expired dead ASINs by result (dead, alive)',
+    ['scraper', 'result']
+))
+NEGATIVE_CACHE_SIZE = REGISTRY.register(Gauge(
+    'scraper_negative_cache_size', 'ASINs currently cached as dead', ['scraper']
+))
+
+
+def create_negative_cache_table(conn):
+    """Create the negative cache table if it does not exist"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS negative_cache (
+                asin VARCHAR(20) NOT NULL,
+                marketplace VARCHAR(5) NOT NULL,
+                category VARCHAR(20) NOT NULL,
+                strikes INTEGER NOT NULL,
+                last_error TEXT,
+                first_seen TIMESTAMP NOT NULL,
+                last_checked TIMESTAMP NOT NULL,
+                expires_at TIMESTAMP NOT NULL,
+                PRIMARY KEY (asin, marketplace)
+            )
+        """)
+    conn.commit()
+
+
+def ttl_for(strikes):
+    """TTL after the given number of failed checks: doubles per strike, capped"""
+    # Capped before multiplying: a long-dead ASIN's strikes would overflow timedelta
+    return min(MAX_TTL, BASE_TTL * min(2 ** max(0, strikes - 1), MAX_TTL / BASE_TTL))
+
+
+class NegativeEntry:
+    __slots__ = ('asin', 'category', 'strikes', 'last_error', 'first_seen', 'last_checked', 'expires_at')
+
+    def __init__(self, asin, category, strikes, last_error, first_seen, last_checked, expires_at):
+        self.asin = asin
+        self.category = category
+        self.strikes = strikes
+        self.last_error = last_error
+        self.first_seen = first_seen
+        self.last_checked = last_checked
+        self.expires_at = expires_at
+
+
+class NegativeCache:
+    def __init__(self, scraper, marketplace):
+        """
+        :param scraper: Label used in logs and metrics ('daily' or 'realtime')
+        :param marketplace: Marketplace the entries apply to
+        """
+        self.scraper = scraper
+        self.marketplace = marketplace
+        self._entries = {}
+        self._dirty = set()
+        self._revived = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def load(self, conn):
+        """Read this marketplace's entries; a failure leaves the cache empty rather than failing the run"""
+        try:
+            create_negative_cache_table(conn)
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT asin, category, strikes, last_error, first_seen, last_checked, expires_at
+                    FROM negative_cache WHERE marketplace = %s
+                """, (self.marketplace,))
+                rows = cur.fetchall()
+        except Exception as e:
+            logger.error(f"Error loading negative cache: {str(e)}")
+            conn.rollback()
+            return
+        with self._lock:
+            self._entries = {row[0]: NegativeEntry(*row) for row in rows}
+        expired = len(rows) - self._publish_size()
+        if rows:
+            logger.info(f"Negative cache: {len(rows) - expired} dead ASINs skipped, {expired} due for a re-probe")
+
+    def _publish_size(self):
+        now = datetime.now()
+        with self._lock:
+            size = sum(1 for entry in self._entries.values() if entry.expires_at > now)
+        NEGATIVE_CACHE_SIZE.set(size, scraper=self.scraper)
+        return size
+
+    def cached(self, asin):
+        """True while asin is cached as dead and its entry has not expired"""
+        with self._lock:
+            entry = self._entries.get(asin)
+            return entry is not None and entry.expires_at > datetime.now()
+
+    def probing(self, asin):
+        """True if asin has an expired entry, so this attempt is its re-probe"""
+        with self._lock:
+            entry = self._entries.get(asin)
+            return entry is not None and entry.expires_at <= datetime.now()
+
+    def skip(self, asin):
+        """Like cached(), but logs and counts the skip"""
+        if not self.cached(asin):
+            return False
+        entry = self._entries[asin]
+        logger.info(f"Skipping ASIN {asin} ({entry.category} since {entry.first_seen:%Y-%m-%d}, "
+                    f"next check {entry.expires_at:%Y-%m-%d %H:%M})")
+        NEGATIVE_SKIPS_TOTAL.inc(scraper=self.scraper)
+        return True
+
+    def record_dead(self, asin, category, error=None):
+        """
+        Cache asin after a failure in a dead category, renewing an expired
+        entry with a longer TTL. Returns False, and caches nothing, for other
+        categories.
+        """
+        if category not in DEAD_CATEGORIES:
+            return False
+        now = datetime.now()
+        with self._lock:
+            entry = self._entries.get(asin)
+            probed = entry is not None
+            if entry is None:
+                entry = NegativeEntry(asin, category, 0, None, now, now, now)
+                self._entries[asin] = entry
+            entry.category = category
+            entry.strikes += 1
+            entry.last_error = str(error)[:500] if error else None
+            entry.last_checked = now
+            entry.expires_at = now + ttl_for(entry.strikes)
+            self._dirty.add(asin)
+            self._revived.discard(asin)
+        if probed:
+            NEGATIVE_PROBES_TOTAL.inc(scraper=self.scraper, result='dead')
+        self._publish_size()
+        logger.info(f"ASIN {asin} cached as {category} until {entry.expires_at:%Y-%m-%d %H:%M} "
+                    f"(strike {entry.strikes})")
+        return True
+
+    def record_alive(self, asin):
+        """Drop asin's entry after a successful scrape"""
+        with self._lock:
+            if self._entries.pop(asin, None) is None:
+                return
+            self._dirty.discard(asin)
+            self._revived.add(asin)
+        NEGATIVE_PROBES_TOTAL.inc(scraper=self.scraper, result='alive')
+        logger.info(f"ASIN {asin} is back, removed from the negative cache")
+
+    def flush(self, conn):
+        """Write new, renewed and removed entries; never raises"""
+        with self._lock:
+            rows = [
+                (e.asin, self.marketplace, e.category, e.strikes, e.last_error, e.first_seen, e.last_checked,
+                 e.expires_at)
+                for e in (self._entries[asin] for asin in self._dirty)
+            ]
+            revived = list(self._revived)
+            self._dirty, self._revived = set(), set()
+        if conn is None or not (rows or revived):
+            return
+        try:
+            with conn.cursor() as cur:
+                if rows:
+                    execute_values(cur, """
+                        INSERT INTO negative_cache
+                        (asin, marketplace, category, strikes, last_error, first_seen, last_checked, expires_at)
+                        VALUES %s
+                        ON CONFLICT (asin, marketplace) DO UPDATE SET
+                            category = EXCLUDED.category,
+                            strikes = EXCLUDED.strikes,
+                            last_error = EXCLUDED.last_error,
+                            last_checked = EXCLUDED.last_checked,
+                            expires_at = EXCLUDED.expires_at
+                    """, rows)
+                if revived:
+                    cur.execute(
+                        "DELETE FROM negative_cache WHERE marketplace = %s AND asin = ANY(%s)",
+                        (self.marketplace, revived)
+                    )
+            conn.commit()
+            logger.info(f"Negative cache: {len(rows)} entries written, {len(revived)} removed")
+        except Exception as e:
+            logger.error(f"Error saving negative cache: {str(e)}")
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+
+
+def list_entries(conn, marketplace=None):
+    """Cached ASINs, soonest re-probe first"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT asin, marketplace, category, strikes, first_seen, last_checked, expires_at, last_error
+            FROM negative_cache
+            WHERE %s IS NULL OR marketplace = %s
+            ORDER BY expires_at
+        """, (marketplace, marketplace))
+        return cur.fetchall()
+
+
+def clear_entries(conn, asins=None, marketplace=None):
+    """Remove the given ASINs (or every entry when asins is None); returns the number removed"""
+    query = "DELETE FROM negative_cache WHERE (%s IS NULL OR marketplace = %s)"
+    params = [marketplace, marketplace]
+    if asins is not None:
+        query += " AND asin = ANY(%s)"
+        params.append(list(asins))
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        removed = cur.rowcount
+    conn.commit()
+    return removed
+
+
+def main():
+    from history_export import DAILY_DB, REALTIME_DB
+
+    parser = argparse.ArgumentParser(description='Negative cache of dead and unavailable ASINs')
+    parser.add_argument('--db', choices=('daily', 'realtime', 'all'), default='all')
+    parser.add_argument('--marketplace', default=None, help='Only this marketplace')
+    parser.add_argument('--daily-dsn', default=None, help='libpq DSN overriding the daily database')
+    parser.add_argument('--realtime-dsn', default=None, help='libpq DSN overriding the realtime database')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list', help='Show cached ASINs and when they are re-probed')
+    clear = sub.add_parser('clear', help='Remove ASINs so the next run scrapes them normally')
+    clear.add_argument('asins', nargs='*', help='ASINs to remove')
+    clear.add_argument('--all', action='store_true', help='Remove every entry')
+    args = parser.parse_args()
+
+    if args.command == 'clear' and not args.asins and not args.all:
+        parser.error('clear needs ASINs or --all')
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    databases = {'daily': (DAILY_DB, args.daily_dsn), 'realtime': (REALTIME_DB, args.realtime_dsn)}
+    kinds = ('daily', 'realtime') if args.db == 'all' else (args.db,)
+    for kind in kinds:
+        params, dsn = databases[kind]
+        conn = psycopg2.connect(dsn) if dsn else psycopg2.connect(**params)
+        try:
+            create_negative_cache_table(conn)
+            if args.command == 'list':
+                rows = list_entries(conn, args.marketplace)
+                print(f"{kind}: {len(rows)} cached ASINs")
+                for asin, marketplace, category, strikes, first_seen, last_checked, expires_at, last_error in rows:
+                    state = 'due' if expires_at <= datetime.now() else f"until {expires_at:%Y-%m-%d %H:%M}"
+                    print(f"  {asin:<12} {marketplace:<3} {category:<12} {strikes}x  since {first_seen:%Y-%m-%d}  "
+                          f"checked {last_checked:%Y-%m-%d}  {state}  {last_error or ''}")
+            else:
+                removed = clear_entries(conn, None if args.all else args.asins, args.marketplace)
+                print(f"{kind}: removed {removed} entries")
+        finally:
+            conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
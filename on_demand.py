@@ -0,0 +1,368 @@
+"""
+On-demand single-ASIN scrapes over HTTP.
+
+realtimedata.py scrapes the whole ASIN list on a schedule. This service keeps
+one realtime browser worker running and lets analysts ask for a single ASIN:
+
+    GET /scrape/<asin>?max_age=900&wait=90
+        X-Caller: jane
+
+If realtimedata already holds a snapshot newer than max_age seconds it is
+returned at once. Otherwise a high-priority job is queued on the worker and
+the request waits up to `wait` seconds for it (202 with the job status if it
+is still pending). Concurrent requests for the same ASIN share one job.
+
+Scheduled runs feed the same worker at low priority (--schedule, or POST
+/schedule to queue the whole list now). Each caller has its own token bucket,
+and after max_on_demand_streak on-demand jobs in a row the worker takes one
+scheduled job, so on-demand traffic cannot starve the scheduled run.
+
+    python on_demand.py --port 8090 --schedule
+"""
+import argparse
+import json
+import logging
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import realtimedata
+from marketplaces import ShardConfig
+from proxy_pool import TokenBucket
+from read_api import OFFERS_JSON_SQL, _jsonable
+from retry_queue import ScrapeFailure
+from scraper_metrics import REGISTRY, Counter, Gauge, record_asin
+from scraper_logging import asin_context
+from scraper_tracing import trace_asin, span
+
+logger = logging.getLogger("OnDemandScraper")
+
+PRIORITY_ON_DEMAND = 0
+PRIORITY_SCHEDULED = 10
+
+ASIN_PATTERN = re.compile(r'^[A-Z0-9]{10}$')
+
+ON_DEMAND_REQUESTS_TOTAL = REGISTRY.register(Counter(
+    'on_demand_requests_total', 'On-demand scrape requests by outcome', ['outcome']
+))
+WORKER_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'on_demand_queue_depth', 'Jobs waiting on the on-demand worker', ['priority']
+))
+
+
+class ScrapeJob:
+    __slots__ = ('asin', 'priority', 'future', 'enqueued', 'started', 'waiters')
+
+    def __init__(self, asin, priority):
+        self.asin = asin
+        self.priority = priority
+        self.future = Future()
+        self.enqueued = time.monotonic()
+        self.started = None
+        self.waiters = 1
+
+    def status(self):
+        if self.future.done():
+            return 'failed' if self.future.exception() else 'done'
+        return 'running' if self.started else 'queued'
+
+
+def fetch_snapshot(asin, shard):
+    """The stored realtimedata row for asin in shard's partition, or None"""
+    conn = realtimedata.get_db_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT r.asin, r.title, r.price, r.rating, r.reviews_count, r.best_seller_rank,
+                       r.buybox_shipped_from, r.buybox_sold_by, r.buybox_price,
+                       {OFFERS_JSON_SQL} AS other_offers,
+                       r.last_updated, r.marketplace, r.zip_code
+                FROM realtimedata r
+                WHERE r.asin = %s AND r.marketplace = %s AND r.zip_code = %s
+            """, (asin, shard.marketplace, shard.zip_code))
+            row = cur.fetchone()
+            if not row:
+                return None
+            return dict(zip([c[0] for c in cur.description], row))
+    except Exception as e:
+        logger.error(f"Error reading snapshot for {asin}: {str(e)}")
+        return None
+    finally:
+        conn.close()
+
+
+class ScrapeWorker:
+    """Owns the single realtime browser and runs jobs from a two-level priority queue"""
+
+    def __init__(self, shard=None, max_on_demand_streak=5):
+        self.shard = shard or ShardConfig.default(job='realtime', base_url=realtimedata.AMAZON_BASE_URL)
+        self.max_on_demand_streak = max_on_demand_streak
+        self._queues = {PRIORITY_ON_DEMAND: deque(), PRIORITY_SCHEDULED: deque()}
+        self._jobs = {}
+        self._streak = 0
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name='on-demand-worker', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join(timeout=120)
+
+    def submit(self, asin, priority=PRIORITY_ON_DEMAND):
+        """Queue asin, or join the job already queued or running for it; returns the job"""
+        with self._cond:
+            job = self._jobs.get(asin)
+            if job:
+                job.waiters += 1
+                if priority < job.priority and job.started is None:
+                    # Promote: the stale low-priority entry is skipped when popped
+                    job.priority = priority
+                    self._queues[priority].append(job)
+                    self._cond.notify()
+                return job
+            job = ScrapeJob(asin, priority)
+            self._jobs[asin] = job
+            self._queues[priority].append(job)
+            self._update_depth()
+            self._cond.notify()
+            return job
+
+    def submit_many(self, asins, priority=PRIORITY_SCHEDULED):
+        for asin in asins:
+            self.submit(asin, priority)
+        logger.info(f"Queued {len(asins)} ASINs at priority {priority}")
+
+    def job(self, asin):
+        with self._cond:
+            return self._jobs.get(asin)
+
+    def _update_depth(self):
+        for priority, queue in self._queues.items():
+            WORKER_QUEUE_DEPTH.set(len(queue), priority=priority)
+
+    def _pop(self, level):
+        queue = self._queues[level]
+        while queue:
+            job = queue.popleft()
+            # Skip entries left behind by a promotion or an already finished job
+            if job.priority == level and job.started is None and self._jobs.get(job.asin) is job:
+                return job
+        return None
+
+    def _next_job(self):
+        with self._cond:
+            while not self._stop:
+                scheduled_waiting = any(
+                    j.priority == PRIORITY_SCHEDULED and j.started is None for j in self._queues[PRIORITY_SCHEDULED]
+                )
+                if self._streak >= self.max_on_demand_streak and scheduled_waiting:
+                    order = (PRIORITY_SCHEDULED, PRIORITY_ON_DEMAND)
+                else:
+                    order = (PRIORITY_ON_DEMAND, PRIORITY_SCHEDULED)
+                for level in order:
+                    job = self._pop(level)
+                    if job:
+                        self._streak = self._streak + 1 if level == PRIORITY_ON_DEMAND else 0
+                        job.started = time.monotonic()
+                        self._update_depth()
+                        return job
+                self._cond.wait(5)
+            return None
+
+    def _finish(self, job):
+        with self._cond:
+            if self._jobs.get(job.asin) is job:
+                del self._jobs[job.asin]
+
+    def _run(self):
+        scraper = realtimedata.RealtimeAmazonScraper(proxy_pool=self.shard.proxy_pool(), shard=self.shard)
+        completed = 0
+        try:
+            while True:
+                job = self._next_job()
+                if job is None:
+                    break
+                source = 'on_demand' if job.priority == PRIORITY_ON_DEMAND else 'scheduled'
+                logger.info(f"Scraping {job.asin} ({source}, waited {job.started - job.enqueued:.1f}s, "
+                            f"{job.waiters} waiting)")
+                with trace_asin(job.asin, scraper='realtime', source=source), \
+                        asin_context(job.asin, 'realtime', source=source):
+                    asin_started = time.perf_counter()
+                    try:
+                        product_data = scraper.scrape_product(job.asin)
+                        with span('db_write', rows=1):
+                            saved = scraper.save_to_database(product_data)
+                        if not saved:
+                            # Answering with data that is not in realtimedata would hide the lost write
+                            raise ScrapeFailure('error', 'scraped but not saved to realtimedata')
+                        record_asin('realtime', 'success', time.perf_counter() - asin_started)
+                        job.future.set_result(fetch_snapshot(job.asin, self.shard) or product_data)
+                    except Exception as e:
+                        record_asin('realtime', 'failed', time.perf_counter() - asin_started)
+                        logger.warning(f"On-demand scrape of {job.asin} failed: {str(e)}")
+                        job.future.set_exception(e)
+                    finally:
+                        self._finish(job)
+                scraper.recycle_if_needed()
+                completed += 1
+                if completed % 50 == 0:
+                    scraper.selectors.save()
+        finally:
+            scraper.selectors.save()
+            scraper.close()
+
+
+class OnDemandService:
+    def __init__(self, worker, freshness=900, caller_rate_per_minute=6, caller_burst=3):
+        """
+        :param worker: ScrapeWorker the jobs run on
+        :param freshness: Default max_age in seconds for returning the stored snapshot
+        :param caller_rate_per_minute: Scrapes each caller may trigger per minute
+        :param caller_burst: Scrapes a caller may trigger back to back
+        """
+        self.worker = worker
+        self.freshness = freshness
+        self.caller_rate = caller_rate_per_minute
+        self.caller_burst = caller_burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, caller):
+        with self._lock:
+            bucket = self._buckets.get(caller)
+            if bucket is None:
+                bucket = self._buckets[caller] = TokenBucket(self.caller_rate, self.caller_burst)
+            return bucket
+
+    def lookup(self, asin, caller, max_age=None, wait=60):
+        """Returns (HTTP status, payload, extra headers)"""
+        max_age = self.freshness if max_age is None else max_age
+        snapshot = fetch_snapshot(asin, self.worker.shard)
+        if snapshot and snapshot['last_updated']:
+            age = (datetime.now() - snapshot['last_updated']).total_seconds()
+            if age <= max_age:
+                ON_DEMAND_REQUESTS_TOTAL.inc(outcome='fresh')
+                return 200, {'asin': asin, 'source': 'stored', 'age_seconds': round(age), 'data': snapshot}, {}
+
+        # Joining an on-demand job that is already queued or running costs the caller nothing;
+        # starting one, or promoting a scheduled one, takes a token
+        job = self.worker.job(asin)
+        if job is None or (job.started is None and job.priority != PRIORITY_ON_DEMAND):
+            retry_after = self._bucket(caller).try_take()
+            if retry_after:
+                ON_DEMAND_REQUESTS_TOTAL.inc(outcome='rate_limited')
+                return 429, {'error': f'Rate limit exceeded for {caller}'}, {'Retry-After': str(int(retry_after) + 1)}
+            ON_DEMAND_REQUESTS_TOTAL.inc(outcome='queued')
+        else:
+            ON_DEMAND_REQUESTS_TOTAL.inc(outcome='coalesced')
+        job = self.worker.submit(asin, PRIORITY_ON_DEMAND)
+
+        try:
+            data = job.future.result(timeout=wait)
+        except FutureTimeout:
+            return 202, {'asin': asin, 'status': job.status(), 'waiters': job.waiters}, {}
+        except ScrapeFailure as e:
+            return 502, {'asin': asin, 'error': str(e), 'category': e.category, 'stale': snapshot}, {}
+        except Exception as e:
+            return 502, {'asin': asin, 'error': str(e), 'stale': snapshot}, {}
+        return 200, {'asin': asin, 'source': 'scraped', 'age_seconds': 0, 'data': data}, {}
+
+
+class _OnDemandHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(_jsonable(payload), sort_keys=True).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [p for p in url.path.split('/') if p]
+        if len(parts) != 2 or parts[0] != 'scrape' or not ASIN_PATTERN.match(parts[1].upper()):
+            self._send_json(404, {'error': 'Use /scrape/<asin>'})
+            return
+        caller = self.headers.get('X-Caller') or self.client_address[0]
+        try:
+            max_age = int(query['max_age'][0]) if 'max_age' in query else None
+            wait = min(300.0, max(0.0, float(query.get('wait', ['60'])[0])))
+        except ValueError:
+            self._send_json(400, {'error': 'max_age and wait must be numbers'})
+            return
+        status, payload, headers = self.server.service.lookup(parts[1].upper(), caller, max_age, wait)
+        self._send_json(status, payload, headers)
+
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip('/') != '/schedule':
+            self._send_json(404, {'error': 'Not found'})
+            return
+        asins = realtimedata.get_asins_from_excel(self.server.excel_file)
+        self.server.service.worker.submit_many(asins)
+        self._send_json(202, {'queued': len(asins)})
+
+
+def start_on_demand_api(service, port=8090, host='127.0.0.1', excel_file='cleaned_asin.xlsx'):
+    server = ThreadingHTTPServer((host, port), _OnDemandHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.excel_file = excel_file
+    threading.Thread(target=server.serve_forever, name='on-demand-api', daemon=True).start()
+    logger.info(f"On-demand scrape API listening on http://{host}:{port}")
+    return server
+
+
+def main():
+    import schedule
+
+    parser = argparse.ArgumentParser(description='On-demand single-ASIN scrape API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--freshness', type=int, default=900, help='Default max_age in seconds')
+    parser.add_argument('--caller-rate', type=float, default=6, help='Scrapes per minute per caller')
+    parser.add_argument('--excel-file', default='cleaned_asin.xlsx')
+    parser.add_argument('--schedule', action='store_true',
+                        help='Queue the whole list at low priority every day at 03:00')
+    args = parser.parse_args()
+
+    realtimedata.create_realtimedata_table()
+    worker = ScrapeWorker().start()
+    service = OnDemandService(worker, freshness=args.freshness, caller_rate_per_minute=args.caller_rate)
+    server = start_on_demand_api(service, args.port, args.host, args.excel_file)
+
+    if args.schedule:
+        schedule.every().day.at("03:00").do(
+            lambda: worker.submit_many(realtimedata.get_asins_from_excel(args.excel_file))
+        )
+    try:
+        while True:
+            schedule.run_pending()
+            time.sleep(30)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        worker.stop()
+
+
+if __name__ == '__main__':
+    main()
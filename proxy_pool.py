@@ -0,0 +1,326 @@
+"""
+Proxy pool for the Amazon scrapers.
+
+Proxies are handed out as leases to browser workers (Chrome --proxy-server)
+and HTTP sessions. Each proxy is scored on its recent captcha rate, error rate
+and latency; proxies that go bad are rested for a while and evicted after
+repeated rests. A token bucket per proxy enforces its request rate and a
+per-proxy concurrency limit caps how many workers share it.
+
+Proxies come from SCRAPER_PROXIES (comma separated) or a file with one proxy
+URL per line (SCRAPER_PROXY_FILE, default proxies.txt):
+
+    pool = ProxyPool.from_env()
+    with pool.acquire() as lease:
+        lease.throttle()
+        driver.get(url)
+        lease.report('ok', latency=1.4)
+
+    python proxy_pool.py check --url http://127.0.0.1:8808/
+"""
+import logging
+import os
+import threading
+import time
+import urllib.request
+from collections import deque
+from urllib.parse import urlparse
+
+from scraper_metrics import REGISTRY, Counter, Gauge
+
+logger = logging.getLogger("ProxyPool")
+
+PROXY_REQUESTS_TOTAL = REGISTRY.register(Counter(
+    'scraper_proxy_requests_total', 'Requests per proxy by outcome', ['proxy', 'outcome']
+))
+PROXY_SCORE = REGISTRY.register(Gauge(
+    'scraper_proxy_score', 'Current health score per proxy (1 is best)', ['proxy']
+))
+PROXY_STATE = REGISTRY.register(Gauge(
+    'scraper_proxy_state', 'Proxy state: 1 active, 0 resting, -1 evicted', ['proxy']
+))
+
+OUTCOMES = ('ok', 'captcha', 'error', 'blocked')
+
+
+class NoProxyAvailable(Exception):
+    pass
+
+
+class TokenBucket:
+    """Classic token bucket; take() blocks until a token is available"""
+
+    def __init__(self, rate_per_minute, burst=1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self):
+        """Take a token if one is available; otherwise return seconds until one is"""
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate if self.rate > 0 else float('inf')
+
+    def take(self):
+        while True:
+            wait = self.try_take()
+            if wait == 0.0:
+                return
+            time.sleep(min(wait, 5.0))
+
+
+class Proxy:
+    def __init__(self, url, requests_per_minute, burst, window):
+        self.url = url if '://' in url else f"http://{url}"
+        parsed = urlparse(self.url)
+        # Label without credentials for logs and metrics
+        self.label = f"{parsed.hostname}:{parsed.port}" if parsed.port else parsed.hostname
+        self.bucket = TokenBucket(requests_per_minute, burst)
+        self.outcomes = deque(maxlen=window)
+        self.latency = None
+        self.in_flight = 0
+        self.state = 'active'
+        self.rest_until = 0.0
+        self.rests = 0
+        self.consecutive_errors = 0
+
+    @property
+    def chrome_argument(self):
+        """Chrome cannot take credentials on the command line, so only scheme://host:port is passed"""
+        parsed = urlparse(self.url)
+        return f"--proxy-server={parsed.scheme}://{parsed.hostname}:{parsed.port}"
+
+    @property
+    def requests_proxies(self):
+        return {'http': self.url, 'https': self.url}
+
+    def rate(self, outcome):
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for o in self.outcomes if o == outcome) / len(self.outcomes)
+
+    def score(self, latency_target):
+        """1.0 for a perfect proxy, approaching 0 as captchas, errors and latency grow"""
+        captcha_rate = self.rate('captcha') + self.rate('blocked')
+        error_rate = self.rate('error')
+        latency_penalty = 0.0
+        if self.latency and latency_target:
+            latency_penalty = min(1.0, max(0.0, self.latency / latency_target - 1.0))
+        return max(0.0, 1.0 - 0.6 * captcha_rate - 0.3 * error_rate - 0.1 * latency_penalty)
+
+
+class ProxyLease:
+    """One worker's hold on a proxy; release it (or use as a context manager) when done"""
+
+    def __init__(self, pool, proxy):
+        self.pool = pool
+        self.proxy = proxy
+        self.released = False
+
+    @property
+    def usable(self):
+        return not self.released and self.proxy.state == 'active'
+
+    def throttle(self):
+        """Block until the proxy's request rate allows another request"""
+        self.proxy.bucket.take()
+
+    def report(self, outcome, latency=None):
+        self.pool.report(self.proxy, outcome, latency)
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.pool.release(self.proxy)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+class ProxyPool:
+    def __init__(self, proxy_urls, max_concurrency=1, requests_per_minute=20, burst=2,
+                 window=50, min_samples=10, rest_threshold=0.25, max_consecutive_errors=3,
+                 rest_seconds=600, max_rests=3, latency_target=8.0):
+        """
+        :param proxy_urls: Proxy URLs (scheme://[user:pass@]host:port or host:port)
+        :param max_concurrency: Workers allowed to share one proxy at the same time
+        :param requests_per_minute: Request rate enforced per proxy
+        :param burst: Requests a proxy may make back to back after idling
+        :param window: Number of recent outcomes used for scoring
+        :param min_samples: Outcomes needed before the captcha rate can rest a proxy
+        :param rest_threshold: Captcha/block rate above which a proxy is rested
+        :param max_consecutive_errors: Consecutive errors that rest a proxy
+        :param rest_seconds: Initial rest duration, doubled on each further rest
+        :param max_rests: Rests after which a proxy is evicted for the rest of the process
+        :param latency_target: Page latency in seconds considered healthy
+        """
+        self.max_concurrency = max_concurrency
+        self.min_samples = min_samples
+        self.rest_threshold = rest_threshold
+        self.max_consecutive_errors = max_consecutive_errors
+        self.rest_seconds = rest_seconds
+        self.max_rests = max_rests
+        self.latency_target = latency_target
+        self.proxies = [Proxy(url, requests_per_minute, burst, window) for url in proxy_urls]
+        self._cond = threading.Condition()
+        for proxy in self.proxies:
+            PROXY_STATE.set(1, proxy=proxy.label)
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """Build a pool from SCRAPER_PROXIES or the proxy file; returns None if none configured"""
+        urls = [u.strip() for u in os.getenv('SCRAPER_PROXIES', '').split(',') if u.strip()]
+        proxy_file = os.getenv('SCRAPER_PROXY_FILE', 'proxies.txt')
+        if not urls and os.path.exists(proxy_file):
+            with open(proxy_file) as f:
+                urls = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        if not urls:
+            return None
+        logger.info(f"Loaded {len(urls)} proxies")
+        return cls(urls, **kwargs)
+
+    def _wake_rested(self, now):
+        for proxy in self.proxies:
+            if proxy.state == 'resting' and now >= proxy.rest_until:
+                proxy.state = 'active'
+                proxy.outcomes.clear()
+                proxy.consecutive_errors = 0
+                PROXY_STATE.set(1, proxy=proxy.label)
+                logger.info(f"Proxy {proxy.label} back in rotation after rest")
+
+    def acquire(self, timeout=None):
+        """Lease the healthiest proxy with spare concurrency; blocks until one frees up"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._wake_rested(now)
+                candidates = [
+                    p for p in self.proxies
+                    if p.state == 'active' and p.in_flight < self.max_concurrency
+                ]
+                if candidates:
+                    proxy = max(candidates, key=lambda p: (p.score(self.latency_target), -p.in_flight))
+                    proxy.in_flight += 1
+                    return ProxyLease(self, proxy)
+                if all(p.state == 'evicted' for p in self.proxies):
+                    raise NoProxyAvailable("All proxies have been evicted")
+                wait = 5.0
+                resting = [p.rest_until - now for p in self.proxies if p.state == 'resting']
+                if resting:
+                    wait = max(0.1, min(wait, min(resting)))
+                if deadline is not None:
+                    if now >= deadline:
+                        raise NoProxyAvailable("Timed out waiting for a proxy")
+                    wait = min(wait, deadline - now)
+                self._cond.wait(wait)
+
+    def release(self, proxy):
+        with self._cond:
+            proxy.in_flight = max(0, proxy.in_flight - 1)
+            self._cond.notify_all()
+
+    def report(self, proxy, outcome, latency=None):
+        if outcome not in OUTCOMES:
+            raise ValueError(f"Unknown proxy outcome: {outcome}")
+        PROXY_REQUESTS_TOTAL.inc(proxy=proxy.label, outcome=outcome)
+        with self._cond:
+            proxy.outcomes.append(outcome)
+            if latency is not None:
+                proxy.latency = latency if proxy.latency is None else proxy.latency * 0.8 + latency * 0.2
+            proxy.consecutive_errors = proxy.consecutive_errors + 1 if outcome == 'error' else 0
+            score = proxy.score(self.latency_target)
+            PROXY_SCORE.set(round(score, 3), proxy=proxy.label)
+
+            bad_captcha_rate = (
+                len(proxy.outcomes) >= self.min_samples
+                and proxy.rate('captcha') + proxy.rate('blocked') > self.rest_threshold
+            )
+            if proxy.state == 'active' and (
+                outcome == 'blocked' or bad_captcha_rate
+                or proxy.consecutive_errors >= self.max_consecutive_errors
+            ):
+                self._rest(proxy)
+
+    def _rest(self, proxy):
+        proxy.rests += 1
+        if proxy.rests > self.max_rests:
+            proxy.state = 'evicted'
+            PROXY_STATE.set(-1, proxy=proxy.label)
+            logger.warning(f"Proxy {proxy.label} evicted after {proxy.rests - 1} rests")
+            return
+        duration = self.rest_seconds * 2 ** (proxy.rests - 1)
+        proxy.state = 'resting'
+        proxy.rest_until = time.monotonic() + duration
+        PROXY_STATE.set(0, proxy=proxy.label)
+        logger.warning(
+            f"Proxy {proxy.label} resting for {duration:.0f}s "
+            f"(captcha {proxy.rate('captcha'):.0%}, errors {proxy.rate('error'):.0%}, "
+            f"latency {proxy.latency or 0:.1f}s)"
+        )
+
+    def check(self, test_url, timeout=10):
+        """Fetch test_url through every proxy and report the outcome; returns {label: (ok, seconds)}"""
+        results = {}
+        for proxy in self.proxies:
+            opener = urllib.request.build_opener(urllib.request.ProxyHandler(proxy.requests_proxies))
+            started = time.monotonic()
+            try:
+                with opener.open(test_url, timeout=timeout) as response:
+                    body = response.read()
+                latency = time.monotonic() - started
+                outcome = 'captcha' if b'Type the characters you see in this image' in body else 'ok'
+                self.report(proxy, outcome, latency)
+                results[proxy.label] = (outcome == 'ok', round(latency, 3))
+            except Exception as e:
+                self.report(proxy, 'error')
+                results[proxy.label] = (False, str(e))
+        return results
+
+    def snapshot(self):
+        with self._cond:
+            return [
+                {
+                    'proxy': p.label,
+                    'state': p.state,
+                    'score': round(p.score(self.latency_target), 3),
+                    'in_flight': p.in_flight,
+                    'captcha_rate': round(p.rate('captcha'), 3),
+                    'error_rate': round(p.rate('error'), 3),
+                    'latency': round(p.latency, 3) if p.latency else None,
+                    'rests': p.rests
+                }
+                for p in self.proxies
+            ]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Proxy pool tools')
+    sub = parser.add_subparsers(dest='command', required=True)
+    check_parser = sub.add_parser('check', help='Fetch a URL through every configured proxy')
+    check_parser.add_argument('--url', default='https://www.amazon.com/')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    pool = ProxyPool.from_env()
+    if not pool:
+        print("No proxies configured (set SCRAPER_PROXIES or create proxies.txt)")
+    else:
+        for label, (ok, detail) in pool.check(args.url).items():
+            print(f"{'OK  ' if ok else 'FAIL'} {label}: {detail}")
@@ -0,0 +1,424 @@
+"""
+Cached read API for the latest product snapshots.
+
+Dashboards used to query realtimedata directly for every view. This service
+answers them from an in-process cache instead, so read traffic no longer
+competes with the scrapers for connections and row locks:
+
+    GET /products/<asin>                    latest realtimedata snapshot
+    GET /products?asins=A,B,C               bulk lookup, misses fetched in one query
+    GET /products/<asin>/history?days=30    recent daily_amazon_data rows
+    GET /health
+
+All product routes accept marketplace and zip_code query parameters (default
+US/11229). Entries expire after a TTL and the least recently used are evicted
+beyond max_entries. Responses carry an ETag and honour If-None-Match. The
+scrapers NOTIFY on every write and a listener thread evicts the affected ASINs
+immediately, so the TTL only bounds staleness if a notification is missed.
+
+Database reads go through a small pool of read-only autocommit connections
+with a statement timeout, so a burst of dashboard traffic cannot hold locks
+or exhaust the server's connections:
+
+    python read_api.py --port 8080
+"""
+import argparse
+import hashlib
+import json
+import logging
+import re
+import select
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from scraper_metrics import REGISTRY, Counter
+
+logger = logging.getLogger("ReadAPI")
+
+# Channels the scrapers NOTIFY on after committing writes; the payload is a comma separated list of ASINs
+REALTIME_CHANNEL = 'realtimedata_changed'
+DAILY_CHANNEL = 'daily_amazon_data_changed'
+
+# A realtimedata row's offers (alias r) from product_offers as a JSON array, in page order
+OFFERS_JSON_SQL = """
+    (SELECT COALESCE(json_agg(json_build_object(
+                'type', o.offer_type, 'seller_name', s.seller_name, 'shipped_from', o.ships_from,
+                'price', o.price, 'is_fba', o.is_fba) ORDER BY o.position), '[]'::json)
+     FROM product_offers o LEFT JOIN sellers s ON s.seller_id = o.seller_id
+     WHERE o.asin = r.asin AND o.marketplace = r.marketplace AND o.zip_code = r.zip_code)
+"""
+
+# Postgres caps NOTIFY payloads at 8000 bytes
+_MAX_PAYLOAD = 7900
+
+CACHE_REQUESTS_TOTAL = REGISTRY.register(Counter(
+    'read_api_cache_requests_total', 'Read API cache lookups', ['kind', 'result']
+))
+CACHE_INVALIDATIONS_TOTAL = REGISTRY.register(Counter(
+    'read_api_cache_invalidations_total', 'Cache entries evicted by scraper writes', ['channel']
+))
+
+ASIN_PATTERN = re.compile(r'^[A-Z0-9]{10}$')
+MAX_BULK = 100
+MAX_HISTORY_DAYS = 90
+
+
+def notify_changed(cur, channel, asins):
+    """
+    Queue a change notification on the scraper's own cursor; Postgres delivers
+    it when the surrounding transaction commits.
+    """
+    payload = []
+    size = 0
+    for asin in asins:
+        if payload and size + len(asin) + 1 > _MAX_PAYLOAD:
+            cur.execute("SELECT pg_notify(%s, %s)", (channel, ','.join(payload)))
+            payload, size = [], 0
+        payload.append(asin)
+        size += len(asin) + 1
+    if payload:
+        cur.execute("SELECT pg_notify(%s, %s)", (channel, ','.join(payload)))
+
+
+class TTLCache:
+    """Thread-safe LRU cache with a per-entry TTL and eviction by ASIN"""
+
+    def __init__(self, max_entries=5000, ttl=60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._by_asin = {}
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so a read that raced a write is not cached
+        self.generation = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, generation=None):
+        """
+        Store value under key; key[1] is the tuple of ASINs the entry depends on.
+        Skipped if anything was invalidated since generation was read.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            for asin in key[1]:
+                self._by_asin.setdefault(asin, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        for asin in key[1]:
+            keys = self._by_asin.get(asin)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_asin[asin]
+
+    def invalidate(self, asins):
+        """Drop every entry involving any of asins; returns the number dropped"""
+        dropped = 0
+        with self._lock:
+            self.generation += 1
+            for asin in asins:
+                for key in list(self._by_asin.get(asin, ())):
+                    self._remove(key)
+                    dropped += 1
+        return dropped
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._by_asin.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class ReadOnlyPool:
+    """A few read-only autocommit connections; callers wait for a free one instead of opening more"""
+
+    def __init__(self, db_params, size=4, statement_timeout_ms=5000):
+        import psycopg2.pool
+
+        self._pool = psycopg2.pool.ThreadedConnectionPool(
+            1, size, options=f"-c statement_timeout={statement_timeout_ms}", **db_params
+        )
+        self._slots = threading.BoundedSemaphore(size)
+
+    def query(self, sql, params):
+        with self._slots:
+            conn = self._pool.getconn()
+            try:
+                if not conn.autocommit:
+                    conn.set_session(readonly=True, autocommit=True)
+                with conn.cursor() as cur:
+                    cur.execute(sql, params)
+                    columns = [c[0] for c in cur.description]
+                    return [dict(zip(columns, row)) for row in cur.fetchall()]
+            except Exception:
+                self._pool.putconn(conn, close=True)
+                conn = None
+                raise
+            finally:
+                if conn is not None:
+                    self._pool.putconn(conn)
+
+    def close(self):
+        self._pool.closeall()
+
+
+def _jsonable(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_jsonable(v) for v in value]
+    return value
+
+
+def _row(row):
+    return {key: _jsonable(value) for key, value in row.items()}
+
+
+class ProductReader:
+    """Cached lookups against realtimedata (latest) and daily_amazon_data (history)"""
+
+    def __init__(self, realtime_db, daily_db, ttl=60.0, max_entries=5000, pool_size=4):
+        self.cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self.realtime = ReadOnlyPool(realtime_db, size=pool_size)
+        self.daily = ReadOnlyPool(daily_db, size=pool_size)
+
+    def latest(self, asins, marketplace, zip_code):
+        """{asin: snapshot or None}; only cache misses reach the database"""
+        found, missing = {}, []
+        for asin in asins:
+            cached = self.cache.get(('latest', (asin,), marketplace, zip_code))
+            if cached is not None:
+                found[asin] = cached['value']
+                CACHE_REQUESTS_TOTAL.inc(kind='latest', result='hit')
+            else:
+                missing.append(asin)
+                CACHE_REQUESTS_TOTAL.inc(kind='latest', result='miss')
+        if missing:
+            generation = self.cache.generation
+            rows = self.realtime.query(f"""
+                SELECT r.asin, r.title, r.price, r.rating, r.reviews_count, r.best_seller_rank,
+                       r.buybox_shipped_from, r.buybox_sold_by, r.buybox_price,
+                       {OFFERS_JSON_SQL} AS other_offers,
+                       r.last_updated, r.marketplace, r.zip_code
+                FROM realtimedata r
+                WHERE r.asin = ANY(%s) AND r.marketplace = %s AND r.zip_code = %s
+            """, (missing, marketplace, zip_code))
+            by_asin = {row['asin']: _row(row) for row in rows}
+            for asin in missing:
+                # Unknown ASINs are cached too, so repeated misses do not reach the database
+                value = by_asin.get(asin)
+                self.cache.put(('latest', (asin,), marketplace, zip_code), {'value': value}, generation)
+                found[asin] = value
+        return {asin: found[asin] for asin in asins}
+
+    def history(self, asin, days, marketplace, zip_code):
+        key = ('history', (asin,), marketplace, zip_code, days)
+        cached = self.cache.get(key)
+        if cached is not None:
+            CACHE_REQUESTS_TOTAL.inc(kind='history', result='hit')
+            return cached
+        CACHE_REQUESTS_TOTAL.inc(kind='history', result='miss')
+        generation = self.cache.generation
+        rows = self.daily.query("""
+            SELECT scan_date, price, minimum_price, offers, best_seller_rank
+            FROM daily_amazon_data
+            WHERE asin = %s AND marketplace = %s AND zip_code = %s
+              AND scan_date >= CURRENT_DATE - %s
+            ORDER BY scan_date DESC
+        """, (asin, marketplace, zip_code, days))
+        history = [_row(row) for row in rows]
+        self.cache.put(key, history, generation)
+        return history
+
+    def close(self):
+        self.realtime.close()
+        self.daily.close()
+
+
+class InvalidationListener:
+    """LISTENs on the scraper change channels and evicts the notified ASINs from the cache"""
+
+    def __init__(self, cache, sources):
+        """
+        :param cache: TTLCache to evict from
+        :param sources: [(db_params, channel)] to listen on
+        """
+        self.cache = cache
+        self.sources = sources
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for db_params, channel in self.sources:
+            thread = threading.Thread(
+                target=self._listen, args=(db_params, channel), name=f'listen-{channel}', daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _listen(self, db_params, channel):
+        import psycopg2
+
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**db_params)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {channel}")
+                logger.info(f"Listening for {channel}")
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 5)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            notify = conn.notifies.pop(0)
+                            asins = [a for a in notify.payload.split(',') if a]
+                            dropped = self.cache.invalidate(asins)
+                            CACHE_INVALIDATIONS_TOTAL.inc(dropped, channel=channel)
+            except Exception as e:
+                # Notifications sent while disconnected are lost, so start from an empty cache
+                logger.error(f"Listener for {channel} failed, clearing cache and reconnecting: {str(e)}")
+                self.cache.clear()
+                self._stop.wait(5)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+def _etag(body):
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+class _ReadHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, sort_keys=True).encode('utf-8')
+        etag = _etag(body)
+        if status == 200 and etag in self.headers.get('If-None-Match', ''):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 200:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', f"max-age={int(self.server.reader.cache.ttl)}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        marketplace = query.get('marketplace', ['US'])[0].upper()
+        zip_code = query.get('zip_code', ['11229'])[0]
+        parts = [p for p in url.path.split('/') if p]
+        reader = self.server.reader
+        try:
+            if parts == ['health']:
+                self._send_json(200, {'status': 'ok', 'cached_entries': len(reader.cache)})
+            elif parts == ['products']:
+                asins = [a.strip().upper() for a in ','.join(query.get('asins', [])).split(',') if a.strip()]
+                if not asins or len(asins) > MAX_BULK or not all(ASIN_PATTERN.match(a) for a in asins):
+                    self._send_json(400, {'error': f'asins must list 1 to {MAX_BULK} ASINs'})
+                    return
+                self._send_json(200, {'products': reader.latest(asins, marketplace, zip_code)})
+            elif len(parts) in (2, 3) and parts[0] == 'products' and ASIN_PATTERN.match(parts[1].upper()):
+                asin = parts[1].upper()
+                if len(parts) == 2:
+                    snapshot = reader.latest([asin], marketplace, zip_code)[asin]
+                    if snapshot is None:
+                        self._send_json(404, {'error': f'No snapshot for {asin}'})
+                    else:
+                        self._send_json(200, snapshot)
+                elif parts[2] == 'history':
+                    days = min(MAX_HISTORY_DAYS, max(1, int(query.get('days', ['30'])[0])))
+                    self._send_json(200, {'asin': asin, 'history': reader.history(asin, days, marketplace, zip_code)})
+                else:
+                    self._send_json(404, {'error': 'Not found'})
+            else:
+                self._send_json(404, {'error': 'Not found'})
+        except ValueError:
+            self._send_json(400, {'error': 'Invalid parameter'})
+        except Exception as e:
+            logger.error(f"Error serving {self.path}: {str(e)}")
+            self._send_json(503, {'error': 'Database unavailable'})
+
+
+def start_read_api(reader, port=8080, host='127.0.0.1'):
+    """Serve reader on a daemon thread; returns the server"""
+    server = ThreadingHTTPServer((host, port), _ReadHandler)
+    server.daemon_threads = True
+    server.reader = reader
+    threading.Thread(target=server.serve_forever, name='read-api', daemon=True).start()
+    logger.info(f"Read API listening on http://{host}:{port}")
+    return server
+
+
+def main():
+    from history_export import DAILY_DB, REALTIME_DB
+
+    parser = argparse.ArgumentParser(description='Cached read API for product snapshots')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--ttl', type=float, default=60.0, help='Seconds a cached entry stays valid')
+    parser.add_argument('--max-entries', type=int, default=5000, help='Cached entries kept before LRU eviction')
+    parser.add_argument('--pool-size', type=int, default=4, help='Read connections per database')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    reader = ProductReader(REALTIME_DB, DAILY_DB, ttl=args.ttl, max_entries=args.max_entries, pool_size=args.pool_size)
+    listener = InvalidationListener(reader.cache, [(REALTIME_DB, REALTIME_CHANNEL), (DAILY_DB, DAILY_CHANNEL)]).start()
+    server = start_read_api(reader, args.port, args.host)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.stop()
+        server.shutdown()
+        reader.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -10,29 +10,66 @@ from selenium.common.exceptions import (
     WebDriverException
 )
 from twocaptcha import TwoCaptcha
-from undetected_chromedriver import Chrome as Driver
+from undetected_chromedriver import Chrome as Driver, ChromeOptions
 import time
 import random
+import tempfile
 import os
 import re
 import logging
 import psycopg2
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from psycopg2.extras import execute_values
 import schedule
-import json
+from scraper_metrics import (
+    PHASE_SECONDS, PAGES_TOTAL, CAPTCHAS_TOTAL, CAPTCHA_SOLVES_TOTAL,
+    RESTARTS_TOTAL, REGISTRY, Counter, record_asin, start_metrics_server
+)
+from scraper_tracing import configure_tracing, trace_asin, span
+from scraper_logging import configure_logging, asin_context
+from selector_registry import SelectorRegistry
+from marketplaces import ShardConfig
+from circuit_breaker import BREAKER, page_outcome
+from driver_watchdog import DriverWatchdog
+from read_api import REALTIME_CHANNEL, notify_changed
+from run_ledger import RunLedger, create_run_tables, start_worker
+from load_planner import LoadPlanner, create_cost_table
+from drift_detector import DriftDetector, REALTIME_FIELD_CEILINGS, REALTIME_FIELD_DEFAULTS
+from negative_cache import NegativeCache
+from retry_queue import (
+    RetryQueue, ScrapeFailure, classify_failure, create_dead_letter_table, save_dead_letters
+)
 
 # Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("amazon_realtime_scraper.log"),
-        logging.StreamHandler()
-    ]
-)
+configure_logging("amazon_realtime_scraper.log")
 logger = logging.getLogger("AmazonRealtimeScraper")
 
+# Storefront root; overridden by the benchmark suite to point at a local mock server
+AMAZON_BASE_URL = os.getenv('AMAZON_BASE_URL', 'https://www.amazon.com').rstrip('/')
+
+# Present on any usable product page; waited for once per page before field lookups
+PAGE_READY_XPATH = "//*[@id='productTitle'] | //*[@id='dp-container'] | //*[@id='centerCol']"
+
+# Present on any offers fragment that rendered, with or without other offers
+AOD_LOADED_XPATH = "//*[@id='aod-container'] | //*[@id='aod-pinned-offer'] | //*[@id='aod-offer-list']"
+
+# Legacy per-lookup wait, used to report how much waiting the page budget avoided
+LEGACY_ELEMENT_WAIT = 5
+
+# Tiered runs probe the offers fragment first and only load /dp/ when it changed
+# or the stored full snapshot is older than SCRAPER_MAX_FULL_AGE_HOURS
+TIERED_DEFAULT = os.getenv('SCRAPER_TIERED', '0') == '1'
+MAX_FULL_AGE_HOURS = float(os.getenv('SCRAPER_MAX_FULL_AGE_HOURS', '24'))
+
+# Hours a run is spread over by the load planner (0 scrapes as fast as pacing allows)
+WINDOW_HOURS = float(os.getenv('SCRAPER_WINDOW_HOURS', '0'))
+
+PROBES_TOTAL = REGISTRY.register(Counter(
+    'scraper_probes_total', 'Tiered change-detection probes by outcome', ['outcome']
+))
+
 # Database configuration
 DB_CONFIG = {
     'dbname': 'amazon.com',
@@ -42,6 +79,45 @@ DB_CONFIG = {
     'port': '5432'
 }
 
+def parse_price(text):
+    """'$1,299.99' -> Decimal('1299.99'); None for missing or 'Unknown'"""
+    if text is None:
+        return None
+    if isinstance(text, (int, float, Decimal)):
+        return Decimal(str(text)).quantize(Decimal('0.01'))
+    match = re.search(r'\d[\d,]*(?:\.\d+)?', text)
+    if not match:
+        return None
+    try:
+        return Decimal(match.group(0).replace(',', '')).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        return None
+
+def parse_rating(text):
+    """'4.5 out of 5 stars' -> Decimal('4.5')"""
+    match = re.search(r'\d+(?:\.\d+)?', text or '')
+    return Decimal(match.group(0)) if match else None
+
+def parse_count(text):
+    """'1,234 ratings' -> 1234"""
+    match = re.search(r'\d[\d,]*', text or '')
+    return int(match.group(0).replace(',', '')) if match else None
+
+def normalize_offer(offer):
+    """Typed form of a scraped offer, as stored in product_offers"""
+    seller = offer.get('seller_name')
+    ships_from = offer.get('shipped_from')
+    seller = None if seller in (None, '', 'Unknown') else seller.strip()
+    ships_from = None if ships_from in (None, '', 'Unknown') else ships_from.strip()
+    return {
+        'offer_type': offer.get('type') or offer.get('offer_type'),
+        'seller_name': seller,
+        'ships_from': ships_from,
+        'price': parse_price(offer.get('price')),
+        # Shipped from an Amazon warehouse means fulfilled by Amazon, whoever the seller is
+        'is_fba': bool(ships_from and ships_from.lower().startswith('amazon')),
+    }
+
 def get_db_connection():
     """Establish connection to PostgreSQL database"""
     try:
@@ -61,19 +137,111 @@ def create_realtimedata_table():
         with conn.cursor() as cursor:
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS realtimedata (
-                    asin VARCHAR(20) PRIMARY KEY,
+                    asin VARCHAR(20) NOT NULL,
                     title TEXT,
                     price DECIMAL(10,2),
-                    rating VARCHAR(20),
-                    reviews_count VARCHAR(50),
+                    rating DECIMAL(3,2),
+                    reviews_count INTEGER,
                     best_seller_rank TEXT,
                     buybox_shipped_from TEXT,
                     buybox_sold_by TEXT,
                     buybox_price DECIMAL(10,2),
-                    other_offers JSONB,
-                    last_updated TIMESTAMP
+                    last_updated TIMESTAMP,
+                    last_checked TIMESTAMP,
+                    marketplace VARCHAR(5) NOT NULL DEFAULT 'US',
+                    zip_code VARCHAR(12) NOT NULL DEFAULT '11229',
+                    PRIMARY KEY (asin, marketplace, zip_code)
                 )
             """)
+            
+            # Tables created before sharded runs were keyed on asin alone
+            cursor.execute("""
+                ALTER TABLE realtimedata
+                ADD COLUMN IF NOT EXISTS marketplace VARCHAR(5) NOT NULL DEFAULT 'US',
+                ADD COLUMN IF NOT EXISTS zip_code VARCHAR(12) NOT NULL DEFAULT '11229'
+            """)
+            # When a tiered run last confirmed the snapshot, full scrape or probe
+            cursor.execute("ALTER TABLE realtimedata ADD COLUMN IF NOT EXISTS last_checked TIMESTAMP")
+            cursor.execute("""
+                SELECT COUNT(*) FROM information_schema.key_column_usage
+                WHERE table_name = 'realtimedata' AND constraint_name = 'realtimedata_pkey'
+            """)
+            if cursor.fetchone()[0] == 1:
+                cursor.execute("ALTER TABLE realtimedata DROP CONSTRAINT realtimedata_pkey")
+                cursor.execute("ALTER TABLE realtimedata ADD PRIMARY KEY (asin, marketplace, zip_code)")
+                logger.info("realtimedata primary key extended to (asin, marketplace, zip_code)")
+            
+            # Offers live in their own typed table, with sellers as a dimension
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS sellers (
+                    seller_id SERIAL PRIMARY KEY,
+                    seller_name TEXT NOT NULL UNIQUE
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS product_offers (
+                    asin VARCHAR(20) NOT NULL,
+                    marketplace VARCHAR(5) NOT NULL DEFAULT 'US',
+                    zip_code VARCHAR(12) NOT NULL DEFAULT '11229',
+                    position SMALLINT NOT NULL,
+                    offer_type VARCHAR(40),
+                    seller_id INTEGER REFERENCES sellers (seller_id),
+                    ships_from TEXT,
+                    price DECIMAL(10,2),
+                    is_fba BOOLEAN NOT NULL DEFAULT FALSE,
+                    scraped_at TIMESTAMP NOT NULL,
+                    PRIMARY KEY (asin, marketplace, zip_code, position)
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_product_offers_seller ON product_offers (seller_id)")
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_product_offers_fba_price
+                ON product_offers (price) WHERE is_fba
+            """)
+            
+            # Tables from before the offers table kept offers as a JSONB blob and
+            # rating / review count as text; move them over once
+            cursor.execute("""
+                SELECT column_name, data_type FROM information_schema.columns
+                WHERE table_name = 'realtimedata' AND column_name IN ('other_offers', 'rating', 'reviews_count')
+            """)
+            legacy = dict(cursor.fetchall())
+            if 'other_offers' in legacy:
+                cursor.execute("""
+                    INSERT INTO sellers (seller_name)
+                    SELECT DISTINCT e.o->>'seller_name'
+                    FROM realtimedata r CROSS JOIN LATERAL jsonb_array_elements(r.other_offers) AS e(o)
+                    WHERE jsonb_typeof(r.other_offers) = 'array'
+                      AND COALESCE(e.o->>'seller_name', 'Unknown') <> 'Unknown'
+                    ON CONFLICT (seller_name) DO NOTHING
+                """)
+                cursor.execute("""
+                    INSERT INTO product_offers
+                    (asin, marketplace, zip_code, position, offer_type, seller_id, ships_from, price, is_fba, scraped_at)
+                    SELECT r.asin, r.marketplace, r.zip_code, e.ord, e.o->>'type', s.seller_id,
+                           NULLIF(e.o->>'shipped_from', 'Unknown'),
+                           CASE WHEN p.digits ~ '^[0-9]{1,8}([.][0-9]+)?$' THEN p.digits::numeric END,
+                           COALESCE(e.o->>'shipped_from', '') ILIKE 'amazon%',
+                           COALESCE(r.last_updated, NOW())
+                    FROM realtimedata r
+                    CROSS JOIN LATERAL jsonb_array_elements(r.other_offers) WITH ORDINALITY AS e(o, ord)
+                    CROSS JOIN LATERAL (SELECT regexp_replace(e.o->>'price', '[^0-9.]', '', 'g') AS digits) p
+                    LEFT JOIN sellers s ON s.seller_name = e.o->>'seller_name'
+                    WHERE jsonb_typeof(r.other_offers) = 'array'
+                    ON CONFLICT DO NOTHING
+                """)
+                cursor.execute("ALTER TABLE realtimedata DROP COLUMN other_offers")
+                logger.info("Moved realtimedata.other_offers into product_offers")
+            if legacy.get('rating') == 'character varying':
+                cursor.execute("""
+                    ALTER TABLE realtimedata ALTER COLUMN rating TYPE DECIMAL(3,2)
+                    USING NULLIF(substring(rating from '[0-9]+(?:[.][0-9]+)?'), '')::numeric
+                """)
+            if legacy.get('reviews_count') == 'character varying':
+                cursor.execute("""
+                    ALTER TABLE realtimedata ALTER COLUMN reviews_count TYPE INTEGER
+                    USING NULLIF(regexp_replace(substring(reviews_count from '[0-9][0-9,]*'), ',', '', 'g'), '')::integer
+                """)
             conn.commit()
             logger.info("realtimedata table created/verified successfully")
             return True
@@ -84,20 +252,56 @@ def create_realtimedata_table():
         conn.close()
 
 class RealtimeAmazonScraper:
-    def __init__(self):
+    def __init__(self, page_budget=25, ready_timeout=10, proxy_pool=None, shard=None):
         """
         Initialize the real-time scraper
+        
+        :param page_budget: Overall seconds allowed for waits on one product page
+        :param ready_timeout: Seconds to wait for a page to become ready
+        :param proxy_pool: Optional ProxyPool; each driver gets a proxy lease from it
+        :param shard: ShardConfig with the marketplace and delivery location (defaults to US/11229)
         """
         self.driver = None
+        self.shard = shard or ShardConfig.default(job='realtime', base_url=AMAZON_BASE_URL)
+        self.rate_limiter = self.shard.rate_limiter()
+        self.proxy_pool = proxy_pool
+        self.proxy_lease = None
+        self.page_budget = page_budget
+        self.ready_timeout = ready_timeout
+        self._page_deadline = 0.0
+        self._page_ready = False
+        self._page_stats = {'lookups': 0, 'absent': 0, 'waited': 0.0}
         self.solver = TwoCaptcha(os.getenv('APIKEY_2CAPTCHA', 'b6bf51f9305ea298f4f2e8946bf46773'))
         self.captcha_failures = 0
         self.max_captcha_failures = 3
+        self.selectors = SelectorRegistry('realtime', stats_file=f'selector_stats_{self.shard.name}.json')
+        # Watches the field default rates for a layout change
+        self.drift = DriftDetector('realtime', REALTIME_FIELD_DEFAULTS, ceilings=REALTIME_FIELD_CEILINGS,
+                                   shard=self.shard.name)
+        self.watchdog = DriverWatchdog('realtime')
+        self.drivers_started = 0
         
     def initialize_driver(self):
         """Initialize and configure the WebDriver"""
         try:
-            self.driver = Driver(uc=True)
-            logger.info("WebDriver initialized successfully")
+            if self.driver:
+                RESTARTS_TOTAL.inc(scraper='realtime')
+            if self.proxy_pool:
+                if self.proxy_lease:
+                    self.proxy_lease.release()
+                self.proxy_lease = self.proxy_pool.acquire()
+                options = ChromeOptions()
+                options.add_argument(self.proxy_lease.proxy.chrome_argument)
+                self.driver = Driver(uc=True, options=options)
+                logger.info(f"WebDriver initialized successfully through proxy {self.proxy_lease.proxy.label}")
+            else:
+                self.driver = Driver(uc=True)
+                logger.info("WebDriver initialized successfully")
+            self.watchdog.attach(self.driver)
+            self.drivers_started += 1
+            start_worker(
+                f"driver-{self.drivers_started}" + (f" via {self.proxy_lease.proxy.label}" if self.proxy_lease else '')
+            )
             self._setup_amazon_session()
             return True
         except Exception as e:
@@ -127,10 +331,16 @@ class RealtimeAmazonScraper:
                     
                     # Try to find and solve the captcha
                     captcha_image = self.driver.find_element(By.XPATH, "//form[@action='/errors/validateCaptcha']//img")
-                    captcha_image.screenshot("captcha.png")
-                    
-                    # Solve with 2Captcha
-                    result = self.solver.normal('captcha.png')
+                    # A file per solve, so shards running as threads never send each other's image
+                    with tempfile.NamedTemporaryFile(prefix='captcha_', suffix='.png', delete=False) as image:
+                        image_path = image.name
+                    try:
+                        captcha_image.screenshot(image_path)
+                        
+                        # Solve with 2Captcha
+                        result = self.solver.normal(image_path)
+                    finally:
+                        os.remove(image_path)
                     if not result.get("code"):
                         logger.error("Failed to get captcha solution code")
                         attempts += 1
@@ -175,7 +385,7 @@ class RealtimeAmazonScraper:
         """Setup Amazon session with proper location and cookies"""
         self._delete_all_cookies()
         
-        url = "https://www.amazon.com"
+        url = self.shard.base_url
         self.driver.get(url)
         
         # Short wait for initial page load
@@ -198,7 +408,7 @@ class RealtimeAmazonScraper:
             
             # Check and set location if needed
             location_text = location_element.text.strip()
-            if "11229" not in location_text:
+            if self.shard.zip_code not in location_text:
                 try:
                     # Accept cookies if present
                     try:
@@ -216,7 +426,7 @@ class RealtimeAmazonScraper:
                         EC.presence_of_element_located((By.XPATH, "//input[@id='GLUXZipUpdateInput']"))
                     )
                     zip_input.clear()
-                    zip_input.send_keys("11229")
+                    zip_input.send_keys(self.shard.zip_code)
                     
                     update_button = WebDriverWait(self.driver, 5).until(
                         EC.element_to_be_clickable((By.XPATH, "//span[@data-action='GLUXPostalUpdateAction']/input[@class='a-button-input']"))
@@ -234,106 +444,121 @@ class RealtimeAmazonScraper:
         time.sleep(2)
         logger.info("Amazon setup completed successfully")
 
-    def _safe_find_element(self, by, value, wait_time=5):
+    def _begin_page(self):
+        """Start the wait budget for a freshly loaded product page"""
+        self._page_deadline = time.monotonic() + self.page_budget
+        self._page_ready = False
+        self._page_stats = {'lookups': 0, 'absent': 0, 'waited': 0.0}
+
+    def _remaining(self, cap):
+        """Seconds left in the page budget, capped at cap"""
+        return max(0.0, min(cap, self._page_deadline - time.monotonic()))
+
+    def _wait_for_page_ready(self):
         """
-        Safely find an element with error handling and wait
+        Wait once for the product page to be usable. After this, element lookups
+        are immediate and an element that is not in the DOM is treated as absent.
+        """
+        if self._page_ready:
+            return
+        started = time.monotonic()
+        try:
+            WebDriverWait(self.driver, self._remaining(self.ready_timeout)).until(
+                lambda d: d.execute_script("return document.readyState") == "complete"
+                and d.find_elements(By.XPATH, PAGE_READY_XPATH)
+            )
+        except TimeoutException:
+            logger.debug("Page readiness not confirmed within budget, continuing with what has loaded")
+        except Exception as e:
+            logger.debug(f"Error waiting for page readiness: {str(e)}")
+        self._page_stats['waited'] += time.monotonic() - started
+        self._page_ready = True
+
+    def _safe_find_element(self, by, value, wait_time=0):
+        """
+        Safely find an element with error handling
+        
+        Lookups are immediate once the page is ready; wait_time is only for
+        content that appears after an interaction (e.g. the offers panel) and is
+        capped by what is left of the page budget.
         
         :param by: Selenium By method
         :param value: Selector value
-        :param wait_time: Time to wait for element
+        :param wait_time: Extra time to wait for late-loading content
         :return: Element text or None
         """
-        try:
-            element = WebDriverWait(self.driver, wait_time).until(
-                EC.presence_of_element_located((by, value))
-            )
-            return element.text
-        except (NoSuchElementException, TimeoutException):
-            logger.debug(f"Element not found: {by}, {value}")
+        elements = self._safe_find_elements(by, value, wait_time)
+        if not elements:
             return None
+        try:
+            return elements[0].text
         except Exception as e:
-            logger.debug(f"Error finding element {by}, {value}: {str(e)}")
+            logger.debug(f"Error reading element {by}, {value}: {str(e)}")
             return None
 
-    def _safe_find_elements(self, by, value, wait_time=5):
+    def _safe_find_elements(self, by, value, wait_time=0):
         """
-        Safely find multiple elements with error handling and wait
+        Safely find multiple elements with error handling
         
         :param by: Selenium By method
         :param value: Selector value
-        :param wait_time: Time to wait for elements
+        :param wait_time: Extra time to wait for late-loading content
         :return: List of elements or empty list
         """
+        self._wait_for_page_ready()
+        self._page_stats['lookups'] += 1
         try:
-            WebDriverWait(self.driver, wait_time).until(
-                EC.presence_of_element_located((by, value))
-            )
-            return self.driver.find_elements(by, value)
-        except (NoSuchElementException, TimeoutException):
-            logger.debug(f"Elements not found: {by}, {value}")
-            return []
+            elements = self.driver.find_elements(by, value)
+            timeout = self._remaining(wait_time)
+            if not elements and timeout > 0:
+                started = time.monotonic()
+                try:
+                    WebDriverWait(self.driver, timeout).until(
+                        EC.presence_of_element_located((by, value))
+                    )
+                    elements = self.driver.find_elements(by, value)
+                except TimeoutException:
+                    pass
+                self._page_stats['waited'] += time.monotonic() - started
+            if not elements:
+                self._page_stats['absent'] += 1
+                logger.debug(f"Elements not found: {by}, {value}")
+            return elements
         except Exception as e:
             logger.debug(f"Error finding elements {by}, {value}: {str(e)}")
             return []
 
+    def _read_selector(self, strategy):
+        """Read the raw text for a selector strategy, waiting for the element"""
+        text = self._safe_find_element(By.XPATH, strategy['xpath'])
+        if text and strategy.get('fraction_xpath'):
+            fraction = self._safe_find_element(By.XPATH, strategy['fraction_xpath'])
+            return f"{text}.{fraction}"
+        return text
+
     def _extract_price(self):
         """Extract current price with multiple fallback methods"""
         try:
-            # Try the standard price element first
-            try:
-                price_whole = self._safe_find_element(By.XPATH, "//span[@class='a-price-whole']")
-                price_fraction = self._safe_find_element(By.XPATH, "//span[@class='a-price-fraction']")
-                if price_whole:
-                    return f"{price_whole}.{price_fraction}"
-            except:
-                pass
-                
-            # Try alternative price elements
-            try:
-                price_element = self._safe_find_element(
-                    By.XPATH, "//*[@id='corePriceDisplay_desktop_feature_div']/div[1]/span/span[1]"
-                )
-                if price_element:
-                    return price_element.strip().replace('$', '')
-            except:
-                pass
-                
-            try:
-                price_element = self._safe_find_element(By.XPATH, "//span[@id='price_inside_buybox']")
-                if price_element:
-                    return price_element.strip().replace('$', '')
-            except:
-                pass
-                
-            return None
+            return self.selectors.extract(
+                'price', self._read_selector, lambda text: text.strip().replace('$', '')
+            )
         except Exception as e:
             logger.error(f"Error extracting price: {str(e)}")
             return None
 
     def _extract_best_seller_rank(self):
         """Extract best seller rank with multiple fallback methods"""
+        def parse(rank_section):
+            cleaned_rank = re.sub(r'<[^>]+>', '', rank_section).strip()
+            cleaned_rank = re.sub(r'\s*\([^)]*\)', '', cleaned_rank)
+            ranks = []
+            for rank in cleaned_rank.split('#'):
+                if rank.strip():
+                    ranks.append('#' + rank.strip())
+            return ', '.join(ranks).strip()
+
         try:
-            # Try multiple XPaths for best seller rank
-            for xpath in [
-                "//th[contains(text(), 'Best Sellers Rank')]/following-sibling::td",
-                "//span[contains(text(), 'Best Sellers Rank')]/following::span[1]",
-                "//*[contains(text(), 'Best Sellers Rank')]/.."
-            ]:
-                try:
-                    rank_section = self._safe_find_element(By.XPATH, xpath)
-                    if rank_section:
-                        cleaned_rank = re.sub(r'<[^>]+>', '', rank_section).strip()
-                        cleaned_rank = re.sub(r'\s*\([^)]*\)', '', cleaned_rank)
-                        ranks = []
-                        for rank in cleaned_rank.split('#'):
-                            if rank.strip():
-                                ranks.append('#' + rank.strip())
-                        best_seller_rank = ', '.join(ranks).strip()
-                        return best_seller_rank
-                except:
-                    continue
-            
-            return 'Not ranked'
+            return self.selectors.extract('best_seller_rank', self._read_selector, parse) or 'Not ranked'
         except Exception as e:
             logger.error(f"Error extracting best seller rank: {str(e)}")
             return 'Not ranked'
@@ -342,14 +567,8 @@ class RealtimeAmazonScraper:
         """Scrape BuyBox offer details"""
         try:
             buybox_data = {
-                'shipped_from': self._safe_find_element(
-                    By.XPATH, 
-                    "//div[@id='offer-display-features']//div[@id='fulfillerInfoFeature_feature_div']/div[2]"
-                ),
-                'sold_by': self._safe_find_element(
-                    By.XPATH, 
-                    "//div[@id='offer-display-features']//div[@id='merchantInfoFeature_feature_div']/div[2]"
-                ),
+                'shipped_from': self.selectors.extract('buybox_shipped_from', self._read_selector),
+                'sold_by': self.selectors.extract('buybox_sold_by', self._read_selector),
                 'price': product_data['price']
             }
             return buybox_data
@@ -357,6 +576,71 @@ class RealtimeAmazonScraper:
             logger.error(f"Error extracting BuyBox offer: {str(e)}")
             return None
 
+    def _parse_offers(self, offer_elements):
+        """Read type, ships-from, seller and price from aod-offer elements"""
+        offers = []
+        for offer in offer_elements:
+            try:
+                offer_type = "New"  # Default value
+                try:
+                    offer_type = offer.find_element(
+                        By.XPATH, 
+                        ".//div[@id='aod-offer-heading']/span"
+                    ).text
+                except:
+                    pass
+                
+                sold_from = "Unknown"
+                try:
+                    sold_from = offer.find_element(
+                        By.XPATH, 
+                        ".//div[@id='aod-offer-shipsFrom']/div/div/div[2]/span"
+                    ).text
+                except:
+                    pass
+                
+                seller_name = "Unknown"
+                try:
+                    seller_name = offer.find_element(
+                        By.XPATH, 
+                        ".//div[@id='aod-offer-soldBy']//a"
+                    ).text
+                except:
+                    try:
+                        seller_name = offer.find_element(
+                            By.XPATH, 
+                            ".//div[@id='aod-offer-soldBy']/div/div/div[2]/span"
+                        ).text
+                    except:
+                        pass
+                
+                seller_price = "Unknown"
+                try:
+                    sellerprice_whole = offer.find_element(
+                        By.XPATH, 
+                        ".//div[@id='aod-offer-price']//span[@class='a-price-whole']"
+                    ).text
+                    
+                    sellerprice_fraction = offer.find_element(
+                        By.XPATH, 
+                        ".//div[@id='aod-offer-price']//span[@class='a-price-fraction']"
+                    ).text
+                    
+                    seller_price = f"{sellerprice_whole}.{sellerprice_fraction}"
+                except:
+                    pass
+                
+                offers.append({
+                    'type': offer_type,
+                    'shipped_from': sold_from,
+                    'seller_name': seller_name,
+                    'price': seller_price
+                })
+            
+            except Exception as e:
+                logger.error(f"Error processing an offer: {str(e)}")
+        return offers
+
     def _scrape_other_offers(self):
         """Scrape other available offers"""
         try:
@@ -364,86 +648,27 @@ class RealtimeAmazonScraper:
             
             # Check if panel exists and can be clicked
             try:
-                panel = WebDriverWait(self.driver, 5).until(
-                    EC.element_to_be_clickable((
-                        By.XPATH, 
-                        "//div[@id='dynamic-aod-ingress-box']//a"
-                    ))
+                panels = self._safe_find_elements(By.XPATH, "//div[@id='dynamic-aod-ingress-box']//a")
+                if not panels:
+                    logger.info("No additional offers panel found")
+                    return other_offers
+                panel = WebDriverWait(self.driver, self._remaining(5)).until(
+                    EC.element_to_be_clickable(panels[0])
                 )
                 panel.click()
-                time.sleep(2)  # Wait for panel to load
             except (NoSuchElementException, TimeoutException, WebDriverException):
                 logger.info("No additional offers panel found or not clickable")
                 return other_offers
 
-            # Find available offers
+            # Find available offers once the panel has loaded them
             offers_available = self._safe_find_elements(
                 By.XPATH, 
-                "//div[@id='aod-offer-list']/div[@id='aod-offer']"
+                "//div[@id='aod-offer-list']/div[@id='aod-offer']",
+                wait_time=5
             )
             
             logger.info(f"Found {len(offers_available)} additional offers")
-
-            for offer in offers_available:
-                try:
-                    offer_type = "New"  # Default value
-                    try:
-                        offer_type = offer.find_element(
-                            By.XPATH, 
-                            ".//div[@id='aod-offer-heading']/span"
-                        ).text
-                    except:
-                        pass
-                    
-                    sold_from = "Unknown"
-                    try:
-                        sold_from = offer.find_element(
-                            By.XPATH, 
-                            ".//div[@id='aod-offer-shipsFrom']/div/div/div[2]/span"
-                        ).text
-                    except:
-                        pass
-                    
-                    seller_name = "Unknown"
-                    try:
-                        seller_name = offer.find_element(
-                            By.XPATH, 
-                            ".//div[@id='aod-offer-soldBy']//a"
-                        ).text
-                    except:
-                        try:
-                            seller_name = offer.find_element(
-                                By.XPATH, 
-                                ".//div[@id='aod-offer-soldBy']/div/div/div[2]/span"
-                            ).text
-                        except:
-                            pass
-                    
-                    seller_price = "Unknown"
-                    try:
-                        sellerprice_whole = offer.find_element(
-                            By.XPATH, 
-                            ".//div[@id='aod-offer-price']//span[@class='a-price-whole']"
-                        ).text
-                        
-                        sellerprice_fraction = offer.find_element(
-                            By.XPATH, 
-                            ".//div[@id='aod-offer-price']//span[@class='a-price-fraction']"
-                        ).text
-                        
-                        seller_price = f"{sellerprice_whole}.{sellerprice_fraction}"
-                    except:
-                        pass
-                    
-                    other_offers.append({
-                        'type': offer_type,
-                        'shipped_from': sold_from,
-                        'seller_name': seller_name,
-                        'price': seller_price
-                    })
-                
-                except Exception as e:
-                    logger.error(f"Error processing an offer: {str(e)}")
+            other_offers.extend(self._parse_offers(offers_available))
 
             return other_offers
 
@@ -451,89 +676,195 @@ class RealtimeAmazonScraper:
             logger.error(f"Error extracting other offers: {str(e)}")
             return []
 
-    def scrape_product(self, asin):
+    def probe_offers(self, asin):
         """
-        Scrape all product details for the specified ASIN
+        Cheap change-detection fetch of the offers fragment alone, without the
+        /dp/ render or the panel click. Returns (buybox, offers): the pinned
+        offer (None if the fragment has none) and the other offers, empty when
+        the fragment loaded without an offer list. Returns None if the probe
+        was inconclusive (captcha, error, fragment not loaded).
+        """
+        if self.driver and self.proxy_lease and not self.proxy_lease.usable:
+            self.close()
+            self.driver = None
+        if not self.driver and not self.initialize_driver():
+            return None
+        
+        BREAKER.before_request('realtime')
+        try:
+            if self.proxy_lease:
+                self.proxy_lease.throttle()
+            elif self.rate_limiter:
+                self.rate_limiter.take()
+            with PHASE_SECONDS.time(scraper='realtime', phase='probe'), span('probe'):
+                nav_started = time.perf_counter()
+                self.driver.get(f'{self.shard.base_url}/gp/aod/ajax?asin={asin}')
+                nav_seconds = time.perf_counter() - nav_started
+                PAGES_TOTAL.inc(scraper='realtime')
+                self.watchdog.page_loaded()
+                
+                page_source = self.driver.page_source
+                if "Type the characters you see in this image" in page_source:
+                    BREAKER.record('realtime', 'captcha')
+                    if self.proxy_lease:
+                        self.proxy_lease.report('captcha', nav_seconds)
+                    return None
+                if self.proxy_lease:
+                    self.proxy_lease.report('ok', nav_seconds)
+                # The fragment is plain markup, so look up directly instead of waiting for a product page
+                if not self.driver.find_elements(By.XPATH, AOD_LOADED_XPATH):
+                    BREAKER.record('realtime', page_outcome(page_source, False))
+                    return None
+                BREAKER.record('realtime', 'ok')
+                pinned = self._parse_offers(self.driver.find_elements(By.XPATH, "//div[@id='aod-pinned-offer']"))
+                # No offer list in a loaded fragment means the buy box is the only offer
+                offers = self._parse_offers(
+                    self.driver.find_elements(By.XPATH, "//div[@id='aod-offer-list']/div[@id='aod-offer']")
+                )
+                return (pinned[0] if pinned else None), offers
+        except Exception as e:
+            logger.warning(f"Probe failed for ASIN {asin}: {str(e)}")
+            BREAKER.record('realtime', 'error')
+            return None
+
+    def scrape_product(self, asin, attempt=1):
+        """
+        Make one attempt at all product details for the specified ASIN
         
         :param asin: Amazon Standard Identification Number
-        :return: Dictionary of product data or None if failed
+        :param attempt: Attempt number, recorded on the fetch span
+        :return: Dictionary of product data
+        :raises ScrapeFailure: With the failure category, so the caller can defer a retry
         """
+        # Move to a fresh proxy if the pool rested the current one
+        if self.driver and self.proxy_lease and not self.proxy_lease.usable:
+            logger.warning(f"Proxy {self.proxy_lease.proxy.label} was rested, restarting driver")
+            self.close()
+            self.driver = None
+        
         if not self.driver:
             if not self.initialize_driver():
                 logger.error("Failed to initialize driver")
-                return None
+                raise ScrapeFailure('error', 'driver initialization failed')
                 
-        url = f'https://www.amazon.com/dp/{asin}'
-        max_retries = 3
-        retry_count = 0
+        url = f'{self.shard.base_url}/dp/{asin}'
         
-        while retry_count < max_retries:
-            try:
-                logger.info(f"Accessing product page for ASIN {asin}")
+        # Held here while the fleet-wide breaker is open or throttling
+        BREAKER.before_request('realtime')
+        self.drift.before_request()
+        
+        try:
+            logger.info(f"Accessing product page for ASIN {asin}")
+            if self.proxy_lease:
+                self.proxy_lease.throttle()
+            elif self.rate_limiter:
+                self.rate_limiter.take()
+            nav_started = time.perf_counter()
+            with PHASE_SECONDS.time(scraper='realtime', phase='navigation'), span('fetch', attempt=attempt):
                 self.driver.get(url)
+                nav_seconds = time.perf_counter() - nav_started
                 
                 # Use shorter wait for initial page load
                 time.sleep(random.uniform(1, 2))
-                
-                # Check for captcha
-                if "Type the characters you see in this image" in self.driver.page_source:
-                    logger.info(f"Captcha detected for ASIN {asin}")
-                    if not self._handle_captcha():
-                        self.captcha_failures += 1
-                        if self.captcha_failures >= self.max_captcha_failures:
-                            logger.error("Maximum captcha failures reached")
-                            return None
-                        retry_count += 1
-                        continue
-                    else:
-                        self.captcha_failures = 0  # Reset counter after success
-                        time.sleep(random.uniform(2, 3))
-                
-                # Initialize product data dictionary
-                product_data = {
-                    'asin': asin,
-                    'title': None,
-                    'price': None,
-                    'rating': None,
-                    'reviews_count': None,
-                    'best_seller_rank': None,
-                    'buybox_offer': None,
-                    'other_offers': [],
-                    'last_updated': datetime.now()
-                }
-                
-                # Scrape basic product details
-                product_data['title'] = self._safe_find_element(By.ID, 'productTitle')
+            PAGES_TOTAL.inc(scraper='realtime')
+            self.watchdog.page_loaded()
+            
+            # Check for captcha
+            with PHASE_SECONDS.time(scraper='realtime', phase='captcha_detect'):
+                captcha_present = "Type the characters you see in this image" in self.driver.page_source
+            if self.proxy_lease:
+                self.proxy_lease.report('captcha' if captcha_present else 'ok', nav_seconds)
+            if captcha_present:
+                logger.info(f"Captcha detected for ASIN {asin}")
+                CAPTCHAS_TOTAL.inc(scraper='realtime')
+                BREAKER.record('realtime', 'captcha')
+                with PHASE_SECONDS.time(scraper='realtime', phase='captcha_solve'), span('captcha') as captcha_span:
+                    solved = self._handle_captcha()
+                    captcha_span.set(solved=solved)
+                CAPTCHA_SOLVES_TOTAL.inc(scraper='realtime', result='solved' if solved else 'failed')
+                if not solved:
+                    self.captcha_failures += 1
+                    if self.captcha_failures >= self.max_captcha_failures:
+                        # A fresh session is more likely to get through than this one
+                        logger.error("Maximum captcha failures reached, restarting driver")
+                        self.close()
+                        self.driver = None
+                        self.captcha_failures = 0
+                        RESTARTS_TOTAL.inc(scraper='realtime')
+                    raise ScrapeFailure('captcha', 'captcha not solved')
+                else:
+                    self.captcha_failures = 0  # Reset counter after success
+                    time.sleep(random.uniform(2, 3))
+            
+            # Start the per-page wait budget now that the product page is showing
+            self._begin_page()
+            page_started = time.monotonic()
+            
+            # Anything without product markup is a dead or broken page, not an empty listing
+            self._wait_for_page_ready()
+            has_product_markup = bool(self.driver.find_elements(By.XPATH, PAGE_READY_XPATH))
+            if not has_product_markup:
+                page_source = self.driver.page_source
+                if not captcha_present:
+                    BREAKER.record('realtime', page_outcome(page_source, has_product_markup))
+                raise ScrapeFailure(classify_failure(page_source=page_source), 'no product markup on page')
+            if not captcha_present:
+                BREAKER.record('realtime', 'ok')
+            
+            # Initialize product data dictionary
+            product_data = {
+                'asin': asin,
+                'title': None,
+                'price': None,
+                'rating': None,
+                'reviews_count': None,
+                'best_seller_rank': None,
+                'buybox_offer': None,
+                'other_offers': [],
+                'last_updated': datetime.now()
+            }
+            
+            # Scrape basic product details
+            with PHASE_SECONDS.time(scraper='realtime', phase='extract_title'):
+                product_data['title'] = self.selectors.extract('title', self._read_selector)
+            with PHASE_SECONDS.time(scraper='realtime', phase='extract_price'):
                 product_data['price'] = self._extract_price()
-                product_data['rating'] = self._safe_find_element(
-                    By.XPATH, 
-                    "//div[@id='averageCustomerReviews']//span[@id='acrPopover']//span"
-                )
-                product_data['reviews_count'] = self._safe_find_element(
-                    By.XPATH, 
-                    "//div[@id='averageCustomerReviews']//a[@id='acrCustomerReviewLink']//span[@id='acrCustomerReviewText']"
-                )
+            with PHASE_SECONDS.time(scraper='realtime', phase='extract_rating'):
+                product_data['rating'] = self.selectors.extract('rating', self._read_selector)
+            with PHASE_SECONDS.time(scraper='realtime', phase='extract_reviews_count'):
+                product_data['reviews_count'] = self.selectors.extract('reviews_count', self._read_selector)
+            with PHASE_SECONDS.time(scraper='realtime', phase='extract_best_seller_rank'):
                 product_data['best_seller_rank'] = self._extract_best_seller_rank()
-                
-                # Scrape BuyBox offer
+            
+            # Scrape BuyBox offer
+            with PHASE_SECONDS.time(scraper='realtime', phase='extract_buybox'):
                 product_data['buybox_offer'] = self._scrape_buybox_offer(product_data)
-                
-                # Scrape other offers
+            
+            # Scrape other offers
+            with PHASE_SECONDS.time(scraper='realtime', phase='offers_panel'):
                 product_data['other_offers'] = self._scrape_other_offers()
-                
-                logger.info(f"Successfully scraped product data for ASIN {asin}")
-                return product_data
-                
-            except Exception as e:
-                logger.error(f"Error scraping ASIN {asin}: {str(e)}")
-                retry_count += 1
-                
-                if retry_count < max_retries:
-                    logger.info(f"Retrying... Attempt {retry_count + 1} of {max_retries}")
-                    time.sleep(random.uniform(3, 5))
-                else:
-                    logger.warning(f"Max retries reached for ASIN {asin}")
-                    return None
+            self.drift.observe(asin, product_data, lambda: self.driver.page_source)
+            
+            stats = self._page_stats
+            logger.info(
+                f"Successfully scraped product data for ASIN {asin} in {time.monotonic() - page_started:.1f}s "
+                f"({stats['lookups']} lookups, {stats['absent']} absent, {stats['waited']:.1f}s waiting, "
+                f"~{max(0.0, stats['absent'] * LEGACY_ELEMENT_WAIT - stats['waited']):.0f}s of per-element timeouts avoided)"
+            )
+            return product_data
+            
+        except ScrapeFailure:
+            raise
+        except Exception as e:
+            logger.error(f"Error scraping ASIN {asin}: {str(e)}")
+            if self.proxy_lease and isinstance(e, WebDriverException):
+                self.proxy_lease.report('error')
+            BREAKER.record('realtime', 'error')
+            try:
+                page_source = self.driver.page_source
+            except Exception:
+                page_source = None
+            raise ScrapeFailure(classify_failure(e, page_source), str(e))
 
     def save_to_database(self, product_data):
         """Save scraped product data to PostgreSQL database"""
@@ -545,31 +876,20 @@ class RealtimeAmazonScraper:
             return False
         
         try:
-            with conn.cursor() as cursor:
-                # Convert other_offers to JSON string
-                other_offers_json = json.dumps(product_data['other_offers']) if product_data['other_offers'] else None
-                
-                # Convert price to decimal
-                try:
-                    price = float(product_data['price'].replace('$', '').replace(',', '')) if product_data['price'] else None
-                except:
-                    price = None
-                
-                # Convert buybox price to decimal
-                try:
-                    buybox_price = float(product_data['buybox_offer']['price'].replace('$', '').replace(',', '')) if (product_data['buybox_offer'] and product_data['buybox_offer']['price']) else None
-                except:
-                    buybox_price = None
+            with PHASE_SECONDS.time(scraper='realtime', phase='db_flush'), conn.cursor() as cursor:
+                price = parse_price(product_data['price'])
+                buybox_price = parse_price(product_data['buybox_offer']['price']) if product_data['buybox_offer'] else None
                 
                 # Upsert the data
                 cursor.execute("""
                     INSERT INTO realtimedata (
                         asin, title, price, rating, reviews_count, best_seller_rank,
-                        buybox_shipped_from, buybox_sold_by, buybox_price, other_offers, last_updated
+                        buybox_shipped_from, buybox_sold_by, buybox_price, last_updated,
+                        marketplace, zip_code, last_checked
                     ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
                     )
-                    ON CONFLICT (asin) DO UPDATE SET
+                    ON CONFLICT (asin, marketplace, zip_code) DO UPDATE SET
                         title = EXCLUDED.title,
                         price = EXCLUDED.price,
                         rating = EXCLUDED.rating,
@@ -578,22 +898,28 @@ class RealtimeAmazonScraper:
                         buybox_shipped_from = EXCLUDED.buybox_shipped_from,
                         buybox_sold_by = EXCLUDED.buybox_sold_by,
                         buybox_price = EXCLUDED.buybox_price,
-                        other_offers = EXCLUDED.other_offers,
-                        last_updated = EXCLUDED.last_updated
+                        last_updated = EXCLUDED.last_updated,
+                        last_checked = EXCLUDED.last_checked
                 """, (
                     product_data['asin'],
                     product_data['title'],
                     price,
-                    product_data['rating'],
-                    product_data['reviews_count'],
+                    parse_rating(product_data['rating']),
+                    parse_count(product_data['reviews_count']),
                     product_data['best_seller_rank'],
                     product_data['buybox_offer']['shipped_from'] if product_data['buybox_offer'] else None,
                     product_data['buybox_offer']['sold_by'] if product_data['buybox_offer'] else None,
                     buybox_price,
-                    other_offers_json,
+                    product_data['last_updated'],
+                    self.shard.marketplace,
+                    self.shard.zip_code,
                     product_data['last_updated']
                 ))
                 
+                self._save_offers(cursor, product_data)
+                
+                # Evict this ASIN from the read API cache once the write commits
+                notify_changed(cursor, REALTIME_CHANNEL, [product_data['asin']])
                 conn.commit()
                 logger.info(f"Successfully saved data for ASIN {product_data['asin']} to database")
                 return True
@@ -603,6 +929,41 @@ class RealtimeAmazonScraper:
         finally:
             conn.close()
 
+    def _save_offers(self, cursor, product_data):
+        """Replace the ASIN's rows in product_offers, inserting any new sellers, with bulk statements"""
+        offers = [normalize_offer(o) for o in product_data['other_offers'] or []]
+        key = (product_data['asin'], self.shard.marketplace, self.shard.zip_code)
+        cursor.execute(
+            "DELETE FROM product_offers WHERE asin = %s AND marketplace = %s AND zip_code = %s", key
+        )
+        if not offers:
+            return
+        seller_ids = {}
+        names = sorted({o['seller_name'] for o in offers if o['seller_name']})
+        if names:
+            # Known sellers are left untouched; their ids are read back with the new ones
+            execute_values(cursor, """
+                INSERT INTO sellers (seller_name) VALUES %s
+                ON CONFLICT (seller_name) DO NOTHING
+            """, [(name,) for name in names])
+            cursor.execute("SELECT seller_id, seller_name FROM sellers WHERE seller_name = ANY(%s)", (names,))
+            seller_ids = {name: seller_id for seller_id, name in cursor.fetchall()}
+        execute_values(cursor, """
+            INSERT INTO product_offers
+            (asin, marketplace, zip_code, position, offer_type, seller_id, ships_from, price, is_fba, scraped_at)
+            VALUES %s
+        """, [
+            key + (position, o['offer_type'], seller_ids.get(o['seller_name']), o['ships_from'],
+                   o['price'], o['is_fba'], product_data['last_updated'])
+            for position, o in enumerate(offers, 1)
+        ])
+
+    def recycle_if_needed(self):
+        """Quit the browser between ASINs when the watchdog asks; the next scrape starts a fresh one"""
+        if self.driver and self.watchdog.should_recycle():
+            self.close()
+            self.driver = None
+
     def close(self):
         """Close the WebDriver"""
         if self.driver:
@@ -611,23 +972,197 @@ class RealtimeAmazonScraper:
                 logger.info("WebDriver closed successfully")
             except Exception as e:
                 logger.error(f"Error closing WebDriver: {str(e)}")
+        if self.proxy_lease:
+            self.proxy_lease.release()
+            self.proxy_lease = None
+
+def offers_fingerprint(buybox, offers):
+    """Summary of the buy box seller and price plus the order-independent offer list, used to detect changes"""
+    pinned = normalize_offer(buybox) if buybox else None
+    normalized = [normalize_offer(o) for o in (offers or [])]
+    return (
+        (pinned['seller_name'] or '', str(pinned['price'] or '')) if pinned else None,
+        sorted(
+            (o['seller_name'] or '', str(o['price'] or ''), o['offer_type'] or '', o['ships_from'] or '')
+            for o in normalized
+        ),
+    )
+
+def load_stored_offers(shard):
+    """{asin: (offers fingerprint, last full scrape)} for every stored snapshot in the shard"""
+    conn = get_db_connection()
+    if not conn:
+        return {}
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT r.asin, r.last_updated, r.buybox_sold_by, r.buybox_price,
+                       o.offer_type, s.seller_name, o.ships_from, o.price
+                FROM realtimedata r
+                LEFT JOIN product_offers o
+                  ON o.asin = r.asin AND o.marketplace = r.marketplace AND o.zip_code = r.zip_code
+                LEFT JOIN sellers s ON s.seller_id = o.seller_id
+                WHERE r.marketplace = %s AND r.zip_code = %s
+            """, (shard.marketplace, shard.zip_code))
+            offers, buyboxes, updated = {}, {}, {}
+            for row in cursor.fetchall():
+                asin, last_updated, buybox_sold_by, buybox_price, offer_type, seller_name, ships_from, price = row
+                updated[asin] = last_updated
+                if buybox_sold_by is not None or buybox_price is not None:
+                    buyboxes[asin] = {'seller_name': buybox_sold_by, 'price': buybox_price}
+                offers.setdefault(asin, [])
+                if offer_type is not None or price is not None or seller_name is not None:
+                    offers[asin].append({
+                        'type': offer_type, 'seller_name': seller_name, 'shipped_from': ships_from, 'price': price
+                    })
+            return {
+                asin: (offers_fingerprint(buyboxes.get(asin), offers[asin]), updated[asin]) for asin in updated
+            }
+    except Exception as e:
+        logger.error(f"Error loading stored offers: {str(e)}")
+        return {}
+    finally:
+        conn.close()
+
+def mark_checked(asin, shard):
+    """Record that a probe confirmed the stored snapshot is still current"""
+    conn = get_db_connection()
+    if not conn:
+        return
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                UPDATE realtimedata SET last_checked = %s
+                WHERE asin = %s AND marketplace = %s AND zip_code = %s
+            """, (datetime.now(), asin, shard.marketplace, shard.zip_code))
+        conn.commit()
+    except Exception as e:
+        logger.error(f"Error marking ASIN {asin} checked: {str(e)}")
+    finally:
+        conn.close()
+
+def probe_unchanged(scraper, asin, stored, max_full_age):
+    """
+    True when the stored snapshot can be kept: it is younger than max_full_age
+    and a probe of the offers fragment matches it. Any other outcome escalates
+    to a full scrape.
+    """
+    if asin not in stored:
+        PROBES_TOTAL.inc(outcome='new')
+        return False
+    fingerprint, last_full = stored[asin]
+    if not last_full or datetime.now() - last_full > max_full_age:
+        PROBES_TOTAL.inc(outcome='stale')
+        return False
+    probed = scraper.probe_offers(asin)
+    if probed is None:
+        PROBES_TOTAL.inc(outcome='failed')
+        return False
+    if offers_fingerprint(*probed) != fingerprint:
+        PROBES_TOTAL.inc(outcome='changed')
+        logger.info(f"Offers changed for ASIN {asin}, escalating to a full scrape")
+        return False
+    PROBES_TOTAL.inc(outcome='unchanged')
+    return True
 
-def get_asins_from_excel():
+def get_asins_from_excel(excel_file='cleaned_asin.xlsx'):
     """Read ASINs from cleaned_asin.xlsx file"""
     try:
-        df = pd.read_excel('cleaned_asin.xlsx')
+        df = pd.read_excel(excel_file)
         if 'asin' in df.columns:
             return df['asin'].tolist()
         else:
-            logger.error("No 'asin' column found in cleaned_asin.xlsx")
+            logger.error(f"No 'asin' column found in {excel_file}")
             return []
     except Exception as e:
         logger.error(f"Error reading ASINs from Excel file: {str(e)}")
         return []
 
-def scrape_all_asins():
-    """Scrape all ASINs from the Excel file and save to database"""
-    asins = get_asins_from_excel()
+def save_dead_letter_entries(entries, shard):
+    """Record ASINs that exhausted their retries in scrape_dead_letter"""
+    if not entries:
+        return
+    conn = get_db_connection()
+    if not conn:
+        return
+    try:
+        create_dead_letter_table(conn)
+        save_dead_letters(conn, entries, 'realtime', shard.marketplace, shard.zip_code)
+    except Exception as e:
+        logger.error(f"Error saving dead letters: {str(e)}")
+    finally:
+        conn.close()
+
+def save_run_ledger(ledger, status):
+    """Write a finished run to the ledger tables"""
+    conn = get_db_connection()
+    try:
+        if conn:
+            create_run_tables(conn)
+        ledger.finish(conn, status)
+    except Exception as e:
+        logger.error(f"Error saving run ledger: {str(e)}")
+    finally:
+        if conn:
+            conn.close()
+
+def plan_run(planner, asins):
+    """Plan a windowed run from the stored per-ASIN costs"""
+    conn = get_db_connection()
+    try:
+        if conn:
+            create_cost_table(conn)
+        planner.plan(asins, conn)
+    except Exception as e:
+        logger.error(f"Error loading ASIN costs: {str(e)}")
+        planner.plan(asins)
+    finally:
+        if conn:
+            conn.close()
+
+
+def load_negative_cache(shard):
+    """This marketplace's dead ASINs, skipped until their next check"""
+    cache = NegativeCache('realtime', shard.marketplace)
+    conn = get_db_connection()
+    if conn:
+        try:
+            cache.load(conn)
+        finally:
+            conn.close()
+    return cache
+
+
+def save_negative_cache(cache):
+    """Write the run's negative cache changes"""
+    conn = get_db_connection()
+    try:
+        cache.flush(conn)
+    finally:
+        if conn:
+            conn.close()
+
+
+def save_planner_costs(planner):
+    """Fold a finished run's per-ASIN times into asin_costs"""
+    conn = get_db_connection()
+    try:
+        planner.save_costs(conn)
+    finally:
+        if conn:
+            conn.close()
+
+
+def scrape_all_asins(excel_file='cleaned_asin.xlsx', shard=None, tiered=None, max_full_age_hours=None,
+                     window_hours=None):
+    """
+    Scrape all ASINs from the Excel file and save to database
+    
+    :param tiered: Probe the offers fragment first and skip unchanged ASINs (default SCRAPER_TIERED)
+    :param max_full_age_hours: Force a full scrape when the stored one is older than this
+    :param window_hours: Spread the run evenly over this many hours (default SCRAPER_WINDOW_HOURS, 0 = off)
+    """
+    asins = get_asins_from_excel(excel_file)
     if not asins:
         logger.error("No ASINs found to scrape")
         return
@@ -635,28 +1170,114 @@ def scrape_all_asins():
     logger.info(f"Starting to scrape {len(asins)} ASINs")
     
     # Initialize scraper once
-    scraper = RealtimeAmazonScraper()
+    shard = shard or ShardConfig.default(job='realtime', base_url=AMAZON_BASE_URL)
+    ledger = RunLedger('realtime', shard)
+    run_status = 'failed'
+    scraper = RealtimeAmazonScraper(proxy_pool=shard.proxy_pool(), shard=shard)
+    
+    tiered = TIERED_DEFAULT if tiered is None else tiered
+    max_full_age = timedelta(hours=MAX_FULL_AGE_HOURS if max_full_age_hours is None else max_full_age_hours)
+    stored = load_stored_offers(shard) if tiered else {}
+    skipped = 0
+    
+    negative = load_negative_cache(shard)
+    window_hours = WINDOW_HOURS if window_hours is None else window_hours
+    planner = LoadPlanner('realtime', shard, window_hours) if window_hours > 0 else None
+    if planner:
+        plan_run(planner, [asin for asin in asins if not negative.cached(asin)])
+    
+    # Failed ASINs are retried after a backoff, between fresh ones, instead of inline
+    retry_queue = RetryQueue('realtime')
+    fresh = enumerate(asins, 1)
     
     try:
-        for i, asin in enumerate(asins, 1):
-            logger.info(f"Processing ASIN {i} of {len(asins)}: {asin}")
-            
-            # Scrape product data
-            product_data = scraper.scrape_product(asin)
-            if product_data:
-                # Save to database
-                scraper.save_to_database(product_data)
-                logger.info(f"Successfully processed ASIN {asin}")
+        while True:
+            asin = retry_queue.pop_due()
+            if asin:
+                attempt = retry_queue.attempts(asin) + 1
+                logger.info(f"Retrying ASIN {asin} (attempt {attempt})")
+                index = None
             else:
-                logger.warning(f"Failed to scrape data for ASIN {asin}")
+                index, asin = next(fresh, (None, None))
+                if asin is None:
+                    wait = retry_queue.seconds_until_next()
+                    if wait is None:
+                        break
+                    logger.info(f"Fresh work done, waiting {wait:.0f}s for {len(retry_queue)} deferred retries")
+                    time.sleep(min(wait, 30))
+                    continue
+                if negative.skip(asin):
+                    continue
+                attempt = 1
+                if planner:
+                    planner.wait(asin)
+                logger.info(f"Processing ASIN {index} of {len(asins)}: {asin}")
+            
+            with trace_asin(asin, scraper='realtime', index=index, retry=attempt > 1), \
+                    asin_context(asin, 'realtime', retry=attempt > 1):
+                asin_started = time.perf_counter()
+                
+                # Retries and dead-ASIN re-probes always do the full scrape; fresh ASINs may be settled by a probe
+                probing = negative.probing(asin)
+                if tiered and attempt == 1 and not probing and probe_unchanged(scraper, asin, stored, max_full_age):
+                    mark_checked(asin, shard)
+                    record_asin('realtime', 'unchanged', time.perf_counter() - asin_started)
+                    if planner:
+                        planner.done(asin, time.perf_counter() - asin_started)
+                    skipped += 1
+                    scraper.recycle_if_needed()
+                    time.sleep(random.uniform(0.5, 1))
+                    continue
+                
+                # Scrape product data
+                try:
+                    product_data = scraper.scrape_product(asin, attempt=attempt)
+                except ScrapeFailure as failure:
+                    # A still-dead ASIN is cached again after its single re-probe attempt
+                    if probing and negative.record_dead(asin, failure.category, failure.message):
+                        record_asin('realtime', 'failed', time.perf_counter() - asin_started)
+                    else:
+                        dead = retry_queue.fail(asin, failure.category, failure.message)
+                        if dead:
+                            negative.record_dead(asin, dead.category, dead.last_error)
+                            record_asin('realtime', 'failed', time.perf_counter() - asin_started)
+                            save_dead_letter_entries(retry_queue.take_dead_letters(), shard)
+                else:
+                    retry_queue.succeed(asin)
+                    negative.record_alive(asin)
+                    # Save to database
+                    with span('db_write', rows=1):
+                        scraper.save_to_database(product_data)
+                    record_asin('realtime', 'success', time.perf_counter() - asin_started)
+                    logger.info(f"Successfully processed ASIN {asin}")
+                if planner:
+                    planner.done(asin, time.perf_counter() - asin_started)
+            
+            scraper.recycle_if_needed()
+            
+            # A layout change would only produce empty records from here on
+            if scraper.drift.stop_requested:
+                logger.error("Stopping the run on selector drift")
+                break
             
             # Add random delay between ASINs (1-3 seconds)
             time.sleep(random.uniform(1, 2))
+        
+        run_status = 'drift_stopped' if scraper.drift.stop_requested else 'completed'
             
     except Exception as e:
         logger.error(f"Error during scraping process: {str(e)}")
     finally:
+        scraper.selectors.save()
         scraper.close()
+        if len(retry_queue):
+            logger.warning(f"{len(retry_queue)} ASINs still awaiting retry when the run ended")
+        if tiered:
+            logger.info(f"Tiered run: {skipped} of {len(asins)} ASINs unchanged, full scrape skipped")
+        save_run_ledger(ledger, run_status)
+        save_negative_cache(negative)
+        if planner:
+            save_planner_costs(planner)
     
     logger.info("Finished scraping all ASINs")
 
@@ -679,6 +1300,14 @@ def schedule_daily_scrape():
         time.sleep(60)
 
 if __name__ == "__main__":
+    # Expose live metrics when a port is configured
+    if os.getenv('SCRAPER_METRICS_PORT'):
+        start_metrics_server(int(os.getenv('SCRAPER_METRICS_PORT')))
+    
+    # Record per-ASIN trace spans when a trace file is configured
+    if os.getenv('SCRAPER_TRACE_FILE'):
+        configure_tracing(os.getenv('SCRAPER_TRACE_FILE'))
+    
     # Create the database table if it doesn't exist
     create_realtimedata_table()
     
@@ -0,0 +1,261 @@
+"""
+Deferred retry queue for failed ASINs.
+
+Instead of retrying a failing ASIN inline (blocking the worker on sleeps and
+repeated page loads), the scrapers push the failure here with a category and
+move on to fresh work. Each ASIN is retried after a per-category exponential
+backoff, interleaved with the rest of the run; ASINs that exhaust their
+attempts are dead-lettered to the scrape_dead_letter table for inspection.
+"""
+import heapq
+import logging
+import random
+import threading
+import time
+from datetime import datetime
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+from scraper_metrics import REGISTRY, Counter, Gauge
+
+logger = logging.getLogger("RetryQueue")
+
+RETRIES_TOTAL = REGISTRY.register(Counter(
+    'scraper_retries_total', 'Failures deferred to the retry queue by category', ['scraper', 'category']
+))
+DEAD_LETTERS_TOTAL = REGISTRY.register(Counter(
+    'scraper_dead_letters_total', 'ASINs dead-lettered after exhausting retries', ['scraper', 'category']
+))
+RETRY_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'scraper_retry_queue_depth', 'ASINs waiting in the retry queue', ['scraper']
+))
+
+# category: (max attempts including the first, base backoff seconds)
+RETRY_POLICY = {
+    'captcha': (4, 60),
+    'timeout': (3, 30),
+    'not_found': (2, 300),
+    'unavailable': (2, 300),
+    'parse_failure': (3, 120),
+    'blocked': (4, 300),
+    'error': (3, 30),
+}
+MAX_BACKOFF = 3600
+
+CAPTCHA_MARKER = "Type the characters you see in this image"
+
+# 503 pages served when Amazon throttles or blocks automated traffic
+SORRY_MARKERS = (
+    "Sorry! Something went wrong!",
+    "To discuss automated access to Amazon data please contact",
+)
+
+NOT_FOUND_MARKERS = (
+    "Sorry! We couldn't find that page",
+    "Looking for something?",
+    "Page Not Found",
+)
+
+# Delisted or suppressed listings that no longer render a product page
+UNAVAILABLE_MARKERS = (
+    "This item is no longer available",
+    "is no longer available on Amazon",
+    "This page is not available",
+)
+
+
+class ScrapeFailure(Exception):
+    """Raised by scrape_product when one attempt at an ASIN fails"""
+
+    def __init__(self, category, message=''):
+        super().__init__(f"{category}: {message}" if message else category)
+        self.category = category
+        self.message = message
+
+
+def classify_failure(exc=None, page_source=None):
+    """Map an exception and/or the page that was showing to a retry category"""
+    if isinstance(exc, ScrapeFailure):
+        return exc.category
+    if page_source:
+        if CAPTCHA_MARKER in page_source:
+            return 'captcha'
+        if any(marker in page_source for marker in SORRY_MARKERS):
+            return 'blocked'
+        if any(marker in page_source for marker in NOT_FOUND_MARKERS):
+            return 'not_found'
+        if any(marker in page_source for marker in UNAVAILABLE_MARKERS):
+            return 'unavailable'
+    if isinstance(exc, TimeoutException) or (exc is not None and 'timeout' in str(exc).lower()):
+        return 'timeout'
+    if isinstance(exc, WebDriverException):
+        return 'error'
+    return 'parse_failure' if exc is None else 'error'
+
+
+class RetryEntry:
+    __slots__ = ('asin', 'attempts', 'category', 'last_error', 'first_failed', 'due')
+
+    def __init__(self, asin):
+        self.asin = asin
+        self.attempts = 0
+        self.category = None
+        self.last_error = None
+        self.first_failed = datetime.now()
+        self.due = 0.0
+
+
+class RetryQueue:
+    def __init__(self, scraper, policy=None, jitter=0.2):
+        """
+        :param scraper: Label used in logs and metrics ('daily' or 'realtime')
+        :param policy: Overrides for RETRY_POLICY
+        :param jitter: Random fraction added to each backoff so retries do not line up
+        """
+        self.scraper = scraper
+        self.policy = dict(RETRY_POLICY, **(policy or {}))
+        self.jitter = jitter
+        self._heap = []
+        self._entries = {}
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.dead_letters = []
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def fail(self, asin, category, error=''):
+        """
+        Record a failed attempt. Returns the entry if it was dead-lettered
+        (attempts exhausted), otherwise None after scheduling the retry.
+        """
+        with self._lock:
+            entry = self._entries.get(asin) or RetryEntry(asin)
+            entry.attempts += 1
+            entry.category = category
+            entry.last_error = str(error)[:500] if error else None
+            max_attempts, base = self.policy.get(category, self.policy['error'])
+            if entry.attempts >= max_attempts:
+                self._entries.pop(asin, None)
+                self.dead_letters.append(entry)
+                dead = True
+            else:
+                backoff = min(MAX_BACKOFF, base * 2 ** (entry.attempts - 1))
+                entry.due = time.monotonic() + backoff * (1 + random.uniform(0, self.jitter))
+                self._entries[asin] = entry
+                self._seq += 1
+                heapq.heappush(self._heap, (entry.due, self._seq, asin))
+                dead = False
+            depth = len(self._entries)
+        RETRY_QUEUE_DEPTH.set(depth, scraper=self.scraper)
+        if dead:
+            DEAD_LETTERS_TOTAL.inc(scraper=self.scraper, category=category)
+            logger.warning(f"ASIN {asin} dead-lettered after {entry.attempts} attempts ({category})")
+            return entry
+        RETRIES_TOTAL.inc(scraper=self.scraper, category=category)
+        logger.info(
+            f"ASIN {asin} failed ({category}), retry {entry.attempts + 1} of {max_attempts} "
+            f"in {entry.due - time.monotonic():.0f}s"
+        )
+        return None
+
+    def requeue(self, asin):
+        """Make an interrupted ASIN due immediately without counting an attempt"""
+        with self._lock:
+            entry = self._entries.get(asin) or RetryEntry(asin)
+            entry.due = time.monotonic()
+            self._entries[asin] = entry
+            self._seq += 1
+            heapq.heappush(self._heap, (entry.due, self._seq, asin))
+            depth = len(self._entries)
+        RETRY_QUEUE_DEPTH.set(depth, scraper=self.scraper)
+
+    def succeed(self, asin):
+        with self._lock:
+            if self._entries.pop(asin, None) is None:
+                return
+            depth = len(self._entries)
+        RETRY_QUEUE_DEPTH.set(depth, scraper=self.scraper)
+
+    def pop_due(self):
+        """Next ASIN whose backoff has elapsed, or None"""
+        with self._lock:
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                due, _, asin = heapq.heappop(self._heap)
+                entry = self._entries.get(asin)
+                if entry and entry.due == due:
+                    return asin
+            return None
+
+    def seconds_until_next(self):
+        with self._lock:
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - time.monotonic())
+
+    def attempts(self, asin):
+        with self._lock:
+            entry = self._entries.get(asin)
+            return entry.attempts if entry else 0
+
+    def take_dead_letters(self):
+        with self._lock:
+            entries, self.dead_letters = self.dead_letters, []
+            return entries
+
+
+def create_dead_letter_table(conn):
+    """Create the dead-letter table on the given connection"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS scrape_dead_letter (
+                id SERIAL PRIMARY KEY,
+                asin VARCHAR(20) NOT NULL,
+                scraper VARCHAR(20) NOT NULL,
+                marketplace VARCHAR(5) NOT NULL DEFAULT 'US',
+                zip_code VARCHAR(12) NOT NULL DEFAULT '11229',
+                category VARCHAR(20) NOT NULL,
+                attempts INTEGER NOT NULL,
+                last_error TEXT,
+                first_failed TIMESTAMP,
+                dead_lettered TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_dead_letter_asin
+            ON scrape_dead_letter (asin, dead_lettered)
+        """)
+    conn.commit()
+
+
+def save_dead_letters(conn, entries, scraper, marketplace='US', zip_code='11229'):
+    """Write dead-lettered entries to scrape_dead_letter"""
+    if not entries:
+        return
+    from psycopg2.extras import execute_values
+
+    with conn.cursor() as cur:
+        execute_values(cur, """
+            INSERT INTO scrape_dead_letter
+            (asin, scraper, marketplace, zip_code, category, attempts, last_error, first_failed)
+            VALUES %s
+        """, [
+            (e.asin, scraper, marketplace, zip_code, e.category, e.attempts, e.last_error, e.first_failed)
+            for e in entries
+        ])
+    conn.commit()
+    logger.info(f"Saved {len(entries)} dead-lettered ASINs")
+
+
+def list_dead_letters(conn, days=7):
+    """Recent dead letters, newest first"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT asin, scraper, marketplace, zip_code, category, attempts, last_error, dead_lettered
+            FROM scrape_dead_letter
+            WHERE dead_lettered >= NOW() - %s * INTERVAL '1 day'
+            ORDER BY dead_lettered DESC
+        """, (days,))
+        return cur.fetchall()
@@ -0,0 +1,378 @@
+"""
+Run ledger for the scrapers.
+
+scraper_checkpoint only says where a run got to. The ledger records how each
+run went: one scrape_runs row per run (per shard), with its time span, ASINs
+attempted, succeeded and failed, captchas, driver restarts, pages per minute
+and p95 ASIN latency, plus one scrape_run_workers row per driver lifetime so
+a bad proxy or a degrading browser shows up on its own.
+
+Counts come from the same instrumentation as the live metrics: the pages,
+captchas and restarts counters and record_asin() report to the tally of the
+worker running in the current thread, so concurrent shards do not mix.
+
+    ledger = RunLedger('daily', shard)
+    ledger.start_worker('driver-1')
+    ...
+    ledger.finish(conn, 'completed')
+
+The status command compares each shard's latest run with the median of its
+previous completed runs and flags throughput or success-rate regressions
+(exit status 1 if any):
+
+    python run_ledger.py status
+    python run_ledger.py status --scraper daily --baseline-runs 14 --throughput-drop 0.25
+"""
+import argparse
+import logging
+import math
+import statistics
+import sys
+import threading
+from datetime import datetime
+
+import psycopg2
+
+from scraper_logging import set_log_context
+from scraper_metrics import set_tally
+
+logger = logging.getLogger("RunLedger")
+
+# record_asin statuses that count as a successfully handled ASIN
+SUCCESS_STATUSES = ('success', 'unchanged')
+
+_current = threading.local()
+
+
+def create_run_tables(conn):
+    """Create the run ledger tables if they do not exist"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS scrape_runs (
+                run_id SERIAL PRIMARY KEY,
+                scraper VARCHAR(20) NOT NULL,
+                shard VARCHAR(100) NOT NULL,
+                marketplace VARCHAR(5),
+                zip_code VARCHAR(12),
+                status VARCHAR(40) NOT NULL,
+                started_at TIMESTAMP NOT NULL,
+                ended_at TIMESTAMP NOT NULL,
+                attempted INTEGER NOT NULL,
+                succeeded INTEGER NOT NULL,
+                failed INTEGER NOT NULL,
+                captchas INTEGER NOT NULL,
+                restarts INTEGER NOT NULL,
+                pages INTEGER NOT NULL,
+                pages_per_minute DECIMAL(10,2),
+                p95_latency DECIMAL(10,3)
+            )
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_scrape_runs_shard
+            ON scrape_runs (scraper, shard, started_at DESC)
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS scrape_run_workers (
+                run_id INTEGER NOT NULL REFERENCES scrape_runs (run_id) ON DELETE CASCADE,
+                worker VARCHAR(120) NOT NULL,
+                started_at TIMESTAMP NOT NULL,
+                ended_at TIMESTAMP NOT NULL,
+                attempted INTEGER NOT NULL,
+                succeeded INTEGER NOT NULL,
+                failed INTEGER NOT NULL,
+                captchas INTEGER NOT NULL,
+                restarts INTEGER NOT NULL,
+                pages INTEGER NOT NULL,
+                pages_per_minute DECIMAL(10,2),
+                p95_latency DECIMAL(10,3),
+                PRIMARY KEY (run_id, worker)
+            )
+        """)
+    conn.commit()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile, or None for no values; also used by the benchmark report"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    # The smallest value with at least pct% of the values at or below it
+    index = max(0, math.ceil(pct * len(ordered) / 100.0) - 1)
+    return ordered[index]
+
+
+class WorkerTally:
+    """Counts for one worker (a driver lifetime), fed through scraper_metrics taps"""
+
+    def __init__(self, name):
+        self.name = name
+        self.started_at = datetime.now()
+        self.ended_at = None
+        self.counts = {'attempted': 0, 'succeeded': 0, 'failed': 0, 'captchas': 0, 'restarts': 0, 'pages': 0}
+        self.latencies = []
+        self._lock = threading.Lock()
+
+    def add(self, event, amount=1, seconds=None):
+        with self._lock:
+            if event in ('pages', 'captchas', 'restarts'):
+                self.counts[event] += amount
+                return
+            # Anything else is a record_asin status
+            self.counts['attempted'] += 1
+            self.counts['succeeded' if event in SUCCESS_STATUSES else 'failed'] += 1
+            if seconds is not None:
+                self.latencies.append(seconds)
+
+    def summary(self, ended_at=None):
+        ended_at = self.ended_at or ended_at or datetime.now()
+        minutes = max((ended_at - self.started_at).total_seconds() / 60.0, 1 / 60.0)
+        with self._lock:
+            p95 = percentile(self.latencies, 95)
+            return {
+                **self.counts,
+                'started_at': self.started_at,
+                'ended_at': ended_at,
+                'pages_per_minute': round(self.counts['pages'] / minutes, 2),
+                'p95_latency': round(p95, 3) if p95 is not None else None
+            }
+
+
+class RunLedger:
+    def __init__(self, scraper, shard):
+        """
+        Start recording a run in the calling thread.
+
+        :param scraper: 'daily' or 'realtime'
+        :param shard: ShardConfig of the run
+        """
+        self.scraper = scraper
+        self.shard = shard
+        self.started_at = datetime.now()
+        self.workers = []
+        _current.ledger = self
+        self.start_worker('startup')
+
+    def start_worker(self, name):
+        """Attribute everything the calling thread reports from now on to a new worker"""
+        now = datetime.now()
+        if self.workers:
+            self.workers[-1].ended_at = now
+        # Worker names are the ledger rows' keys, so repeats get a suffix
+        taken = {w.name for w in self.workers}
+        unique, n = name, 2
+        while unique in taken:
+            unique, n = f"{name} ({n})", n + 1
+        worker = WorkerTally(unique)
+        self.workers.append(worker)
+        set_tally(worker)
+        return worker
+
+    def totals(self, ended_at):
+        summaries = [w.summary(ended_at) for w in self.workers]
+        totals = {key: sum(s[key] for s in summaries)
+                  for key in ('attempted', 'succeeded', 'failed', 'captchas', 'restarts', 'pages')}
+        minutes = max((ended_at - self.started_at).total_seconds() / 60.0, 1 / 60.0)
+        p95 = percentile([x for w in self.workers for x in w.latencies], 95)
+        totals['pages_per_minute'] = round(totals['pages'] / minutes, 2)
+        totals['p95_latency'] = round(p95, 3) if p95 is not None else None
+        return totals, summaries
+
+    def finish(self, conn, status):
+        """Write the run and its workers to the ledger; never raises, the run's outcome matters more"""
+        set_tally(None)
+        if getattr(_current, 'ledger', None) is self:
+            _current.ledger = None
+        ended_at = datetime.now()
+        totals, summaries = self.totals(ended_at)
+        # The startup worker only exists to catch events before the first driver; drop it if idle
+        rows = [(w, s) for w, s in zip(self.workers, summaries)
+                if w.name != 'startup' or s['attempted'] or s['pages'] or s['restarts']]
+        logger.info(
+            f"Run {self.scraper}/{self.shard.name} {status}: {totals['succeeded']}/{totals['attempted']} ASINs, "
+            f"{totals['failed']} failed, {totals['captchas']} captchas, {totals['restarts']} restarts, "
+            f"{totals['pages_per_minute']} pages/min, p95 {totals['p95_latency']}s"
+        )
+        if conn is None:
+            return None
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO scrape_runs
+                    (scraper, shard, marketplace, zip_code, status, started_at, ended_at, attempted, succeeded,
+                     failed, captchas, restarts, pages, pages_per_minute, p95_latency)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING run_id
+                """, (
+                    self.scraper, self.shard.name, self.shard.marketplace, self.shard.zip_code, status,
+                    self.started_at, ended_at, totals['attempted'], totals['succeeded'], totals['failed'],
+                    totals['captchas'], totals['restarts'], totals['pages'], totals['pages_per_minute'],
+                    totals['p95_latency']
+                ))
+                run_id = cur.fetchone()[0]
+                for worker, s in rows:
+                    cur.execute("""
+                        INSERT INTO scrape_run_workers
+                        (run_id, worker, started_at, ended_at, attempted, succeeded, failed, captchas, restarts,
+                         pages, pages_per_minute, p95_latency)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    """, (
+                        run_id, worker.name, s['started_at'], s['ended_at'], s['attempted'], s['succeeded'],
+                        s['failed'], s['captchas'], s['restarts'], s['pages'], s['pages_per_minute'],
+                        s['p95_latency']
+                    ))
+            conn.commit()
+            return run_id
+        except Exception as e:
+            logger.error(f"Error writing run ledger: {str(e)}")
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            return None
+
+
+def start_worker(name):
+    """Tag the calling thread's logs with worker and start it on the run ledger, if a run is being recorded"""
+    ledger = getattr(_current, 'ledger', None)
+    if ledger is not None:
+        name = ledger.start_worker(name).name
+    set_log_context(worker=name)
+
+
+def _success_rate(row):
+    return row['succeeded'] / row['attempted'] if row['attempted'] else None
+
+
+def run_status(conn, scraper=None, baseline_runs=7, throughput_drop=0.2, success_drop=0.05):
+    """
+    Compare each shard's latest run with the median of its previous completed
+    runs. Returns a list of report dicts; 'regressions' lists what was flagged.
+    """
+    reports = []
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT DISTINCT scraper, shard FROM scrape_runs
+            WHERE %s IS NULL OR scraper = %s
+            ORDER BY scraper, shard
+        """, (scraper, scraper))
+        shards = cur.fetchall()
+        for run_scraper, shard in shards:
+            cur.execute("""
+                SELECT run_id, status, started_at, ended_at, attempted, succeeded, failed, captchas, restarts,
+                       pages, pages_per_minute, p95_latency
+                FROM scrape_runs WHERE scraper = %s AND shard = %s
+                ORDER BY started_at DESC LIMIT 1
+            """, (run_scraper, shard))
+            names = [c[0] for c in cur.description]
+            latest = dict(zip(names, cur.fetchone()))
+            cur.execute("""
+                SELECT attempted, succeeded, pages_per_minute, p95_latency
+                FROM scrape_runs
+                WHERE scraper = %s AND shard = %s AND run_id <> %s AND status = 'completed' AND attempted > 0
+                ORDER BY started_at DESC LIMIT %s
+            """, (run_scraper, shard, latest['run_id'], baseline_runs))
+            history = [dict(zip(('attempted', 'succeeded', 'pages_per_minute', 'p95_latency'), r))
+                       for r in cur.fetchall()]
+            cur.execute("""
+                SELECT worker, attempted, succeeded, failed, captchas, restarts, pages, pages_per_minute, p95_latency
+                FROM scrape_run_workers WHERE run_id = %s ORDER BY started_at
+            """, (latest['run_id'],))
+            worker_names = [c[0] for c in cur.description]
+            workers = [dict(zip(worker_names, r)) for r in cur.fetchall()]
+
+            baseline = None
+            regressions = []
+            if history:
+                baseline = {
+                    'runs': len(history),
+                    'pages_per_minute': statistics.median(float(r['pages_per_minute'] or 0) for r in history),
+                    'success_rate': statistics.median(_success_rate(r) for r in history),
+                }
+                ppm = float(latest['pages_per_minute'] or 0)
+                if baseline['pages_per_minute'] and ppm < baseline['pages_per_minute'] * (1 - throughput_drop):
+                    regressions.append(
+                        f"throughput {ppm:.1f} pages/min vs baseline {baseline['pages_per_minute']:.1f} "
+                        f"({ppm / baseline['pages_per_minute'] - 1:+.0%})"
+                    )
+                rate = _success_rate(latest)
+                if rate is not None and rate < baseline['success_rate'] - success_drop:
+                    regressions.append(
+                        f"success rate {rate:.1%} vs baseline {baseline['success_rate']:.1%}"
+                    )
+                for worker in workers:
+                    worker_rate = _success_rate(worker)
+                    worker['flagged'] = (
+                        worker_rate is not None and worker['attempted'] >= 10
+                        and worker_rate < baseline['success_rate'] - success_drop
+                    )
+            reports.append({
+                'scraper': run_scraper, 'shard': shard, 'latest': latest, 'baseline': baseline,
+                'workers': workers, 'regressions': regressions
+            })
+    return reports
+
+
+def _print_report(report):
+    latest, baseline = report['latest'], report['baseline']
+    rate = _success_rate(latest)
+    print(f"{report['scraper']}/{report['shard']}  run {latest['run_id']}  {latest['status']}  "
+          f"{latest['started_at']:%Y-%m-%d %H:%M} - {latest['ended_at']:%H:%M}")
+    asins = f"ASINs {latest['succeeded']}/{latest['attempted']} ok ({rate:.1%})" if rate is not None else "no ASINs"
+    print(f"  {asins}  failed {latest['failed']}  captchas {latest['captchas']}  restarts {latest['restarts']}")
+    print(f"  {float(latest['pages_per_minute'] or 0):.1f} pages/min  p95 {latest['p95_latency']}s")
+    if baseline:
+        print(f"  baseline ({baseline['runs']} runs): {baseline['pages_per_minute']:.1f} pages/min, "
+              f"{baseline['success_rate']:.1%} success")
+    else:
+        print("  no completed runs to compare against yet")
+    for worker in report['workers']:
+        worker_rate = _success_rate(worker)
+        marker = '!' if worker.get('flagged') else ' '
+        shown_rate = f"{worker_rate:.0%}" if worker_rate is not None else '-'
+        print(f"   {marker} {worker['worker']:<40} {worker['succeeded']:>5}/{worker['attempted']:<5} {shown_rate:>5}  "
+              f"{float(worker['pages_per_minute'] or 0):6.1f} pages/min  "
+              f"captchas {worker['captchas']}  restarts {worker['restarts']}")
+    for regression in report['regressions']:
+        print(f"  REGRESSION: {regression}")
+
+
+def main():
+    from history_export import DAILY_DB, REALTIME_DB
+
+    parser = argparse.ArgumentParser(description='Scrape run ledger')
+    sub = parser.add_subparsers(dest='command', required=True)
+    status = sub.add_parser('status', help='Compare the latest run of each shard with its trailing baseline')
+    status.add_argument('--scraper', choices=('daily', 'realtime', 'all'), default='all')
+    status.add_argument('--baseline-runs', type=int, default=7, help='Previous completed runs forming the baseline')
+    status.add_argument('--throughput-drop', type=float, default=0.2,
+                        help='Flag pages/min more than this fraction below the baseline')
+    status.add_argument('--success-drop', type=float, default=0.05,
+                        help='Flag a success rate more than this many points (0-1) below the baseline')
+    status.add_argument('--daily-dsn', default=None, help='libpq DSN overriding the daily database')
+    status.add_argument('--realtime-dsn', default=None, help='libpq DSN overriding the realtime database')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    databases = {'daily': (DAILY_DB, args.daily_dsn), 'realtime': (REALTIME_DB, args.realtime_dsn)}
+    kinds = ('daily', 'realtime') if args.scraper == 'all' else (args.scraper,)
+    regressed = False
+    for kind in kinds:
+        params, dsn = databases[kind]
+        conn = psycopg2.connect(dsn) if dsn else psycopg2.connect(**params)
+        try:
+            create_run_tables(conn)
+            reports = run_status(conn, scraper=kind, baseline_runs=args.baseline_runs,
+                                 throughput_drop=args.throughput_drop, success_drop=args.success_drop)
+        finally:
+            conn.close()
+        if not reports:
+            print(f"{kind}: no runs recorded yet")
+        for report in reports:
+            _print_report(report)
+            regressed = regressed or bool(report['regressions'])
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
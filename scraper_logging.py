@@ -0,0 +1,281 @@
+"""
+Asynchronous structured logging for the scrapers.
+
+Scraper threads only put records on a bounded queue. A listener thread
+formats and writes them, so log I/O and compression stay off the hot loop.
+When the queue is full, records are dropped and counted instead of blocking
+a worker. Two sinks are written:
+
+    console     the usual '%(asctime)s - %(name)s - %(levelname)s - %(message)s' lines
+    log_file    one JSON object per line with ts, level, logger, msg, thread,
+                run_id, worker and asin, plus per-ASIN phase timings
+
+The log file rotates when it reaches max_bytes and at midnight (or every
+hour). Rotated files are gzip-compressed and only the newest backup_count
+are kept. DEBUG records are sampled per call site: the first `debug_burst`
+records of a call site are kept, then one in every 1/debug_sample_rate. Each
+kept sampled record carries its sampling factor. INFO and above are never
+sampled.
+
+    configure_logging('amazon_scraper.log')
+    with asin_context(asin, 'daily'):
+        ...                          # every record is tagged with the ASIN
+
+Settings come from SCRAPER_LOG_LEVEL, SCRAPER_LOG_MAX_MB, SCRAPER_LOG_ROTATE
+(midnight or hourly), SCRAPER_LOG_BACKUPS and SCRAPER_LOG_DEBUG_SAMPLE.
+"""
+import atexit
+import glob
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from scraper_metrics import REGISTRY, Counter, start_phase_log, stop_phase_log
+from scraper_tracing import RUN_ID
+
+CONSOLE_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+LOG_RECORDS_DROPPED = REGISTRY.register(Counter(
+    'scraper_log_records_dropped_total', 'Log records dropped because the log queue was full'
+))
+
+# Structured per-ASIN summaries go to the JSON log only
+_asin_logger = logging.getLogger("ScraperLog.asin")
+
+_context = threading.local()
+_listener = None
+_configure_lock = threading.Lock()
+
+
+def set_log_context(**fields):
+    """Tag every later record of this thread with fields (None removes a field)"""
+    current = dict(getattr(_context, 'fields', {}))
+    for key, value in fields.items():
+        if value is None:
+            current.pop(key, None)
+        else:
+            current[key] = value
+    _context.fields = current
+
+
+@contextmanager
+def asin_context(asin, scraper, **fields):
+    """
+    Tag this thread's records with asin while the block runs. When it ends,
+    emit one structured event with the ASIN's total time and time per phase.
+    """
+    previous = getattr(_context, 'fields', {})
+    _context.fields = {**previous, 'asin': asin, **fields}
+    start_phase_log()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases = stop_phase_log()
+        _asin_logger.info("ASIN finished", extra={'event': {
+            'scraper': scraper,
+            'total_ms': round((time.perf_counter() - started) * 1000, 1),
+            'phases_ms': {phase: round(seconds * 1000, 1) for phase, seconds in phases.items()}
+        }})
+        _context.fields = previous
+
+
+class _ContextFilter(logging.Filter):
+    """Runs in the logging thread, so it can read that thread's context"""
+
+    def filter(self, record):
+        record.run_id = RUN_ID
+        record.context = getattr(_context, 'fields', {})
+        return True
+
+
+class _SamplingFilter(logging.Filter):
+    """Keeps the first `burst` DEBUG records per call site, then one in every 1/rate"""
+
+    def __init__(self, rate, burst):
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self.burst = burst
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        if not self.every:
+            return False
+        key = (record.name, record.lineno)
+        with self._lock:
+            count = self._seen.get(key, 0) + 1
+            self._seen[key] = count
+        if count <= self.burst:
+            return True
+        if count % self.every:
+            return False
+        record.sampled = self.every
+        return True
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Render the message and traceback now; the listener must not touch live objects
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = message
+        record.message = message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'thread': record.threadName,
+            'run_id': getattr(record, 'run_id', RUN_ID),
+        }
+        entry.update(getattr(record, 'context', {}))
+        if getattr(record, 'sampled', None):
+            entry['sampled'] = record.sampled
+        if getattr(record, 'event', None):
+            entry.update(record.event)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _ConsoleFilter(logging.Filter):
+    def filter(self, record):
+        return not record.name.startswith(_asin_logger.name)
+
+
+class CompressingRotatingFileHandler(logging.handlers.BaseRotatingHandler):
+    """
+    Rolls the file over when it reaches max_bytes or at the next midnight /
+    hour, gzips the rolled file and keeps the newest backup_count archives.
+    """
+
+    def __init__(self, filename, max_bytes=50 * 1024 * 1024, when='midnight', backup_count=14):
+        if when not in ('midnight', 'hourly'):
+            raise ValueError(f"Unknown rotation {when}, expected midnight or hourly")
+        super().__init__(filename, 'a', encoding='utf-8', delay=True)
+        self.max_bytes = max_bytes
+        self.when = when
+        self.backup_count = backup_count
+        self.next_rollover = self._next_rollover()
+
+    def _next_rollover(self):
+        now = datetime.now()
+        if self.when == 'hourly':
+            boundary = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        else:
+            boundary = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        return boundary.timestamp()
+
+    def shouldRollover(self, record):
+        if time.time() >= self.next_rollover:
+            return True
+        if self.max_bytes <= 0:
+            return False
+        if self.stream is None:
+            self.stream = self._open()
+        return self.stream.tell() + len(self.format(record)) + 1 >= self.max_bytes
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+            stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+            target = f"{self.baseFilename}.{stamp}.gz"
+            n = 1
+            while os.path.exists(target):
+                target = f"{self.baseFilename}.{stamp}-{n}.gz"
+                n += 1
+            with open(self.baseFilename, 'rb') as src, gzip.open(target, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(self.baseFilename)
+            archives = sorted(glob.glob(f"{glob.escape(self.baseFilename)}.*.gz"), key=os.path.getmtime)
+            for old in archives[:-self.backup_count] if self.backup_count else []:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+        self.next_rollover = self._next_rollover()
+        self.stream = self._open()
+
+
+def configure_logging(log_file, level=None, max_bytes=None, when=None, backup_count=None,
+                      debug_sample_rate=None, debug_burst=20, queue_size=10000, console=True):
+    """
+    Route all logging through the background listener. Only the first call
+    in a process takes effect, like logging.basicConfig.
+    """
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return _listener
+        level = level or os.getenv('SCRAPER_LOG_LEVEL', 'INFO').upper()
+        max_bytes = max_bytes if max_bytes is not None else int(float(os.getenv('SCRAPER_LOG_MAX_MB', '50')) * 1024 * 1024)
+        when = when or os.getenv('SCRAPER_LOG_ROTATE', 'midnight')
+        backup_count = backup_count if backup_count is not None else int(os.getenv('SCRAPER_LOG_BACKUPS', '14'))
+        if debug_sample_rate is None:
+            debug_sample_rate = float(os.getenv('SCRAPER_LOG_DEBUG_SAMPLE', '0.01'))
+
+        sinks = []
+        file_handler = CompressingRotatingFileHandler(log_file, max_bytes, when, backup_count)
+        file_handler.setFormatter(JsonFormatter())
+        sinks.append(file_handler)
+        if console:
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+            console_handler.addFilter(_ConsoleFilter())
+            sinks.append(console_handler)
+
+        log_queue = queue.Queue(maxsize=queue_size)
+        queue_handler = _NonBlockingQueueHandler(log_queue)
+        queue_handler.addFilter(_SamplingFilter(debug_sample_rate, debug_burst))
+        queue_handler.addFilter(_ContextFilter())
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(queue_handler)
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(log_queue, *sinks, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return _listener
+
+
+def shutdown_logging():
+    """Flush the queue and stop the listener"""
+    global _listener
+    with _configure_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
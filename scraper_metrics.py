@@ -0,0 +1,329 @@
+"""
+Lightweight in-process metrics for the Amazon scrapers.
+
+Counters, gauges and latency histograms are kept in a module level registry
+and exposed in the Prometheus text format on a local HTTP endpoint, so a run
+can be watched while it is in progress:
+
+    start_metrics_server(9108)
+    with PHASE_SECONDS.time(scraper='daily', phase='navigation'):
+        driver.get(url)
+"""
+import bisect
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("ScraperMetrics")
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 30, 60)
+
+# Per-thread observer of tapped events, set by run_ledger for the worker running in that thread
+_tally = threading.local()
+
+
+def set_tally(tally):
+    """Send this thread's tapped counter increments and finished ASINs to tally.add(event, amount, seconds)"""
+    _tally.value = tally
+
+
+def _tap(event, amount=1, seconds=None):
+    tally = getattr(_tally, 'value', None)
+    if tally is not None:
+        tally.add(event, amount, seconds)
+
+
+# Per-thread phase timings of the ASIN in progress, collected for its structured log event
+_phases = threading.local()
+
+
+def start_phase_log():
+    _phases.value = {}
+
+
+def stop_phase_log():
+    """Seconds per phase observed on this thread since start_phase_log()"""
+    timings = getattr(_phases, 'value', None) or {}
+    _phases.value = None
+    return timings
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.extend(extra)
+    if not pairs:
+        return ''
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+class _Metric:
+    metric_type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}"
+        ]
+        with self._lock:
+            items = list(self._values.items())
+        for labelvalues, value in items:
+            lines.extend(self._render_sample(labelvalues, value))
+        return lines
+
+    def _render_sample(self, labelvalues, value):
+        return [f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value}"]
+
+
+class Counter(_Metric):
+    metric_type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), tap=None):
+        """:param tap: Event name under which increments are also reported to the thread's tally"""
+        super().__init__(name, documentation, labelnames)
+        self.tap = tap
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        if self.tap:
+            _tap(self.tap, amount)
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    metric_type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, tap_label=None):
+        """:param tap_label: Label whose value keys observations in the thread's phase log"""
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.tap_label = tap_label
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+                self._values[key] = state
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state['counts'][index] += 1
+            state['sum'] += value
+            state['count'] += 1
+        if self.tap_label:
+            timings = getattr(_phases, 'value', None)
+            if timings is not None:
+                phase = labels[self.tap_label]
+                timings[phase] = timings.get(phase, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the enclosed block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_sample(self, labelvalues, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state['counts']):
+            cumulative += count
+            labels = _format_labels(self.labelnames, labelvalues, [('le', bound)])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, labelvalues, [('le', '+Inf')])
+        lines.append(f"{self.name}_bucket{labels} {state['count']}")
+        labels = _format_labels(self.labelnames, labelvalues)
+        lines.append(f"{self.name}_sum{labels} {state['sum']}")
+        lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class _RateWindow:
+    """Counts events over a sliding time window (used for ASINs per minute)"""
+
+    def __init__(self, window_seconds=60):
+        self.window_seconds = window_seconds
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def mark(self, key):
+        now = time.monotonic()
+        with self._lock:
+            self._events.setdefault(key, deque()).append(now)
+
+    def rates(self):
+        cutoff = time.monotonic() - self.window_seconds
+        with self._lock:
+            result = {}
+            for key, events in self._events.items():
+                while events and events[0] < cutoff:
+                    events.popleft()
+                result[key] = len(events) * 60.0 / self.window_seconds
+            return result
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """Register a callable run before each scrape to refresh derived gauges"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.debug(f"Metrics collector failed: {str(e)}")
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+PHASE_SECONDS = REGISTRY.register(Histogram(
+    'scraper_phase_seconds',
+    'Time spent in each scrape phase (navigation, captcha, field extractors, offers panel, db flush)',
+    ['scraper', 'phase'], tap_label='phase'
+))
+ASIN_SECONDS = REGISTRY.register(Histogram(
+    'scraper_asin_seconds',
+    'End-to-end time spent on one ASIN including retries',
+    ['scraper']
+))
+PAGES_TOTAL = REGISTRY.register(Counter(
+    'scraper_pages_total', 'Product pages loaded', ['scraper'], tap='pages'
+))
+CAPTCHAS_TOTAL = REGISTRY.register(Counter(
+    'scraper_captchas_total', 'Captcha pages encountered', ['scraper'], tap='captchas'
+))
+CAPTCHA_SOLVES_TOTAL = REGISTRY.register(Counter(
+    'scraper_captcha_solves_total', 'Captcha solve attempts by result', ['scraper', 'result']
+))
+RESTARTS_TOTAL = REGISTRY.register(Counter(
+    'scraper_restarts_total', 'WebDriver restarts', ['scraper'], tap='restarts'
+))
+ASINS_TOTAL = REGISTRY.register(Counter(
+    'scraper_asins_total', 'ASINs processed by outcome', ['scraper', 'status']
+))
+CAPTCHAS_PER_100_PAGES = REGISTRY.register(Gauge(
+    'scraper_captchas_per_100_pages', 'Captchas encountered per 100 product pages loaded', ['scraper']
+))
+ASINS_PER_MINUTE = REGISTRY.register(Gauge(
+    'scraper_asins_per_minute', 'ASINs completed over the last minute', ['scraper']
+))
+
+_asin_rate = _RateWindow(60)
+
+
+def record_asin(scraper, status, seconds=None):
+    """Record a finished ASIN for the outcome counter, rate gauge and latency histogram"""
+    ASINS_TOTAL.inc(scraper=scraper, status=status)
+    _asin_rate.mark(scraper)
+    if seconds is not None:
+        ASIN_SECONDS.observe(seconds, scraper=scraper)
+    _tap(status, seconds=seconds)
+
+
+def _collect_derived():
+    with PAGES_TOTAL._lock:
+        scrapers = [key[0] for key in PAGES_TOTAL._values]
+    for scraper in scrapers:
+        pages = PAGES_TOTAL.get(scraper=scraper)
+        captchas = CAPTCHAS_TOTAL.get(scraper=scraper)
+        CAPTCHAS_PER_100_PAGES.set(round(captchas * 100.0 / pages, 3) if pages else 0, scraper=scraper)
+    for scraper, rate in _asin_rate.rates().items():
+        ASINS_PER_MINUTE.set(rate, scraper=scraper)
+
+
+REGISTRY.add_collector(_collect_derived)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep scrape requests out of the scraper logs
+        pass
+
+
+_server = None
+
+
+def start_metrics_server(port=9108, host='127.0.0.1'):
+    """Start the Prometheus endpoint on a daemon thread (idempotent)"""
+    global _server
+    if _server is not None:
+        return _server
+    try:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.error(f"Could not start metrics server on {host}:{port}: {str(e)}")
+        return None
+    thread = threading.Thread(target=_server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return _server
@@ -0,0 +1,257 @@
+"""
+Per-ASIN trace spans for the Amazon scrapers.
+
+Each ASIN is recorded as a trace of nested spans (fetch, captcha, every XPath
+attempt of the fallback selector lists, DB write). Finished spans are kept in
+memory and written as JSON lines once the ASIN's root span closes, so the hot
+loop only pays for a few perf_counter calls per span. Output goes to a size
+rotated file:
+
+    configure_tracing('scraper_traces.jsonl')
+    with trace_asin(asin, scraper='daily'):
+        with span('fetch'):
+            driver.get(url)
+
+The report command aggregates trace files into the slowest selectors, the
+fallbacks that never hit and the top time sinks per run:
+
+    python scraper_tracing.py report scraper_traces.jsonl*
+"""
+import glob
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger("ScraperTracing")
+
+_trace_logger = logging.getLogger("ScraperTracing.spans")
+_trace_logger.propagate = False
+
+_local = threading.local()
+_enabled = False
+RUN_ID = os.getenv('SCRAPER_RUN_ID') or time.strftime('%Y%m%d-%H%M%S')
+
+
+class _NullSpan:
+    """Returned when tracing is disabled so instrumented code needs no branches"""
+
+    def set(self, **attrs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ('name', 'attrs', 'span_id', 'parent_id', 'start', 'wall_start', 'duration')
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.span_id = None
+        self.parent_id = None
+        self.start = 0.0
+        self.wall_start = 0.0
+        self.duration = 0.0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def __enter__(self):
+        stack = _local.stack
+        trace = _local.trace
+        trace['next_id'] += 1
+        self.span_id = trace['next_id']
+        self.parent_id = stack[-1].span_id if stack else None
+        stack.append(self)
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        _local.stack.pop()
+        _local.trace['spans'].append(self)
+        return False
+
+
+class _RootSpan(Span):
+    __slots__ = ()
+
+    def __enter__(self):
+        _local.trace = {'trace_id': uuid.uuid4().hex[:16], 'next_id': 0, 'spans': []}
+        _local.stack = []
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        super().__exit__(exc_type, exc, tb)
+        trace = _local.trace
+        _local.trace = None
+        try:
+            _flush(trace)
+        except Exception as e:
+            logger.debug(f"Could not write trace: {str(e)}")
+        return False
+
+
+def _flush(trace):
+    for s in trace['spans']:
+        _trace_logger.info(json.dumps({
+            'run_id': RUN_ID,
+            'trace_id': trace['trace_id'],
+            'span_id': s.span_id,
+            'parent_id': s.parent_id,
+            'name': s.name,
+            'ts': round(s.wall_start, 3),
+            'ms': round(s.duration * 1000, 3),
+            'attrs': s.attrs
+        }, default=str))
+
+
+def configure_tracing(path='scraper_traces.jsonl', max_bytes=50 * 1024 * 1024, backup_count=5):
+    """Enable tracing to a size-rotated JSONL file"""
+    global _enabled
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    for existing in list(_trace_logger.handlers):
+        _trace_logger.removeHandler(existing)
+        existing.close()
+    _trace_logger.addHandler(handler)
+    _trace_logger.setLevel(logging.INFO)
+    _enabled = True
+    logger.info(f"Tracing enabled, writing spans to {path} (run {RUN_ID})")
+
+
+def trace_asin(asin, **attrs):
+    """Root span for one ASIN; nested span() calls attach to it"""
+    if not _enabled:
+        return _NULL_SPAN
+    attrs['asin'] = asin
+    return _RootSpan('asin', attrs)
+
+
+def span(name, **attrs):
+    """Child span of the current ASIN trace (no-op outside a trace)"""
+    if not _enabled or getattr(_local, 'trace', None) is None:
+        return _NULL_SPAN
+    return Span(name, attrs)
+
+
+# Report
+
+def _read_spans(paths):
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            try:
+                with open(path) as f:
+                    for line in f:
+                        line = line.strip()
+                        if line:
+                            try:
+                                yield json.loads(line)
+                            except ValueError:
+                                continue
+            except OSError as e:
+                logger.error(f"Could not read trace file {path}: {str(e)}")
+
+
+def build_report(paths, run_id=None, top=10):
+    selectors = {}
+    sinks = {}
+    for record in _read_spans(paths):
+        if run_id and record.get('run_id') != run_id:
+            continue
+        name = record['name']
+        attrs = record.get('attrs', {})
+        if name != 'asin':
+            sink_name = f"selector:{attrs.get('field')}" if name == 'selector' else name
+            run = sinks.setdefault(record.get('run_id'), {})
+            entry = run.setdefault(sink_name, {'count': 0, 'ms': 0.0})
+            entry['count'] += 1
+            entry['ms'] += record['ms']
+        if name == 'selector':
+            key = (attrs.get('field'), attrs.get('xpath'))
+            stats = selectors.setdefault(key, {'attempts': 0, 'hits': 0, 'ms': 0.0, 'max_ms': 0.0})
+            stats['attempts'] += 1
+            stats['hits'] += 1 if attrs.get('hit') else 0
+            stats['ms'] += record['ms']
+            stats['max_ms'] = max(stats['max_ms'], record['ms'])
+
+    selector_rows = [
+        {
+            'field': field,
+            'xpath': xpath,
+            'attempts': stats['attempts'],
+            'hits': stats['hits'],
+            'hit_rate': round(stats['hits'] / stats['attempts'], 3),
+            'mean_ms': round(stats['ms'] / stats['attempts'], 2),
+            'max_ms': round(stats['max_ms'], 2),
+            'total_ms': round(stats['ms'], 2)
+        }
+        for (field, xpath), stats in selectors.items()
+    ]
+    return {
+        'slowest_selectors': sorted(selector_rows, key=lambda r: r['mean_ms'], reverse=True)[:top],
+        'never_hit': sorted(
+            [r for r in selector_rows if r['hits'] == 0],
+            key=lambda r: r['total_ms'], reverse=True
+        ),
+        'time_sinks': {
+            run: sorted(
+                [{'span': name, 'count': v['count'], 'total_ms': round(v['ms'], 2)} for name, v in spans.items()],
+                key=lambda r: r['total_ms'], reverse=True
+            )[:top]
+            for run, spans in sinks.items()
+        }
+    }
+
+
+def print_report(report):
+    print("Slowest selectors (mean ms per attempt)")
+    for r in report['slowest_selectors']:
+        print(f"  {r['mean_ms']:>9.1f} ms  hit {r['hit_rate']:>5.0%}  n={r['attempts']:<6} {r['field']}: {r['xpath']}")
+    print("\nFallbacks that never hit")
+    if not report['never_hit']:
+        print("  (none)")
+    for r in report['never_hit']:
+        print(f"  {r['total_ms']:>11.1f} ms wasted  n={r['attempts']:<6} {r['field']}: {r['xpath']}")
+    for run, rows in report['time_sinks'].items():
+        print(f"\nTop time sinks for run {run}")
+        for r in rows:
+            print(f"  {r['total_ms'] / 1000:>9.1f} s  n={r['count']:<6} {r['span']}")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Scraper trace tools')
+    sub = parser.add_subparsers(dest='command', required=True)
+    report_parser = sub.add_parser('report', help='Aggregate trace files into a selector/time-sink report')
+    report_parser.add_argument('files', nargs='+', help='Trace JSONL files (globs allowed)')
+    report_parser.add_argument('--run', help='Only include this run id')
+    report_parser.add_argument('--top', type=int, default=10)
+    report_parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    report = build_report(args.files, run_id=args.run, top=args.top)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
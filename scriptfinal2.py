@@ -5,14 +5,14 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import (
     TimeoutException, 
-    NoSuchElementException,
     StaleElementReferenceException,
     WebDriverException
 )
 from twocaptcha import TwoCaptcha
-from undetected_chromedriver import Chrome as Driver
+from undetected_chromedriver import Chrome as Driver, ChromeOptions
 import time
 import random
+import tempfile
 import pandas as pd
 import os
 import re
@@ -22,21 +22,57 @@ from datetime import datetime
 import logging
 import schedule
 import traceback
+from collections import deque
+from scraper_metrics import (
+    PHASE_SECONDS, PAGES_TOTAL, CAPTCHAS_TOTAL, CAPTCHA_SOLVES_TOTAL,
+    RESTARTS_TOTAL, record_asin, start_metrics_server
+)
+from scraper_tracing import configure_tracing, trace_asin, span
+from scraper_logging import configure_logging, asin_context
+from selector_registry import SelectorRegistry
+from marketplaces import ShardConfig, DEFAULT_MARKETPLACE, MARKETPLACES
+from circuit_breaker import BREAKER, page_outcome
+from driver_watchdog import DriverWatchdog
+from nav_pipeline import NavigationPipeline
+from run_ledger import RunLedger, create_run_tables
+from load_planner import LoadPlanner, create_cost_table
+from drift_detector import DriftDetector, DAILY_FIELD_CEILINGS, DAILY_FIELD_DEFAULTS
+from negative_cache import NegativeCache, create_negative_cache_table
+from daily_movers import build_daily_movers
+from anomaly_check import run_anomaly_pass
+from tab_pool import TabPool, TAB_FAILURES_TOTAL, tab_lost
+from read_api import DAILY_CHANNEL, notify_changed
+from retry_queue import (
+    RetryQueue, ScrapeFailure, classify_failure, create_dead_letter_table, save_dead_letters
+)
 
 # Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("amazon_scraper.log"),
-        logging.StreamHandler()
-    ]
-)
+configure_logging("amazon_scraper.log")
 logger = logging.getLogger("AmazonScraper")
 
+# Storefront root; overridden by the benchmark suite to point at a local mock server
+AMAZON_BASE_URL = os.getenv('AMAZON_BASE_URL', 'https://www.amazon.com').rstrip('/')
+DEFAULT_ZIP_CODE = MARKETPLACES[DEFAULT_MARKETPLACE]['zip_code']
+
+# Product pages loaded ahead in background tabs (0 navigates one page at a time)
+PIPELINE_DEPTH = int(os.getenv('SCRAPER_PIPELINE_DEPTH', '0'))
+
+# Product tabs kept in flight in the one browser (1 uses the single-tab path)
+TABS = int(os.getenv('SCRAPER_TABS', '1'))
+
+# Hours a run is spread over by the load planner (0 scrapes as fast as pacing allows)
+WINDOW_HOURS = float(os.getenv('SCRAPER_WINDOW_HOURS', '0'))
+
+# Present on any usable product page; its absence means a dead or unparseable page
+PRODUCT_PAGE_XPATH = "//*[@id='productTitle'] | //*[@id='dp-container'] | //*[@id='centerCol']"
+
 class SimpleDatabaseManager:
-    def __init__(self, dbname="amazon_scraper", user="postgres", password="Talha", host="localhost", port="5432"):
+    def __init__(self, dbname="amazon_scraper", user="postgres", password="Talha", host="localhost", port="5432",
+                 marketplace=DEFAULT_MARKETPLACE, zip_code=DEFAULT_ZIP_CODE):
         self.conn = None
+        # Result partition this manager reads and writes
+        self.marketplace = marketplace
+        self.zip_code = zip_code
         self.db_params = {
             "dbname": dbname,
             "user": user,
@@ -68,10 +104,19 @@ class SimpleDatabaseManager:
                         price DECIMAL(10,2),
                         minimum_price DECIMAL(10,2),
                         offers INTEGER,
-                        best_seller_rank TEXT
+                        best_seller_rank TEXT,
+                        marketplace VARCHAR(5) NOT NULL DEFAULT 'US',
+                        zip_code VARCHAR(12) NOT NULL DEFAULT '11229'
                     )
                 """)
                 
+                # Partition columns for tables created before sharded runs
+                cur.execute("""
+                    ALTER TABLE daily_amazon_data
+                    ADD COLUMN IF NOT EXISTS marketplace VARCHAR(5) NOT NULL DEFAULT 'US',
+                    ADD COLUMN IF NOT EXISTS zip_code VARCHAR(12) NOT NULL DEFAULT '11229'
+                """)
+                
                 # Create a simple index on asin and date for quicker lookups
                 cur.execute("""
                     CREATE INDEX IF NOT EXISTS idx_daily_data_asin_date 
@@ -85,11 +130,27 @@ class SimpleDatabaseManager:
                         scan_date DATE NOT NULL DEFAULT CURRENT_DATE,
                         last_asin VARCHAR(10),
                         last_index INTEGER,
-                        completed BOOLEAN DEFAULT FALSE
+                        completed BOOLEAN DEFAULT FALSE,
+                        marketplace VARCHAR(5) NOT NULL DEFAULT 'US',
+                        zip_code VARCHAR(12) NOT NULL DEFAULT '11229'
                     )
                 """)
+                cur.execute("""
+                    ALTER TABLE scraper_checkpoint
+                    ADD COLUMN IF NOT EXISTS marketplace VARCHAR(5) NOT NULL DEFAULT 'US',
+                    ADD COLUMN IF NOT EXISTS zip_code VARCHAR(12) NOT NULL DEFAULT '11229'
+                """)
                 
                 self.conn.commit()
+                
+                # ASINs that exhausted their deferred retries
+                create_dead_letter_table(self.conn)
+                # One summary row per run, with per-driver breakdowns
+                create_run_tables(self.conn)
+                # Historical per-ASIN cost, used to plan windowed runs
+                create_cost_table(self.conn)
+                # Dead and unavailable ASINs skipped until their next check
+                create_negative_cache_table(self.conn)
                 logger.info("Tables created successfully")
         except Exception as e:
             logger.error(f"Error creating tables: {str(e)}")
@@ -97,7 +158,7 @@ class SimpleDatabaseManager:
             raise
 
     def add_unique_constraint(self):
-        """Add unique constraint for asin and scan_date if it doesn't exist"""
+        """Add unique constraint for asin, scan_date and region if it doesn't exist"""
         try:
             with self.conn.cursor() as cur:
                 # Check if constraint exists
@@ -106,17 +167,21 @@ class SimpleDatabaseManager:
                     FROM information_schema.table_constraints 
                     WHERE table_name = 'daily_amazon_data' 
                     AND constraint_type = 'UNIQUE'
-                    AND constraint_name = 'unique_asin_date'
+                    AND constraint_name = 'unique_asin_date_region'
                 """)
                 
                 if cur.fetchone() is None:
-                    # Constraint doesn't exist, so add it
+                    # Constraint doesn't exist, so replace the single-region one with it
+                    cur.execute("""
+                        ALTER TABLE daily_amazon_data 
+                        DROP CONSTRAINT IF EXISTS unique_asin_date
+                    """)
                     cur.execute("""
                         ALTER TABLE daily_amazon_data 
-                        ADD CONSTRAINT unique_asin_date UNIQUE (asin, scan_date)
+                        ADD CONSTRAINT unique_asin_date_region UNIQUE (asin, scan_date, marketplace, zip_code)
                     """)
                     self.conn.commit()
-                    logger.info("Added unique constraint on asin and scan_date")
+                    logger.info("Added unique constraint on asin, scan_date, marketplace and zip_code")
                 else:
                     logger.info("Unique constraint already exists")
         except Exception as e:
@@ -129,7 +194,7 @@ class SimpleDatabaseManager:
         Each call will save just the results passed in this call.
         """
         try:
-            with self.conn.cursor() as cur:
+            with PHASE_SECONDS.time(scraper='daily', phase='db_flush'), self.conn.cursor() as cur:
                 # Filter out results with None ASINs
                 valid_results = [r for r in batch_results if r['asin']]
                 
@@ -154,21 +219,25 @@ class SimpleDatabaseManager:
                         result['price'],
                         result['minimum_price'],
                         offers,
-                        result['best_seller_rank']
+                        result['best_seller_rank'],
+                        self.marketplace,
+                        self.zip_code
                     ))
                 
                 # Insert only the current batch for today
                 execute_values(cur, """
                     INSERT INTO daily_amazon_data 
-                    (asin, scan_date, price, minimum_price, offers, best_seller_rank)
+                    (asin, scan_date, price, minimum_price, offers, best_seller_rank, marketplace, zip_code)
                     VALUES %s
-                    ON CONFLICT (asin, scan_date) DO UPDATE SET
+                    ON CONFLICT (asin, scan_date, marketplace, zip_code) DO UPDATE SET
                     price = EXCLUDED.price,
                     minimum_price = EXCLUDED.minimum_price,
                     offers = EXCLUDED.offers,
                     best_seller_rank = EXCLUDED.best_seller_rank
                 """, data_to_insert)
                 
+                # Evict these ASINs from the read API cache once the batch commits
+                notify_changed(cur, DAILY_CHANNEL, [row[0] for row in data_to_insert])
                 self.conn.commit()
                 logger.info(f"Successfully saved batch of {len(valid_results)} products to database for date: {today_date}")
         except Exception as e:
@@ -185,8 +254,8 @@ class SimpleDatabaseManager:
                 # Check if we have a checkpoint for today
                 cur.execute("""
                     SELECT id FROM scraper_checkpoint 
-                    WHERE scan_date = %s
-                """, (today_date,))
+                    WHERE scan_date = %s AND marketplace = %s AND zip_code = %s
+                """, (today_date, self.marketplace, self.zip_code))
                 
                 checkpoint_exists = cur.fetchone()
                 
@@ -195,15 +264,15 @@ class SimpleDatabaseManager:
                     cur.execute("""
                         UPDATE scraper_checkpoint 
                         SET last_asin = %s, last_index = %s, completed = %s
-                        WHERE scan_date = %s
-                    """, (asin, index, completed, today_date))
+                        WHERE scan_date = %s AND marketplace = %s AND zip_code = %s
+                    """, (asin, index, completed, today_date, self.marketplace, self.zip_code))
                 else:
                     # Create new checkpoint
                     cur.execute("""
                         INSERT INTO scraper_checkpoint 
-                        (scan_date, last_asin, last_index, completed)
-                        VALUES (%s, %s, %s, %s)
-                    """, (today_date, asin, index, completed))
+                        (scan_date, last_asin, last_index, completed, marketplace, zip_code)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                    """, (today_date, asin, index, completed, self.marketplace, self.zip_code))
                 
                 self.conn.commit()
                 logger.info(f"Checkpoint saved: ASIN={asin}, Index={index}, Completed={completed}")
@@ -220,8 +289,8 @@ class SimpleDatabaseManager:
                 cur.execute("""
                     SELECT last_asin, last_index, completed 
                     FROM scraper_checkpoint 
-                    WHERE scan_date = %s
-                """, (today_date,))
+                    WHERE scan_date = %s AND marketplace = %s AND zip_code = %s
+                """, (today_date, self.marketplace, self.zip_code))
                 
                 result = cur.fetchone()
                 
@@ -244,8 +313,8 @@ class SimpleDatabaseManager:
                 
                 cur.execute("""
                     SELECT asin FROM daily_amazon_data 
-                    WHERE scan_date = %s
-                """, (today_date,))
+                    WHERE scan_date = %s AND marketplace = %s AND zip_code = %s
+                """, (today_date, self.marketplace, self.zip_code))
                 
                 results = cur.fetchall()
                 return [r[0] for r in results] if results else []
@@ -253,6 +322,16 @@ class SimpleDatabaseManager:
             logger.error(f"Error retrieving scraped ASINs: {str(e)}")
             return []
 
+    def save_dead_letters(self, entries):
+        """Record ASINs that exhausted their retries in scrape_dead_letter"""
+        if not entries:
+            return
+        try:
+            save_dead_letters(self.conn, entries, 'daily', self.marketplace, self.zip_code)
+        except Exception as e:
+            logger.error(f"Error saving dead letters: {str(e)}")
+            self.conn.rollback()
+
     def close(self):
         if self.conn:
             self.conn.close()
@@ -268,13 +347,13 @@ def delete_all_cookies(driver):
         logger.error(f"Error deleting cookies: {str(e)}")
 
 
-def login_and_setup(driver, max_attempts=3):
+def login_and_setup(driver, max_attempts=3, base_url=None, zip_code=DEFAULT_ZIP_CODE):
     """Initialize Amazon session and handle initial setup with retry logic"""
     delete_all_cookies(driver)
     
     for attempt in range(max_attempts):
         try:
-            url = "https://www.amazon.com"
+            url = base_url or AMAZON_BASE_URL
             driver.get(url)
             
             # Short wait for initial page load
@@ -300,7 +379,7 @@ def login_and_setup(driver, max_attempts=3):
                 
                 # Check and set location if needed
                 location_text = location_element.text.strip()
-                if "11229" not in location_text:
+                if zip_code not in location_text:
                     try:
                         # Accept cookies if present
                         try:
@@ -318,7 +397,7 @@ def login_and_setup(driver, max_attempts=3):
                             EC.presence_of_element_located((By.XPATH, "//input[@id='GLUXZipUpdateInput']"))
                         )
                         zip_input.clear()
-                        zip_input.send_keys("11229")
+                        zip_input.send_keys(zip_code)
                         
                         update_button = WebDriverWait(driver, 5).until(
                             EC.element_to_be_clickable((By.XPATH, "//span[@data-action='GLUXPostalUpdateAction']/input[@class='a-button-input']"))
@@ -366,10 +445,16 @@ def handle_captcha(driver, max_attempts=3):
                 
                 # Try to find and solve the captcha
                 captcha_image = driver.find_element(By.XPATH, "//form[@action='/errors/validateCaptcha']//img")
-                captcha_image.screenshot("captcha.png")
-                
-                # Solve with 2Captcha
-                result = solver.normal('captcha.png')
+                # A file per solve, so shards running as threads never send each other's image
+                with tempfile.NamedTemporaryFile(prefix='captcha_', suffix='.png', delete=False) as image:
+                    image_path = image.name
+                try:
+                    captcha_image.screenshot(image_path)
+                    
+                    # Solve with 2Captcha
+                    result = solver.normal(image_path)
+                finally:
+                    os.remove(image_path)
                 if not result.get("code"):
                     logger.error("Failed to get captcha solution code")
                     attempts += 1
@@ -411,9 +496,15 @@ def handle_captcha(driver, max_attempts=3):
     return False
 
 
-def initialize_driver():
+def initialize_driver(proxy=None):
     """Initialize and return the WebDriver with proper configuration"""
     try:
+        if proxy:
+            options = ChromeOptions()
+            options.add_argument(proxy.chrome_argument)
+            driver = Driver(uc=True, options=options)
+            logger.info(f"WebDriver initialized successfully through proxy {proxy.label}")
+            return driver
         driver = Driver(uc=True)
         logger.info("WebDriver initialized successfully")
         return driver
@@ -423,14 +514,39 @@ def initialize_driver():
 
 
 class AmazonProductScraper:
-    def __init__(self, driver, db_manager, excel_file='cleaned_asin.xlsx'):
+    def __init__(self, driver, db_manager, excel_file='cleaned_asin.xlsx', proxy_lease=None,
+                 base_url=None, rate_limiter=None, retry_queue=None, pipeline_depth=0, tabs=1, planner=None,
+                 drift=None, negative_cache=None, shard=None):
         self.driver = driver
         self.db_manager = db_manager
+        # Names this shard's state files, so concurrent shards keep their own
+        self.shard = shard or ShardConfig(job='daily', marketplace=db_manager.marketplace, zip_code=db_manager.zip_code)
+        self.proxy_lease = proxy_lease
+        self.base_url = base_url or AMAZON_BASE_URL
+        self.rate_limiter = rate_limiter
+        # Shared across driver restarts so deferred retries survive them
+        self.retry_queue = retry_queue if retry_queue is not None else RetryQueue('daily')
+        # Spreads the run over its window; also shared across driver restarts
+        self.planner = planner
+        # Watches the field default rates for a layout change
+        self.drift = drift or DriftDetector('daily', DAILY_FIELD_DEFAULTS, ceilings=DAILY_FIELD_CEILINGS,
+                                            shard=self.shard.name)
+        # Dead ASINs skipped until their entry expires
+        self.negative = negative_cache if negative_cache is not None else NegativeCache('daily', db_manager.marketplace)
         self.solver = TwoCaptcha(os.getenv('APIKEY_2CAPTCHA', 'b6bf51f9305ea298f4f2e8946bf46773'))
         self.load_asins(excel_file)
         self.captcha_failures = 0
         self.consecutive_errors = 0
         self.max_consecutive_errors = 5
+        self.selectors = SelectorRegistry('daily', stats_file=f'selector_stats_{self.shard.name}.json')
+        # Asks for a fresh browser after too many pages or too much memory
+        self.watchdog = DriverWatchdog('daily')
+        self.watchdog.attach(driver)
+        # Several ASINs in flight in their own tabs, or the next ASINs prefetched behind the current one
+        self.tabs = TabPool(driver, 'daily', tabs=tabs, pace=self.pace) if tabs > 1 else None
+        self.pipeline = None
+        if pipeline_depth and not self.tabs:
+            self.pipeline = NavigationPipeline(driver, 'daily', depth=pipeline_depth, pace=self.pace)
         
     def load_asins(self, excel_file):
         try:
@@ -441,179 +557,298 @@ class AmazonProductScraper:
             logger.error(f"Error reading Excel file: {str(e)}")
             self.asins = []
 
+    def _read_selector(self, strategy):
+        """Read the raw text for a selector strategy from the current page"""
+        element = self.driver.find_element(By.XPATH, strategy['xpath'])
+        if strategy.get('attribute'):
+            text = element.get_attribute(strategy['attribute']) or element.text
+        else:
+            text = element.text
+        if strategy.get('fraction_xpath'):
+            fraction = self.driver.find_element(By.XPATH, strategy['fraction_xpath']).text
+            return f"{text}.{fraction}" if text else None
+        return text
+
     def extract_price(self):
         try:
-            # Try the standard price element first
-            try:
-                price_whole = self.driver.find_element(By.XPATH, "//span[@class='a-price-whole']").text
-                price_fraction = self.driver.find_element(By.XPATH, "//span[@class='a-price-fraction']").text
-                price = f"{price_whole}.{price_fraction}" if price_whole else None
-            except NoSuchElementException:
-                # Try alternative price elements
-                try:
-                    price_element = self.driver.find_element(By.XPATH, "//*[@id='corePriceDisplay_desktop_feature_div']/div[1]/span/span[1]")
-                    price = price_element.text.strip().replace('$', '')
-                except NoSuchElementException:
-                    try:
-                        price_element = self.driver.find_element(By.XPATH, "//span[@id='price_inside_buybox']")
-                        price = price_element.text.strip().replace('$', '')
-                    except:
-                        price = None
-            
+            price = self.selectors.extract(
+                'price', self._read_selector, lambda text: text.strip().replace('$', '')
+            )
             return float(price) if price and price.replace('.', '').isdigit() else None
         except:
             return None
 
     def extract_best_seller_rank(self):
+        def parse(rank_section):
+            cleaned_rank = re.sub(r'<[^>]+>', '', rank_section).strip()
+            cleaned_rank = re.sub(r'\s*\([^)]*\)', '', cleaned_rank)
+            ranks = []
+            for rank in cleaned_rank.split('#'):
+                if rank.strip():
+                    ranks.append('#' + rank.strip())
+            return ', '.join(ranks).strip()
+
         try:
-            # Try multiple XPaths for best seller rank
-            for xpath in [
-                "//th[contains(text(), 'Best Sellers Rank')]/following-sibling::td",
-                "//span[contains(text(), 'Best Sellers Rank')]/following::span[1]",
-                "//*[contains(text(), 'Best Sellers Rank')]/.."
-            ]:
-                try:
-                    rank_section = self.driver.find_element(By.XPATH, xpath).text
-                    if rank_section:
-                        cleaned_rank = re.sub(r'<[^>]+>', '', rank_section).strip()
-                        cleaned_rank = re.sub(r'\s*\([^)]*\)', '', cleaned_rank)
-                        ranks = []
-                        for rank in cleaned_rank.split('#'):
-                            if rank.strip():
-                                ranks.append('#' + rank.strip())
-                        best_seller_rank = ', '.join(ranks).strip()
-                        return best_seller_rank
-                except NoSuchElementException:
-                    continue
-            
-            return 'Not ranked'
+            return self.selectors.extract('best_seller_rank', self._read_selector, parse) or 'Not ranked'
         except:
             return 'Not ranked'
 
     def extract_offers(self):
+        def parse(offers_text):
+            offers_match = re.search(r'\((\d+)\)', offers_text)
+            return offers_match.group(1) if offers_match else None
+
         try:
-            # Try multiple XPaths for offers
-            for xpath in [
-                "//div[@id='dynamic-aod-ingress-box']//span[@class='a-declarative']/span[1]",
-                "//span[contains(text(), 'New')]/span[contains(text(), 'from')]",
-                "//div[contains(@id, 'olp_feature_div')]//span"
-            ]:
-                try:
-                    offers_text = self.driver.find_element(By.XPATH, xpath).text
-                    offers_match = re.search(r'\((\d+)\)', offers_text)
-                    if offers_match:
-                        return offers_match.group(1)
-                except NoSuchElementException:
-                    continue
-            
             # If no offers found but product page loaded, assume at least 1 offer
-            return '1'
+            return self.selectors.extract('offers', self._read_selector, parse) or '1'
         except:
             return '1'
 
     def extract_minimum_price(self):
         try:
-            # Try different XPaths for minimum price
-            for xpath_pair in [
-                (
-                    "//div[@id='dynamic-aod-ingress-box']//div//div//a/span[@class='a-declarative']/span[@class='a-price']/span[2]/span[@class='a-price-whole']",
-                    "//div[@id='dynamic-aod-ingress-box']//div//div//a/span[@class='a-declarative']/span[@class='a-price']/span[2]//span[@class='a-price-fraction']"
-                ),
-                (
-                    "//div[contains(@id, 'olp_feature_div')]//span[@class='a-price']/span[@class='a-offscreen']",
-                    None
-                )
-            ]:
-                try:
-                    if xpath_pair[1]:  # Two-part price (whole and fraction)
-                        min_price_whole = self.driver.find_element(By.XPATH, xpath_pair[0]).text
-                        min_price_fraction = self.driver.find_element(By.XPATH, xpath_pair[1]).text
-                        if min_price_whole:
-                            min_price = f"{min_price_whole}.{min_price_fraction}"
-                            return float(min_price)
-                    else:  # Price in a single element
-                        price_element = self.driver.find_element(By.XPATH, xpath_pair[0])
-                        price_text = price_element.get_attribute("textContent") or price_element.text
-                        price_text = price_text.replace('$', '').strip()
-                        if price_text:
-                            return float(price_text)
-                except (NoSuchElementException, ValueError):
-                    continue
+            min_price = self.selectors.extract(
+                'minimum_price', self._read_selector, lambda text: float(text.replace('$', '').strip())
+            )
+            if min_price:
+                return min_price
             
             # If no minimum price is found, return the main price
             return self.extract_price()
         except:
             return self.extract_price()
 
-    def scrape_product(self, asin):
-        url = f'https://www.amazon.com/dp/{asin}'
-        max_retries = 3
-        retry_count = 0
+    def pace(self):
+        """Block until the breaker and the proxy or shard rate limit allow another page load"""
+        # Held here while the fleet-wide breaker is open or throttling
+        BREAKER.before_request('daily')
+        self.drift.before_request()
+        if self.proxy_lease:
+            self.proxy_lease.throttle()
+        elif self.rate_limiter:
+            self.rate_limiter.take()
+
+    def scrape_product(self, asin, upcoming=(), loaded=None):
+        """
+        Make one attempt at an ASIN. Returns the product data, or raises
+        ScrapeFailure with a category so the caller can defer a retry.
         
-        while retry_count < max_retries:
-            try:
-                self.driver.get(url)
-                
-                # Use shorter wait for initial page load
-                time.sleep(random.uniform(1, 2))
-                
-                # Check for captcha
-                if "Type the characters you see in this image" in self.driver.page_source:
-                    logger.info(f"Captcha detected for ASIN {asin}")
-                    if not handle_captcha(self.driver):
-                        self.captcha_failures += 1
-                        if self.captcha_failures >= 3:
-                            logger.warning("Multiple captcha failures, need to restart driver")
-                            raise Exception("Multiple captcha failures")
-                        retry_count += 1
-                        continue
-                    else:
-                        self.captcha_failures = 0  # Reset captcha failure counter after success
-                        # Add an extra wait after solving captcha
-                        time.sleep(random.uniform(2, 3))
-                
-                # Short wait after captcha handling
+        :param upcoming: ASINs expected next, prefetched while this one is extracted when pipelining
+        :param loaded: Seconds the page took to load in a tab of the tab pool; the page is not fetched again
+        """
+        url = f'{self.base_url}/dp/{asin}'
+        
+        # A proxy rested by the pool mid-run needs a new driver on a fresh proxy
+        if self.proxy_lease and not self.proxy_lease.usable:
+            logger.warning(f"Proxy {self.proxy_lease.proxy.label} was rested, need to restart driver")
+            raise Exception("Proxy rested")
+        
+        # A prefetched page was paced when its load started
+        prefetched = loaded
+        if prefetched is None and self.pipeline is not None:
+            with PHASE_SECONDS.time(scraper='daily', phase='prefetch_wait'):
+                prefetched = self.pipeline.take(asin)
+        if prefetched is None:
+            self.pace()
+        
+        try:
+            if prefetched is None:
+                nav_started = time.perf_counter()
+                with PHASE_SECONDS.time(scraper='daily', phase='navigation'), \
+                        span('fetch', attempt=self.retry_queue.attempts(asin) + 1):
+                    self.driver.get(url)
+                    nav_seconds = time.perf_counter() - nav_started
+                    
+                    # Use shorter wait for initial page load
+                    time.sleep(random.uniform(1, 2))
+                if self.pipeline is not None:
+                    self.pipeline.navigated()
+            else:
+                nav_seconds = prefetched
+            PAGES_TOTAL.inc(scraper='daily')
+            self.watchdog.page_loaded()
+            
+            # Check for captcha
+            with PHASE_SECONDS.time(scraper='daily', phase='captcha_detect'):
+                captcha_present = "Type the characters you see in this image" in self.driver.page_source
+            if self.proxy_lease:
+                self.proxy_lease.report('captcha' if captcha_present else 'ok', nav_seconds)
+            if captcha_present:
+                logger.info(f"Captcha detected for ASIN {asin}")
+                CAPTCHAS_TOTAL.inc(scraper='daily')
+                BREAKER.record('daily', 'captcha')
+                with PHASE_SECONDS.time(scraper='daily', phase='captcha_solve'), span('captcha') as captcha_span:
+                    solved = handle_captcha(self.driver)
+                    captcha_span.set(solved=solved)
+                CAPTCHA_SOLVES_TOTAL.inc(scraper='daily', result='solved' if solved else 'failed')
+                if not solved:
+                    self.captcha_failures += 1
+                    if self.captcha_failures >= 3:
+                        logger.warning("Multiple captcha failures, need to restart driver")
+                        raise Exception("Multiple captcha failures")
+                    raise ScrapeFailure('captcha', 'captcha not solved')
+                else:
+                    self.captcha_failures = 0  # Reset captcha failure counter after success
+                    # Add an extra wait after solving captcha
+                    time.sleep(random.uniform(2, 3))
+            
+            # Short wait after captcha handling; a prefetched page has already settled in the background
+            if prefetched is None or captcha_present:
                 time.sleep(random.uniform(1, 2))
-                
-                # Extract product data
-                result = {
-                    'asin': asin,
-                    'price': self.extract_price(),
-                    'best_seller_rank': self.extract_best_seller_rank(),
-                    'offers': self.extract_offers(),
-                    'minimum_price': self.extract_minimum_price()
-                }
-                
-                # Reset consecutive error counter on success
-                self.consecutive_errors = 0
-                
-                # Delay before next request, shorter than original
+            
+            # Anything without product markup is a dead, blocked or broken page, not an unranked product
+            has_product_markup = bool(self.driver.find_elements(By.XPATH, PRODUCT_PAGE_XPATH))
+            if not has_product_markup:
+                page_source = self.driver.page_source
+                if not captcha_present:
+                    BREAKER.record('daily', page_outcome(page_source, has_product_markup))
+                raise ScrapeFailure(classify_failure(page_source=page_source), 'no product markup on page')
+            if not captcha_present:
+                BREAKER.record('daily', 'ok')
+            
+            # Start the next pages loading while this one is extracted; only after a good page,
+            # so a block or captcha falls back to one navigation at a time
+            if self.pipeline is not None:
+                self.pipeline.fill((next_asin, f'{self.base_url}/dp/{next_asin}') for next_asin in upcoming)
+            
+            # Extract product data
+            result = {'asin': asin}
+            with PHASE_SECONDS.time(scraper='daily', phase='extract_price'):
+                result['price'] = self.extract_price()
+            with PHASE_SECONDS.time(scraper='daily', phase='extract_best_seller_rank'):
+                result['best_seller_rank'] = self.extract_best_seller_rank()
+            with PHASE_SECONDS.time(scraper='daily', phase='extract_offers'):
+                result['offers'] = self.extract_offers()
+            with PHASE_SECONDS.time(scraper='daily', phase='extract_minimum_price'):
+                result['minimum_price'] = self.extract_minimum_price()
+            self.drift.observe(asin, result, lambda: self.driver.page_source)
+            
+            # Reset consecutive error counter on success
+            self.consecutive_errors = 0
+            
+            # Delay before next request, shorter than original; the pipeline spaces out its own navigations
+            if self.pipeline is None and not self.tabs:
                 time.sleep(random.uniform(1.5, 3))
-                
-                return result
-                
-            except Exception as e:
-                logger.error(f"Error scraping ASIN {asin}: {str(e)}")
-                retry_count += 1
-                self.consecutive_errors += 1
-                
-                # If too many consecutive errors, signal need for driver restart
-                if self.consecutive_errors >= self.max_consecutive_errors:
-                    logger.warning(f"Too many consecutive errors ({self.consecutive_errors}), need to restart driver")
-                    raise Exception("Too many consecutive errors")
-                
-                if retry_count < max_retries:
-                    logger.info(f"Retrying... Attempt {retry_count + 1} of {max_retries}")
-                    time.sleep(random.uniform(3, 5))
-                else:
-                    logger.warning(f"Max retries reached for ASIN {asin}")
-                    return {
-                        'asin': asin,
-                        'price': None,
-                        'best_seller_rank': 'Error',
-                        'offers': None,
-                        'minimum_price': None
-                    }
+            
+            return result
+            
+        except ScrapeFailure:
+            raise
+        except Exception as e:
+            if "Multiple captcha failures" in str(e):
+                raise
+            if self.tabs and tab_lost(e):
+                # Only this tab is gone; the browser and the other tabs carry on
+                logger.warning(f"Tab for ASIN {asin} crashed during extraction")
+                TAB_FAILURES_TOTAL.inc(scraper='daily', reason='crashed')
+                raise ScrapeFailure('error', 'tab crashed')
+            logger.error(f"Error scraping ASIN {asin}: {str(e)}")
+            if self.proxy_lease and isinstance(e, WebDriverException):
+                self.proxy_lease.report('error')
+            BREAKER.record('daily', 'error')
+            self.consecutive_errors += 1
+            
+            # If too many consecutive errors, signal need for driver restart
+            if self.consecutive_errors >= self.max_consecutive_errors:
+                logger.warning(f"Too many consecutive errors ({self.consecutive_errors}), need to restart driver")
+                raise Exception("Too many consecutive errors")
+            
+            try:
+                page_source = self.driver.page_source
+            except Exception:
+                page_source = None
+            raise ScrapeFailure(classify_failure(e, page_source), str(e))
+
+    def _defer(self, asin, failure, batch_results):
+        """Queue a failed ASIN for a later retry; once dead-lettered it is stored as an error row"""
+        # The re-probe of an expired dead ASIN is one attempt; still dead means cached again, no retries
+        if self.negative.probing(asin) and self.negative.record_dead(asin, failure.category, failure.message):
+            return True
+        dead = self.retry_queue.fail(asin, failure.category, failure.message)
+        if dead:
+            self.negative.record_dead(asin, dead.category, dead.last_error)
+            batch_results.append({
+                'asin': asin,
+                'price': None,
+                'best_seller_rank': 'Error',
+                'offers': None,
+                'minimum_price': None
+            })
+        return dead
+
+    def _next_asin(self, fresh, already_scraped, block=True):
+        """
+        Next (index, asin, is_retry) to work on: a retry whose backoff has
+        elapsed, else the next fresh ASIN, else wait for the earliest retry.
+        Returns None when both are exhausted, or without waiting if block is False.
+        """
+        while True:
+            retry_asin = self.retry_queue.pop_due()
+            if retry_asin:
+                return None, retry_asin, True
+            while fresh:
+                i, asin = fresh.popleft()
+                if asin in already_scraped:
+                    logger.info(f"Skipping ASIN {asin} (already scraped today)")
+                    continue
+                if self.negative.skip(asin):
+                    continue
+                if self.planner:
+                    self.planner.wait(asin)
+                return i, asin, False
+            wait = self.retry_queue.seconds_until_next()
+            if wait is None or not block:
+                return None
+            logger.info(f"Fresh work done, waiting {wait:.0f}s for {len(self.retry_queue)} deferred retries")
+            time.sleep(min(wait, 30))
+
+    def _announce(self, index, asin, is_retry):
+        if not is_retry:
+            logger.info(f"Scraping product {index} of {len(self.asins)}: {asin}")
+        else:
+            logger.info(f"Retrying ASIN {asin} (attempt {self.retry_queue.attempts(asin) + 1})")
+
+    def _requeue_tabs(self):
+        """Close every tab still in flight and make its ASIN the first work of the next driver"""
+        if self.tabs:
+            for slot in self.tabs.drain():
+                self.retry_queue.requeue(slot.asin)
+
+    def _restart_needed(self, asin, batch_results, last_index):
+        """
+        Requeue the ASINs still in tabs, save the batch, dead letters and a
+        checkpoint, and return the result asking for a new driver.
+        """
+        self.selectors.save()
+        self._requeue_tabs()
+        
+        # Save current batch before restarting
+        if batch_results:
+            logger.info("Saving current batch before driver restart")
+            self.db_manager.save_product_data(batch_results)
+        self.db_manager.save_dead_letters(self.retry_queue.take_dead_letters())
+        
+        # Save checkpoint so we can resume with the next fresh ASIN
+        resume_index = last_index - 1
+        self.db_manager.save_checkpoint(asin, resume_index, completed=False)
+        
+        # Signal the calling function to restart the driver
+        logger.info(f"Need to restart driver and resume from index {resume_index + 1}")
+        return {
+            'status': 'restart_needed',
+            'resume_index': resume_index
+        }
+
+    def _upcoming(self, fresh, already_scraped):
+        """The fresh ASINs the pipeline should be loading next"""
+        if self.pipeline is None:
+            return []
+        upcoming = []
+        for _, asin in fresh:
+            if len(upcoming) >= self.pipeline.depth:
+                break
+            if asin not in already_scraped:
+                upcoming.append(asin)
+        return upcoming
 
     def scrape_all_products(self, start_index=0):
         batch_results = []
@@ -629,50 +864,136 @@ class AmazonProductScraper:
             start_index = checkpoint['last_index']
             logger.info(f"Resuming from checkpoint at index {start_index}")
         
-        for i, asin in enumerate(self.asins[start_index:], start_index + 1):
-            # Skip if already scraped today
-            if asin in already_scraped:
-                logger.info(f"Skipping ASIN {asin} (already scraped today)")
-                continue
-            
-            logger.info(f"Scraping product {i} of {len(self.asins)}: {asin}")
+        fresh = deque(enumerate(self.asins[start_index:], start_index + 1))
+        last_index = start_index
+        if self.planner and not self.planner.planned:
+            self.planner.plan([asin for _, asin in fresh
+                               if asin not in already_scraped and not self.negative.cached(asin)], self.db_manager.conn)
+        
+        while True:
+            slot = None
+            if self.tabs:
+                # Keep every tab loading an ASIN; only wait for retries once no tab is in flight
+                while self.tabs.idle:
+                    work = self._next_asin(fresh, already_scraped, block=not self.tabs.busy)
+                    if work is None:
+                        break
+                    index, asin, is_retry = work
+                    if not is_retry:
+                        last_index = index
+                    self._announce(index, asin, is_retry)
+                    try:
+                        self.tabs.dispatch(asin, f'{self.base_url}/dp/{asin}', index=index, is_retry=is_retry)
+                    except Exception as e:
+                        logger.error(f"Could not open a tab for ASIN {asin}: {str(e)}")
+                        self.retry_queue.requeue(asin)
+                        return self._restart_needed(asin, batch_results, last_index)
+                if not self.tabs.busy:
+                    break
+                try:
+                    slot = self.tabs.next_ready()
+                except Exception as e:
+                    logger.error(f"Lost the browser while waiting for a tab: {str(e)}")
+                    return self._restart_needed(asin, batch_results, last_index)
+                index, asin, is_retry = slot.index, slot.asin, slot.is_retry
+            else:
+                work = self._next_asin(fresh, already_scraped)
+                if work is None:
+                    break
+                index, asin, is_retry = work
+                if not is_retry:
+                    last_index = index
+                self._announce(index, asin, is_retry)
             
             try:
-                result = self.scrape_product(asin)
-                batch_results.append(result)
-                
-                # Save checkpoint regularly
-                if i % 5 == 0:  # Save checkpoint every 5 products
-                    self.db_manager.save_checkpoint(asin, i, completed=False)
-                
-                # Save progress when batch size is reached
-                if len(batch_results) >= batch_size:
-                    logger.info(f"Saving batch of {len(batch_results)} products")
-                    self.db_manager.save_product_data(batch_results)
-                    # Clear the batch after saving
-                    batch_results = []
-            
-            except Exception as e:
-                if "Multiple captcha failures" in str(e) or "Too many consecutive errors" in str(e):
-                    # Save current batch before restarting
-                    if batch_results:
-                        logger.info(f"Saving current batch before driver restart")
-                        self.db_manager.save_product_data(batch_results)
+                with trace_asin(asin, scraper='daily', index=last_index, retry=is_retry), \
+                        asin_context(asin, 'daily', retry=is_retry):
+                    asin_started = time.perf_counter()
+                    try:
+                        if slot and slot.failure:
+                            raise slot.failure
+                        result = self.scrape_product(
+                            asin, upcoming=self._upcoming(fresh, already_scraped),
+                            loaded=slot.load_seconds if slot else None
+                        )
+                    except ScrapeFailure as failure:
+                        if self._defer(asin, failure, batch_results):
+                            record_asin('daily', 'failed', time.perf_counter() - asin_started)
+                    else:
+                        self.retry_queue.succeed(asin)
+                        self.negative.record_alive(asin)
+                        record_asin('daily', 'success', time.perf_counter() - asin_started)
+                        batch_results.append(result)
+                    if self.planner:
+                        self.planner.done(asin, time.perf_counter() - asin_started)
                     
-                    # Save checkpoint so we can resume from this point
-                    self.db_manager.save_checkpoint(asin, i-1, completed=False)
+                    # Save checkpoint regularly
+                    if not is_retry and index % 5 == 0:  # Save checkpoint every 5 products
+                        self.db_manager.save_checkpoint(asin, index, completed=False)
                     
-                    # Signal the calling function to restart the driver
-                    logger.info(f"Need to restart driver and resume from index {i}")
-                    return {
-                        'status': 'restart_needed',
-                        'resume_index': i-1  # Resume from the previous index
-                    }
+                    # Save progress when batch size is reached
+                    if len(batch_results) >= batch_size:
+                        logger.info(f"Saving batch of {len(batch_results)} products")
+                        with span('db_write', rows=len(batch_results)):
+                            self.db_manager.save_product_data(batch_results)
+                            self.db_manager.save_dead_letters(self.retry_queue.take_dead_letters())
+                        # Clear the batch after saving
+                        batch_results = []
+            
+            except Exception as e:
+                if any(reason in str(e) for reason in ("Multiple captcha failures", "Too many consecutive errors", "Proxy rested")):
+                    # The interrupted ASIN, and any others still loading in tabs, are retried first by the next driver
+                    self.retry_queue.requeue(asin)
+                    if slot:
+                        self.tabs.release(slot)
+                    return self._restart_needed(asin, batch_results, last_index)
+                logger.error(f"Error processing ASIN {asin}: {str(e)}")
+            
+            if slot:
+                self.tabs.release(slot)
+            
+            # A layout change would only produce empty records from here on
+            if self.drift.stop_requested:
+                if self.pipeline is not None:
+                    self.pipeline.discard()
+                self._requeue_tabs()
+                self.selectors.save()
+                if batch_results:
+                    logger.info("Saving current batch before stopping on selector drift")
+                    self.db_manager.save_product_data(batch_results)
+                self.db_manager.save_dead_letters(self.retry_queue.take_dead_letters())
+                self.db_manager.save_checkpoint(asin, last_index, completed=False)
+                return {
+                    'status': 'drift_stopped',
+                    'resume_index': last_index - 1
+                }
+            
+            # Recycle a long-lived or bloated browser between ASINs, never mid-page
+            recycle_reason = self.watchdog.should_recycle()
+            if recycle_reason:
+                if self.pipeline is not None:
+                    self.pipeline.discard()
+                self._requeue_tabs()
+                self.selectors.save()
+                if batch_results:
+                    logger.info("Saving current batch before driver recycle")
+                    self.db_manager.save_product_data(batch_results)
+                self.db_manager.save_dead_letters(self.retry_queue.take_dead_letters())
+                self.db_manager.save_checkpoint(asin, last_index, completed=False)
+                return {
+                    'status': 'recycle',
+                    'reason': recycle_reason,
+                    'resume_index': last_index - 1
+                }
         
         # Save any remaining results in the final batch
         if batch_results:
             logger.info(f"Saving final batch of {len(batch_results)} products")
             self.db_manager.save_product_data(batch_results)
+        self.db_manager.save_dead_letters(self.retry_queue.take_dead_letters())
+        
+        # Persist selector hit rates so the next run starts with the best ordering
+        self.selectors.save()
         
         # Mark process as completed
         self.db_manager.save_checkpoint(self.asins[-1] if self.asins else '', len(self.asins), completed=True)
@@ -682,16 +1003,53 @@ class AmazonProductScraper:
             'message': "Scraping completed successfully"
         }
 
+    def verify_products(self, asins):
+        """
+        Scrape asins a second time, one attempt each, for the anomaly pass.
+        Returns {asin: product data} for the ASINs that scraped; stops early
+        when the driver needs a restart.
+        """
+        verified = {}
+        for asin in asins:
+            with trace_asin(asin, scraper='daily', verify=True), asin_context(asin, 'daily', verify=True):
+                try:
+                    verified[asin] = self.scrape_product(asin)
+                except ScrapeFailure as failure:
+                    logger.warning(f"Verification scrape of ASIN {asin} failed ({failure.category})")
+                except Exception as e:
+                    logger.error(f"Stopping verification scrapes after {len(verified)} ASINs: {str(e)}")
+                    break
+        return verified
+
 
-def run_scraper_with_recovery():
+def run_scraper_with_recovery(excel_file='cleaned_asin.xlsx', db_params=None, shard=None, pipeline_depth=None,
+                              tabs=None, window_hours=None):
     """Run the scraper with recovery logic for captchas and errors"""
-    logger.info("Starting Amazon product scraper job with recovery logic")
+    pipeline_depth = PIPELINE_DEPTH if pipeline_depth is None else pipeline_depth
+    tabs = TABS if tabs is None else tabs
+    window_hours = WINDOW_HOURS if window_hours is None else window_hours
+    shard = shard or ShardConfig.default(base_url=AMAZON_BASE_URL)
+    logger.info(f"Starting Amazon product scraper job with recovery logic for shard {shard.name}")
     driver = None
     db_manager = None
+    proxy_lease = None
+    ledger = None
+    planner = None
+    negative_cache = None
+    run_status = 'failed'
     
     try:
+        # Proxies are optional; without any configured all traffic uses the local IP
+        proxy_pool = shard.proxy_pool()
+        rate_limiter = shard.rate_limiter()
+        retry_queue = RetryQueue('daily')
+        drift = DriftDetector('daily', DAILY_FIELD_DEFAULTS, ceilings=DAILY_FIELD_CEILINGS, shard=shard.name)
+        negative_cache = NegativeCache('daily', shard.marketplace)
+        
         # Initialize database connection
-        db_manager = SimpleDatabaseManager()
+        db_manager = SimpleDatabaseManager(
+            **(db_params or {}), marketplace=shard.marketplace, zip_code=shard.zip_code
+        )
         
         # Check if today's job is already completed
         checkpoint = db_manager.get_last_checkpoint()
@@ -699,9 +1057,19 @@ def run_scraper_with_recovery():
             logger.info("Today's scraping job already completed")
             return "Already completed"
         
+        negative_cache.load(db_manager.conn)
+        
         # Get start index from checkpoint
         start_index = checkpoint['last_index'] if checkpoint else 0
         
+        # Everything this thread reports from here on is recorded against the run
+        ledger = RunLedger('daily', shard)
+        drivers_started = 0
+        
+        # Planned on the first driver, once the remaining ASINs are known
+        if window_hours > 0:
+            planner = LoadPlanner('daily', shard, window_hours)
+        
         # Maximum number of driver restarts
         max_restarts = 10
         restart_count = 0
@@ -715,13 +1083,27 @@ def run_scraper_with_recovery():
                     except:
                         pass
                 
-                driver = initialize_driver()
+                # Each driver lifetime gets the healthiest available proxy
+                if proxy_lease:
+                    proxy_lease.release()
+                proxy_lease = proxy_pool.acquire() if proxy_pool else None
+                
+                driver = initialize_driver(proxy_lease.proxy if proxy_lease else None)
+                drivers_started += 1
+                ledger.start_worker(
+                    f"driver-{drivers_started}" + (f" via {proxy_lease.proxy.label}" if proxy_lease else '')
+                )
                 
                 # Setup driver and login
-                login_and_setup(driver)
+                login_and_setup(driver, base_url=shard.base_url, zip_code=shard.zip_code)
                 
                 # Create and run scraper
-                scraper = AmazonProductScraper(driver, db_manager)
+                scraper = AmazonProductScraper(
+                    driver, db_manager, excel_file=excel_file, proxy_lease=proxy_lease,
+                    base_url=shard.base_url, rate_limiter=rate_limiter, retry_queue=retry_queue,
+                    pipeline_depth=pipeline_depth, tabs=tabs, planner=planner, drift=drift,
+                    negative_cache=negative_cache, shard=shard
+                )
                 
                 # Run scraper from last checkpoint
                 result = scraper.scrape_all_products(start_index)
@@ -730,14 +1112,42 @@ def run_scraper_with_recovery():
                 if result['status'] == 'restart_needed':
                     start_index = result['resume_index'] + 1
                     restart_count += 1
+                    RESTARTS_TOTAL.inc(scraper='daily')
                     logger.info(f"Restarting driver (attempt {restart_count}/{max_restarts}), resuming from index {start_index}")
                     # Give a slightly longer pause before restarting
                     time.sleep(random.uniform(5, 10))
                     continue
                 
+                # Planned recycle by the memory watchdog; does not count against max_restarts
+                if result['status'] == 'recycle':
+                    start_index = result['resume_index'] + 1
+                    logger.info(f"Recycling driver ({result['reason']}), resuming from index {start_index}")
+                    continue
+                
+                # Fields stopped matching; a new driver would not fix the selectors
+                if result['status'] == 'drift_stopped':
+                    logger.error(f"Stopped on selector drift, resume from index {result['resume_index'] + 1} "
+                                 f"once the selectors are fixed")
+                    run_status = 'drift_stopped'
+                    return "Stopped on selector drift"
+                
                 # If the scraper completed successfully, we're done
                 if result['status'] == 'completed':
                     logger.info("Amazon scraping job completed successfully")
+                    run_status = 'completed'
+                    # Re-scrape rows that look like parsing mistakes before they feed the movers
+                    try:
+                        run_anomaly_pass(db_manager.conn, scraper.verify_products, db_manager.save_product_data,
+                                         shard.marketplace, shard.zip_code)
+                    except Exception as e:
+                        logger.error(f"Error in anomaly pass: {str(e)}")
+                        db_manager.conn.rollback()
+                    # Day-over-day deltas for the analytics tool; a failure here does not fail the run
+                    try:
+                        build_daily_movers(db_manager.conn, shard.marketplace, shard.zip_code)
+                    except Exception as e:
+                        logger.error(f"Error computing daily movers: {str(e)}")
+                        db_manager.conn.rollback()
                     return "Completed successfully"
             
             except KeyboardInterrupt:
@@ -747,6 +1157,7 @@ def run_scraper_with_recovery():
                 logger.error(f"Unexpected error, restarting driver: {str(e)}")
                 logger.error(traceback.format_exc())
                 restart_count += 1
+                RESTARTS_TOTAL.inc(scraper='daily')
                 time.sleep(random.uniform(10, 15))  # Longer delay before restart on unexpected error
         
         logger.error(f"Exceeded maximum number of driver restarts ({max_restarts})")
@@ -754,6 +1165,7 @@ def run_scraper_with_recovery():
     
     except KeyboardInterrupt:
         logger.warning("Scraping interrupted by user")
+        run_status = 'interrupted'
         return "Interrupted by user"
     except Exception as e:
         logger.error(f"Critical error in scraper job: {str(e)}")
@@ -768,14 +1180,27 @@ def run_scraper_with_recovery():
             except:
                 logger.warning("Error closing WebDriver")
             
+        if proxy_lease:
+            proxy_lease.release()
+        
+        if ledger:
+            ledger.finish(db_manager.conn if db_manager else None, run_status)
+        
+        if planner and db_manager:
+            planner.save_costs(db_manager.conn)
+        
+        if negative_cache is not None and db_manager:
+            negative_cache.flush(db_manager.conn)
+            
         if db_manager:
             db_manager.close()
 
 
-def schedule_jobs():
+def schedule_jobs(pipeline_depth=None, tabs=None, window_hours=None):
     """Schedule the scraper to run daily at specific time"""
     # Set the job to run at 1:00 AM every day
-    schedule.every().day.at("00:00").do(run_scraper_with_recovery)
+    schedule.every().day.at("00:00").do(run_scraper_with_recovery, pipeline_depth=pipeline_depth, tabs=tabs,
+                                        window_hours=window_hours)
     
     logger.info("Scheduler started. Jobs will run at 12:00 AM daily")
     
@@ -801,18 +1226,55 @@ def main():
     parser.add_argument('--now', action='store_true', help='Run the scraper immediately')
     parser.add_argument('--schedule', action='store_true', help='Schedule the scraper to run daily')
     parser.add_argument('--from-idx', type=int, default=0, help='Start scraping from specific index')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='Expose Prometheus metrics on this local port while running')
+    parser.add_argument('--trace-file', default=None,
+                        help='Write per-ASIN trace spans to this rotating JSONL file')
+    parser.add_argument('--shards', default=None,
+                        help='JSON file of marketplace/ZIP shards to run concurrently instead of the default US run')
+    parser.add_argument('--pipeline-depth', type=int, default=None,
+                        help='Product pages to load ahead in background tabs (default SCRAPER_PIPELINE_DEPTH, 0 = off)')
+    parser.add_argument('--tabs', type=int, default=None,
+                        help='Product tabs kept in flight in one browser (default SCRAPER_TABS, 1 = single tab)')
+    parser.add_argument('--window-hours', type=float, default=None,
+                        help='Spread the run evenly over this many hours (default SCRAPER_WINDOW_HOURS, 0 = off)')
+    parser.add_argument('--dead-letters', type=int, metavar='DAYS', default=None,
+                        help='List ASINs dead-lettered in the last DAYS days and exit')
     
     args = parser.parse_args()
     
-    if args.now:
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    if args.trace_file:
+        configure_tracing(args.trace_file)
+    
+    if args.dead_letters is not None:
+        from retry_queue import list_dead_letters
+        db_manager = SimpleDatabaseManager()
+        try:
+            for row in list_dead_letters(db_manager.conn, args.dead_letters):
+                asin, scraper, marketplace, zip_code, category, attempts, last_error, dead_lettered = row
+                print(f"{dead_lettered:%Y-%m-%d %H:%M}  {asin:<12} {scraper:<9} {marketplace}/{zip_code:<9} "
+                      f"{category:<14} {attempts}x  {last_error or ''}")
+        finally:
+            db_manager.close()
+        return
+    
+    if args.shards:
+        from marketplaces import load_shards, run_shards
+        logger.info(f"Running shards from {args.shards}")
+        run_shards(load_shards(args.shards), pipeline_depth=args.pipeline_depth, tabs=args.tabs,
+                   window_hours=args.window_hours)
+    elif args.now:
         logger.info(f"Running scraper immediately from index {args.from_idx}")
-        run_scraper_with_recovery()
+        run_scraper_with_recovery(pipeline_depth=args.pipeline_depth, tabs=args.tabs, window_hours=args.window_hours)
     elif args.schedule:
         logger.info("Starting scheduler")
-        schedule_jobs()
+        schedule_jobs(pipeline_depth=args.pipeline_depth, tabs=args.tabs, window_hours=args.window_hours)
     else:
         logger.info("No action specified. Use --now to run immediately or --schedule to schedule daily runs")
-        run_scraper_with_recovery()  # Default behavior: run immediately
+        run_scraper_with_recovery(pipeline_depth=args.pipeline_depth, tabs=args.tabs,
+                                  window_hours=args.window_hours)  # Default behavior: run immediately
 
 
 if __name__ == "__main__":
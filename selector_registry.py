@@ -0,0 +1,207 @@
+"""
+Selector registry for the Amazon product page fields.
+
+Every field's XPath strategies are defined once in FIELD_SELECTORS. A
+SelectorRegistry tries a field's strategies in order of recent hit rate, so
+the layout variant seen most often is probed first, and keeps a sliding window
+of per-field outcomes to alert when a field's overall hit rate drops (which is
+what an Amazon layout change looks like from the scraper's side).
+
+Broad strategies (full-document scans like //*[contains(text(), ...)]) are
+never promoted ahead of the targeted ones: they may match on pages where a
+targeted selector would have produced cleaner text.
+"""
+import json
+import logging
+import os
+import threading
+from collections import deque
+
+from scraper_metrics import REGISTRY, Counter, Gauge
+from scraper_tracing import span
+
+logger = logging.getLogger("SelectorRegistry")
+
+SELECTOR_HIT_RATE = REGISTRY.register(Gauge(
+    'scraper_selector_hit_rate', 'Share of recent pages where any strategy for the field matched', ['scraper', 'field']
+))
+SELECTOR_ALERTS_TOTAL = REGISTRY.register(Counter(
+    'scraper_selector_alerts_total', 'Hit-rate drop alerts raised per field', ['scraper', 'field']
+))
+
+# name: strategy id used in stats; xpath: element whose text is read;
+# fraction_xpath: optional second element joined as "<whole>.<fraction>";
+# attribute: read this attribute instead of .text; broad: full-document scan.
+FIELD_SELECTORS = {
+    'title': [
+        {'name': 'product_title', 'xpath': "//*[@id='productTitle']"},
+    ],
+    'price': [
+        {'name': 'price_whole_fraction', 'xpath': "//span[@class='a-price-whole']",
+         'fraction_xpath': "//span[@class='a-price-fraction']"},
+        {'name': 'core_price_display', 'xpath': "//*[@id='corePriceDisplay_desktop_feature_div']/div[1]/span/span[1]"},
+        {'name': 'price_inside_buybox', 'xpath': "//span[@id='price_inside_buybox']"},
+    ],
+    'rating': [
+        {'name': 'acr_popover', 'xpath': "//div[@id='averageCustomerReviews']//span[@id='acrPopover']//span"},
+    ],
+    'reviews_count': [
+        {'name': 'acr_review_text',
+         'xpath': "//div[@id='averageCustomerReviews']//a[@id='acrCustomerReviewLink']//span[@id='acrCustomerReviewText']"},
+    ],
+    'best_seller_rank': [
+        {'name': 'details_table', 'xpath': "//th[contains(text(), 'Best Sellers Rank')]/following-sibling::td"},
+        {'name': 'detail_bullets', 'xpath': "//span[contains(text(), 'Best Sellers Rank')]/following::span[1]"},
+        {'name': 'any_text_parent', 'xpath': "//*[contains(text(), 'Best Sellers Rank')]/..", 'broad': True},
+    ],
+    'offers': [
+        {'name': 'aod_ingress', 'xpath': "//div[@id='dynamic-aod-ingress-box']//span[@class='a-declarative']/span[1]"},
+        {'name': 'new_from_text', 'xpath': "//span[contains(text(), 'New')]/span[contains(text(), 'from')]", 'broad': True},
+        {'name': 'olp_feature', 'xpath': "//div[contains(@id, 'olp_feature_div')]//span"},
+    ],
+    'minimum_price': [
+        {'name': 'aod_ingress_price',
+         'xpath': "//div[@id='dynamic-aod-ingress-box']//div//div//a/span[@class='a-declarative']/span[@class='a-price']/span[2]/span[@class='a-price-whole']",
+         'fraction_xpath': "//div[@id='dynamic-aod-ingress-box']//div//div//a/span[@class='a-declarative']/span[@class='a-price']/span[2]//span[@class='a-price-fraction']"},
+        {'name': 'olp_offscreen', 'xpath': "//div[contains(@id, 'olp_feature_div')]//span[@class='a-price']/span[@class='a-offscreen']",
+         'attribute': 'textContent'},
+    ],
+    'buybox_shipped_from': [
+        {'name': 'fulfiller_info', 'xpath': "//div[@id='offer-display-features']//div[@id='fulfillerInfoFeature_feature_div']/div[2]"},
+    ],
+    'buybox_sold_by': [
+        {'name': 'merchant_info', 'xpath': "//div[@id='offer-display-features']//div[@id='merchantInfoFeature_feature_div']/div[2]"},
+    ],
+}
+
+
+class SelectorRegistry:
+    def __init__(self, scraper, stats_file=None, decay=0.98, window=200, alert_drop=0.3, min_window=50):
+        """
+        :param scraper: Label used in logs and metrics ('daily' or 'realtime')
+        :param stats_file: JSON file the decayed hit statistics are persisted to
+        :param decay: Weight kept by old observations each time a page is recorded for the field
+        :param window: Number of recent pages used for the field hit rate
+        :param alert_drop: Absolute hit-rate drop against the baseline that raises an alert
+        :param min_window: Pages needed in the window before alerts are considered
+        """
+        self.scraper = scraper
+        self.stats_file = stats_file
+        self.decay = decay
+        self.window = window
+        self.alert_drop = alert_drop
+        self.min_window = min_window
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._baseline = {}
+        self._recent = {}
+        self._alerting = set()
+        self.load()
+
+    def load(self):
+        if not self.stats_file or not os.path.exists(self.stats_file):
+            return
+        try:
+            with open(self.stats_file) as f:
+                saved = json.load(f)
+            self._stats = saved.get('strategies', {})
+            self._baseline = saved.get('baseline', {})
+            logger.info(f"Loaded selector statistics from {self.stats_file}")
+        except Exception as e:
+            logger.warning(f"Could not load selector statistics from {self.stats_file}: {str(e)}")
+
+    def save(self):
+        if not self.stats_file:
+            return
+        try:
+            with self._lock:
+                payload = {'strategies': self._stats, 'baseline': self._baseline}
+                with open(self.stats_file, 'w') as f:
+                    json.dump(payload, f, indent=2)
+        except Exception as e:
+            logger.warning(f"Could not save selector statistics to {self.stats_file}: {str(e)}")
+
+    def _score(self, field, strategy):
+        stats = self._stats.get(field, {}).get(strategy['name'])
+        if not stats:
+            return 0.5
+        # Laplace-smoothed decayed hit rate
+        return (stats['hits'] + 1.0) / (stats['attempts'] + 2.0)
+
+    def ordered(self, field):
+        """Strategies for a field, most successful first (broad scans always last)"""
+        strategies = FIELD_SELECTORS[field]
+        with self._lock:
+            return sorted(
+                strategies,
+                key=lambda s: (bool(s.get('broad')), -self._score(field, s))
+            )
+
+    def record(self, field, strategy_name, hit):
+        with self._lock:
+            stats = self._stats.setdefault(field, {}).setdefault(strategy_name, {'hits': 0.0, 'attempts': 0.0})
+            stats['attempts'] += 1
+            if hit:
+                stats['hits'] += 1
+
+    def record_field(self, field, hit):
+        """Record whether any strategy matched for a field on one page"""
+        with self._lock:
+            # Age the per-strategy statistics once per page so ordering follows recent layouts
+            for stats in self._stats.get(field, {}).values():
+                stats['hits'] *= self.decay
+                stats['attempts'] *= self.decay
+            recent = self._recent.setdefault(field, deque(maxlen=self.window))
+            recent.append(1 if hit else 0)
+            if len(recent) < self.min_window:
+                return
+            rate = sum(recent) / len(recent)
+            baseline = self._baseline.get(field)
+            if baseline is None:
+                self._baseline[field] = rate
+                baseline = rate
+            dropped = baseline - rate >= self.alert_drop
+            if not dropped and field not in self._alerting:
+                # Slow-moving baseline so a layout change is not absorbed before it is noticed
+                self._baseline[field] = baseline * 0.995 + rate * 0.005
+            newly_dropped = dropped and field not in self._alerting
+            recovered = not dropped and field in self._alerting
+            if newly_dropped:
+                self._alerting.add(field)
+            elif recovered:
+                self._alerting.discard(field)
+        SELECTOR_HIT_RATE.set(round(rate, 3), scraper=self.scraper, field=field)
+        if newly_dropped:
+            SELECTOR_ALERTS_TOTAL.inc(scraper=self.scraper, field=field)
+            logger.critical(
+                f"[{self.scraper}] hit rate for field '{field}' dropped from {baseline:.0%} to {rate:.0%} "
+                f"over the last {len(recent)} pages - possible Amazon layout change"
+            )
+        elif recovered:
+            logger.info(f"[{self.scraper}] hit rate for field '{field}' recovered to {rate:.0%}")
+
+    def extract(self, field, read, parse=None):
+        """
+        Try the field's strategies in hit-rate order and return the first parsed value.
+
+        :param field: Key of FIELD_SELECTORS
+        :param read: Callable(strategy) returning the raw text; may raise on a miss
+        :param parse: Optional callable(text) returning the value, falsy on a miss
+        :return: Parsed value or None when no strategy matched
+        """
+        for strategy in self.ordered(field):
+            value = None
+            with span('selector', field=field, xpath=strategy['xpath'], strategy=strategy['name']) as attempt:
+                try:
+                    text = read(strategy)
+                    value = parse(text) if (parse and text) else text
+                except Exception as e:
+                    logger.debug(f"Selector {field}/{strategy['name']} missed: {str(e)}")
+                    value = None
+                attempt.set(hit=bool(value))
+            self.record(field, strategy['name'], bool(value))
+            if value:
+                self.record_field(field, True)
+                return value
+        self.record_field(field, False)
+        return None
@@ -0,0 +1,176 @@
+"""
+Several product tabs multiplexed over one Chrome.
+
+Scaling by running more drivers pays for a whole browser (browser process,
+GPU and network services, a second session set up by login_and_setup) per
+worker. TabPool instead keeps up to `tabs` product pages in flight inside the
+one browser the worker already has. Each tab carries its own ASIN, and all of
+them share the cookies and delivery location of the session tab.
+
+    pool = TabPool(driver, 'daily', tabs=4, pace=scraper.pace)
+    pool.dispatch(asin, url, index=12)
+    slot = pool.next_ready()        # switches to the oldest tab once its page has loaded
+    ...extract from slot...
+    pool.release(slot)              # closes the tab and returns to the session tab
+
+Tabs are opened with noopener, so Chrome gives each its own renderer process.
+A renderer crash or a hung load then costs only that tab's ASIN, which comes
+back as slot.failure, and the driver keeps running. Every product tab is
+closed once its page has been extracted, so renderer memory is recycled page
+by page instead of growing in a long-lived tab.
+
+Navigations go through the same pacing as the single-tab path (pace(), plus a
+randomized gap between navigation starts), so more tabs add concurrency, not
+request rate.
+"""
+import logging
+import random
+import time
+from collections import deque
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+from retry_queue import ScrapeFailure
+from scraper_metrics import REGISTRY, Counter, Gauge
+
+logger = logging.getLogger("TabPool")
+
+TABS_IN_FLIGHT = REGISTRY.register(Gauge(
+    'scraper_tabs_in_flight', 'Product tabs loading or being extracted', ['scraper']
+))
+TAB_FAILURES_TOTAL = REGISTRY.register(Counter(
+    'scraper_tab_failures_total', 'Product tabs lost without restarting the driver', ['scraper', 'reason']
+))
+
+# WebDriver errors that mean the tab itself is gone, not that the page was bad
+TAB_LOST_MARKERS = ('tab crashed', 'no such window', 'target window already closed', 'web view not found')
+
+
+def tab_lost(exc):
+    """True if exc means the current tab crashed or disappeared"""
+    message = str(exc).lower()
+    return any(marker in message for marker in TAB_LOST_MARKERS)
+
+
+class TabSlot:
+    """One product tab and the ASIN it is loading"""
+
+    __slots__ = ('asin', 'url', 'index', 'is_retry', 'handle', 'issued', 'load_seconds', 'failure')
+
+    def __init__(self, asin, url, index, is_retry, handle, issued):
+        self.asin = asin
+        self.url = url
+        self.index = index
+        self.is_retry = is_retry
+        self.handle = handle
+        self.issued = issued
+        self.load_seconds = None
+        self.failure = None
+
+
+class TabPool:
+    def __init__(self, driver, scraper, tabs=4, pace=None, min_interval=(1.5, 3.0), load_timeout=45):
+        """
+        :param driver: The worker's WebDriver; its current tab becomes the session tab
+        :param scraper: Label used in logs and metrics ('daily' or 'realtime')
+        :param tabs: Product tabs kept in flight at once
+        :param pace: Called before every navigation; blocks until the global pacing limits allow a request
+        :param min_interval: Random range of seconds kept between the starts of two navigations
+        :param load_timeout: Seconds before a tab that is still loading is treated as hung
+        """
+        self.driver = driver
+        self.scraper = scraper
+        self.tabs = max(1, tabs)
+        self.pace = pace
+        self.min_interval = min_interval
+        self.load_timeout = load_timeout
+        self.home = driver.current_window_handle
+        self._slots = deque()
+        self._last_navigation = 0.0
+        # Bounds how long a command on a hung tab can block the whole worker
+        driver.set_page_load_timeout(load_timeout)
+
+    @property
+    def busy(self):
+        return len(self._slots)
+
+    @property
+    def idle(self):
+        return self.tabs - len(self._slots)
+
+    def _space_out(self):
+        gap = random.uniform(*self.min_interval)
+        wait = self._last_navigation + gap - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+    def _go_home(self):
+        if self.driver.current_window_handle != self.home:
+            self.driver.switch_to.window(self.home)
+
+    def dispatch(self, asin, url, index=None, is_retry=False):
+        """Start loading url for asin in a new tab without waiting for it"""
+        if not self.idle:
+            raise RuntimeError("No idle tab to dispatch to")
+        if self.pace:
+            self.pace()
+        self._space_out()
+        self._go_home()
+        before = set(self.driver.window_handles)
+        # noopener puts the tab in its own browsing context group, and so its own renderer process
+        self.driver.execute_script("window.open(arguments[0], '_blank', 'noopener');", url)
+        opened = [h for h in self.driver.window_handles if h not in before]
+        if not opened:
+            raise WebDriverException("Product tab did not open; is the popup blocker enabled?")
+        self._last_navigation = time.monotonic()
+        self._slots.append(TabSlot(asin, url, index, is_retry, opened[0], self._last_navigation))
+        TABS_IN_FLIGHT.set(len(self._slots), scraper=self.scraper)
+        logger.debug(f"Dispatched {asin} ({len(self._slots)}/{self.tabs} tabs in flight)")
+
+    def next_ready(self):
+        """
+        Switch to the oldest tab and wait for its page to finish loading.
+        Returns its slot; slot.failure is set if the tab crashed or hung.
+        Tabs are handed out in dispatch order, so checkpoints stay in order.
+        """
+        slot = self._slots[0]
+        try:
+            self.driver.switch_to.window(slot.handle)
+            deadline = slot.issued + self.load_timeout
+            while self.driver.execute_script("return document.readyState") != "complete":
+                if time.monotonic() > deadline:
+                    raise TimeoutException("page still loading")
+                time.sleep(0.2)
+            slot.load_seconds = time.monotonic() - slot.issued
+        except Exception as e:
+            reason = 'crashed' if tab_lost(e) else 'hung' if isinstance(e, TimeoutException) else 'error'
+            logger.warning(f"Tab for {slot.asin} {reason}, dropping it: {str(e).splitlines()[0] if str(e) else ''}")
+            TAB_FAILURES_TOTAL.inc(scraper=self.scraper, reason=reason)
+            slot.failure = ScrapeFailure('timeout' if reason == 'hung' else 'error', f"tab {reason}")
+            self.release(slot)
+        return slot
+
+    def release(self, slot):
+        """Close slot's tab and return to the session tab; a no-op for a slot already released"""
+        if slot not in self._slots:
+            return
+        self._slots.remove(slot)
+        TABS_IN_FLIGHT.set(len(self._slots), scraper=self.scraper)
+        try:
+            if self.driver.current_window_handle != slot.handle:
+                self.driver.switch_to.window(slot.handle)
+            self.driver.close()
+        except Exception as e:
+            logger.debug(f"Error closing tab for {slot.asin}: {str(e)}")
+        # Never raises: a dead browser surfaces on the next dispatch or next_ready instead
+        try:
+            self.driver.switch_to.window(self.home)
+        except Exception as e:
+            logger.debug(f"Error returning to the session tab: {str(e)}")
+
+    def drain(self):
+        """Close every tab still in flight and return their slots, e.g. before the driver is restarted"""
+        slots = list(self._slots)
+        for slot in slots:
+            self.release(slot)
+        return slots
@@ -0,0 +1,102 @@
+import pytest
+
+pytest.importorskip('selenium')
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, THROTTLED, CircuitBreaker, page_outcome
+
+
+@pytest.mark.parametrize('page_source, has_markup, outcome', [
+    ("<div id='dp-container'></div>", True, 'ok'),
+    ("Type the characters you see in this image", False, 'captcha'),
+    ("Sorry! Something went wrong!", False, 'sorry'),
+    ("Sorry! We couldn't find that page", False, 'ok'),
+    ("This item is no longer available", False, 'ok'),
+    ("<html></html>", False, 'empty'),
+    (None, False, 'empty'),
+])
+def test_page_outcome(page_source, has_markup, outcome):
+    assert page_outcome(page_source, has_markup) == outcome
+
+
+def feed(breaker, outcomes):
+    for outcome in outcomes:
+        breaker.record('daily', outcome)
+
+
+def test_stays_closed_below_min_samples(clock):
+    breaker = CircuitBreaker(min_samples=10)
+    feed(breaker, ['captcha'] * 3)
+    assert breaker.state == CLOSED
+
+
+def test_throttles_then_recovers(clock):
+    breaker = CircuitBreaker(min_samples=10, throttle_rate=0.2, open_rate=0.4, throttle_delay=8)
+    feed(breaker, ['ok'] * 8 + ['captcha'] * 2)
+    assert breaker.state == THROTTLED
+
+    assert breaker.before_request('daily') is False
+    assert clock.slept == [8]
+
+    feed(breaker, ['ok'] * 30)
+    assert breaker.state == CLOSED
+
+
+def test_opens_and_doubles_the_cooldown(clock):
+    breaker = CircuitBreaker(min_samples=10, cooldown=60, max_cooldown=100)
+    feed(breaker, ['ok'] * 6 + ['empty'] * 4)
+    assert breaker.state == OPEN
+    assert breaker.snapshot()['open_for'] == 60
+    assert breaker.snapshot()['next_cooldown'] == 100
+
+    # Outcomes reported while open are ignored
+    feed(breaker, ['ok'] * 20)
+    assert breaker.state == OPEN
+
+
+def test_sorry_streak_opens_without_enough_samples(clock):
+    breaker = CircuitBreaker(min_samples=10, sorry_streak=3)
+    feed(breaker, ['sorry', 'sorry', 'ok', 'sorry', 'sorry'])
+    assert breaker.state == CLOSED
+    feed(breaker, ['sorry'])
+    assert breaker.state == OPEN
+
+
+def test_errors_are_not_block_signals(clock):
+    breaker = CircuitBreaker(min_samples=10)
+    feed(breaker, ['error'] * 20)
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()['block_rate'] is None
+
+
+def test_successful_probe_closes_and_halves_the_cooldown(clock):
+    breaker = CircuitBreaker(sorry_streak=1, cooldown=60)
+    feed(breaker, ['sorry'])
+    clock.advance(60)
+
+    assert breaker.before_request('daily') is True
+    assert breaker.state == HALF_OPEN
+    feed(breaker, ['ok'])
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()['next_cooldown'] == 60
+
+
+def test_blocked_probe_reopens_for_longer(clock):
+    breaker = CircuitBreaker(sorry_streak=1, cooldown=60)
+    feed(breaker, ['sorry'])
+    clock.advance(60)
+
+    assert breaker.before_request('daily') is True
+    feed(breaker, ['captcha'])
+    assert breaker.state == OPEN
+    assert breaker.snapshot()['open_for'] == 120
+
+
+def test_inconclusive_probe_lets_the_next_request_probe(clock):
+    breaker = CircuitBreaker(sorry_streak=1, cooldown=60)
+    feed(breaker, ['sorry'])
+    clock.advance(60)
+
+    assert breaker.before_request('daily') is True
+    feed(breaker, ['error'])
+    assert breaker.state == HALF_OPEN
+    assert breaker.before_request('daily') is True
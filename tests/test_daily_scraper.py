@@ -0,0 +1,255 @@
+import os
+from collections import deque
+
+import pytest
+
+pytest.importorskip('selenium')
+pytest.importorskip('undetected_chromedriver')
+pytest.importorskip('twocaptcha')
+pytest.importorskip('psycopg2')
+pytest.importorskip('pandas')
+pytest.importorskip('schedule')
+
+from selenium.common.exceptions import NoSuchElementException, WebDriverException
+
+BASE_URL = 'http://storefront.test'
+
+
+class FakeSwitchTo:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def window(self, handle):
+        self.driver.current_window_handle = handle
+
+
+class FakeDriver:
+    """Just enough of a WebDriver for scrape_product: every page is a product page with no fields"""
+
+    def __init__(self):
+        self.window_handles = ['tab-0']
+        self.current_window_handle = 'tab-0'
+        self.switch_to = FakeSwitchTo(self)
+        self.navigated = []
+        self.opened = []
+        self.page_source = '<html><div id="dp-container"></div></html>'
+
+    def get(self, url):
+        self.navigated.append(url)
+
+    def find_elements(self, by, xpath):
+        return [object()]
+
+    def find_element(self, by, xpath):
+        raise NoSuchElementException(xpath)
+
+    def execute_script(self, script, *args):
+        if 'window.open' in script:
+            handle = f'tab-{len(self.window_handles)}'
+            self.window_handles.append(handle)
+            self.opened.append(args[0])
+            return None
+        if 'readyState' in script:
+            return 'complete'
+        return None
+
+    def close(self):
+        self.window_handles.remove(self.current_window_handle)
+
+    def set_page_load_timeout(self, seconds):
+        pass
+
+
+class FakeDatabaseManager:
+    marketplace = 'US'
+    zip_code = '11229'
+    conn = None
+
+    def __init__(self):
+        self.saved = []
+        self.checkpoints = []
+
+    def save_product_data(self, batch_results):
+        self.saved.extend(batch_results)
+
+    def get_scraped_asins_for_today(self):
+        return set()
+
+    def get_last_checkpoint(self):
+        return None
+
+    def save_checkpoint(self, asin, index, completed=False):
+        self.checkpoints.append((asin, index, completed))
+
+    def save_dead_letters(self, entries):
+        pass
+
+
+@pytest.fixture
+def scriptfinal2():
+    import scriptfinal2
+
+    return scriptfinal2
+
+
+@pytest.fixture
+def make_scraper(scriptfinal2, no_sleep):
+    def make(**kwargs):
+        driver = FakeDriver()
+        scraper = scriptfinal2.AmazonProductScraper(
+            driver, FakeDatabaseManager(), excel_file='missing.xlsx', base_url=BASE_URL, **kwargs
+        )
+        return scraper, driver
+    return make
+
+
+def test_empty_pipeline_prefetches_the_upcoming_asins(make_scraper):
+    scraper, driver = make_scraper(pipeline_depth=2)
+    fresh = deque([(1, 'B001'), (2, 'B002'), (3, 'B003')])
+
+    assert len(scraper.pipeline) == 0
+    assert scraper._upcoming(fresh, set()) == ['B001', 'B002']
+
+    scraper.scrape_product('B000', upcoming=['B001', 'B002'])
+    assert driver.navigated == [f'{BASE_URL}/dp/B000']
+    assert driver.opened == [f'{BASE_URL}/dp/B001', f'{BASE_URL}/dp/B002']
+
+    # The prefetched page is used as is, not loaded a second time
+    result = scraper.scrape_product('B001')
+    assert result['asin'] == 'B001'
+    assert driver.navigated == [f'{BASE_URL}/dp/B000']
+
+
+def test_requeued_asin_survives_into_the_next_scraper(scriptfinal2, make_scraper):
+    queue = scriptfinal2.RetryQueue('daily')
+    first, _ = make_scraper(retry_queue=queue)
+    assert first.retry_queue is queue
+
+    # A driver restart requeues the interrupted ASIN, then a new scraper takes over with the same queue
+    first.retry_queue.requeue('B001')
+    second, _ = make_scraper(retry_queue=queue)
+    assert second._next_asin(deque([(1, 'B002')]), set(), block=False) == (None, 'B001', True)
+
+
+def test_empty_negative_cache_is_shared_with_the_scraper(make_scraper):
+    from negative_cache import NegativeCache
+
+    cache = NegativeCache('daily', 'US')
+    scraper, _ = make_scraper(negative_cache=cache)
+    assert scraper.negative is cache
+
+    scraper.negative.record_dead('B001', 'not_found', 'page not found')
+    assert cache.cached('B001')
+
+
+class FakeElement:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def screenshot(self, path):
+        with open(path, 'wb') as f:
+            f.write(b'png')
+
+    def clear(self):
+        pass
+
+    def send_keys(self, text):
+        self.driver.typed = text
+
+    def click(self):
+        self.driver.page_source = '<html><div id="dp-container"></div></html>'
+
+
+class CaptchaDriver(FakeDriver):
+    def __init__(self):
+        super().__init__()
+        self.page_source = 'Type the characters you see in this image'
+
+    def find_element(self, by, xpath):
+        return FakeElement(self)
+
+
+def test_captcha_is_solved_from_its_own_temporary_file(scriptfinal2, no_sleep, monkeypatch, tmp_path):
+    submitted = []
+
+    class FakeSolver:
+        def __init__(self, key):
+            pass
+
+        def normal(self, path):
+            with open(path, 'rb') as f:
+                submitted.append((path, f.read()))
+            return {'code': 'ABCDEF'}
+
+    monkeypatch.setattr(scriptfinal2, 'TwoCaptcha', FakeSolver)
+    driver = CaptchaDriver()
+
+    assert scriptfinal2.handle_captcha(driver) is True
+    assert driver.typed == 'ABCDEF'
+    [(path, content)] = submitted
+    assert content == b'png'
+    assert not path.endswith('/captcha.png')
+    assert not (tmp_path / 'captcha.png').exists()
+    assert not os.path.exists(path)
+
+
+def test_selector_stats_are_kept_per_shard(scriptfinal2, make_scraper):
+    from marketplaces import ShardConfig
+
+    default, _ = make_scraper()
+    uk, _ = make_scraper(shard=ShardConfig(job='daily', marketplace='UK'))
+    assert default.selectors.stats_file == 'selector_stats_daily-us-11229.json'
+    assert uk.selectors.stats_file == f'selector_stats_{uk.shard.name}.json'
+    assert uk.selectors.stats_file != default.selectors.stats_file
+
+
+class DyingDriver(FakeDriver):
+    """The browser dies once `tabs` product tabs have been opened; every window command fails after that"""
+
+    def __init__(self, tabs):
+        super().__init__()
+        self.tabs = tabs
+        self.switch_to = self
+
+    def window(self, handle):
+        if len(self.opened) >= self.tabs:
+            raise WebDriverException('no such window: target window already closed')
+        self.current_window_handle = handle
+
+    def execute_script(self, script, *args):
+        if len(self.opened) >= self.tabs:
+            raise WebDriverException('chrome not reachable')
+        return super().execute_script(script, *args)
+
+    def close(self):
+        raise WebDriverException('chrome not reachable')
+
+
+def test_browser_dying_under_the_tabs_requeues_every_asin(scriptfinal2, make_scraper):
+    queue = scriptfinal2.RetryQueue('daily')
+    scraper, _ = make_scraper(tabs=2, retry_queue=queue)
+    scraper.driver = driver = DyingDriver(tabs=2)
+    scraper.tabs = scriptfinal2.TabPool(driver, 'daily', tabs=2)
+    scraper.asins = ['B001', 'B002', 'B003']
+
+    result = scraper.scrape_all_products()
+
+    assert result['status'] == 'restart_needed'
+    # The tab that failed is deferred as an error; the one still loading and the undispatched one go first
+    assert queue.attempts('B001') == 1
+    assert {queue.pop_due(), queue.pop_due()} == {'B002', 'B003'}
+    assert scraper.db_manager.checkpoints == [('B003', 2, False)]
+
+
+def test_shards_get_the_command_line_scraper_options(scriptfinal2, monkeypatch):
+    from marketplaces import ShardConfig, run_shards
+
+    calls = []
+    monkeypatch.setattr(scriptfinal2, 'run_scraper_with_recovery', lambda **kwargs: calls.append(kwargs) or 'Completed')
+    shards = [ShardConfig(job='daily', zip_code='11229'), ShardConfig(job='daily', zip_code='90001')]
+
+    results = run_shards(shards, pipeline_depth=3, tabs=4, window_hours=6)
+
+    assert results == {shard.name: 'Completed' for shard in shards}
+    assert sorted(call['shard'].zip_code for call in calls) == ['11229', '90001']
+    assert all((call['pipeline_depth'], call['tabs'], call['window_hours']) == (3, 4, 6) for call in calls)
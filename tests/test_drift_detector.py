@@ -0,0 +1,140 @@
+import json
+import os
+
+import pytest
+
+from drift_detector import DAILY_FIELD_CEILINGS, DAILY_FIELD_DEFAULTS, DriftDetector
+
+GOOD = {'price': 19.99, 'best_seller_rank': '#1,234 in Toys', 'offers': '7', 'minimum_price': 17.5}
+LOST_PRICE = dict(GOOD, price=None, minimum_price=None)
+
+
+@pytest.fixture(autouse=True)
+def _no_webhook(monkeypatch):
+    monkeypatch.delenv('SCRAPER_ALERT_WEBHOOK', raising=False)
+    monkeypatch.delenv('SCRAPER_DRIFT_ACTION', raising=False)
+
+
+def detector(tmp_path, **kwargs):
+    return DriftDetector(
+        'daily', DAILY_FIELD_DEFAULTS, window=20, min_samples=10, jump=0.35,
+        snapshot_dir=str(tmp_path / 'snapshots'), state_file=str(tmp_path / 'baseline.json'), **kwargs
+    )
+
+
+def observe(drift, record, count, start=0):
+    for i in range(start, start + count):
+        drift.observe(f'B{i:03}', record, lambda: '<html>page</html>')
+
+
+def test_unknown_action_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        detector(tmp_path, action='panic')
+
+
+def test_no_drift_before_min_samples(tmp_path):
+    drift = detector(tmp_path)
+    observe(drift, LOST_PRICE, 9)
+    assert not drift.stop_requested
+    assert not os.path.exists(tmp_path / 'snapshots')
+
+
+def test_fallback_values_count_as_defaulted(tmp_path):
+    drift = detector(tmp_path)
+    assert drift._defaulted('offers', '1')
+    assert drift._defaulted('best_seller_rank', 'Not ranked')
+    assert drift._defaulted('price', '')
+    assert not drift._defaulted('offers', '12')
+
+
+def test_stop_trips_when_the_default_rate_jumps(tmp_path):
+    drift = detector(tmp_path)
+    observe(drift, GOOD, 20)
+
+    # 7 of the last 20 pages without a price is 35%, but the baseline has crept up a little meanwhile
+    observe(drift, LOST_PRICE, 7, start=20)
+    assert not drift.stop_requested
+    observe(drift, LOST_PRICE, 1, start=27)
+    assert drift.stop_requested
+
+    incidents = os.listdir(tmp_path / 'snapshots')
+    assert len(incidents) == 1
+    incident = tmp_path / 'snapshots' / incidents[0]
+    summary = json.loads((incident / 'summary.json').read_text())
+    assert summary['drifting'] == ['minimum_price', 'price']
+    assert summary['rates']['price'] == pytest.approx(0.4)
+    assert (incident / 'B027.json').exists() and (incident / 'B027.html').exists()
+
+
+def test_snapshots_are_limited_per_incident(tmp_path):
+    drift = detector(tmp_path, action='alert', snapshots=3)
+    observe(drift, GOOD, 20)
+    observe(drift, LOST_PRICE, 20, start=20)
+
+    incident = tmp_path / 'snapshots' / os.listdir(tmp_path / 'snapshots')[0]
+    assert len(list(incident.glob('*.html'))) == 3
+    assert not drift.stop_requested
+
+
+def test_throttle_delays_requests_until_the_rate_recovers(tmp_path, no_sleep):
+    drift = detector(tmp_path, action='throttle', throttle_delay=30)
+    observe(drift, GOOD, 20)
+    drift.before_request()
+    assert no_sleep == []
+
+    observe(drift, LOST_PRICE, 8, start=20)
+    assert drift.throttling
+    drift.before_request()
+    assert no_sleep == [30]
+
+    # Cleared once the lost-price pages age out to under half the jump above baseline
+    observe(drift, GOOD, 16, start=28)
+    assert drift.throttling
+    observe(drift, GOOD, 1, start=44)
+    assert not drift.throttling
+    drift.before_request()
+    assert no_sleep == [30]
+
+
+def test_baseline_persists_between_runs(tmp_path):
+    drift = detector(tmp_path)
+    observe(drift, dict(GOOD, offers='1'), 20)
+    drift.save()
+
+    # Offers always at the fallback is this catalog's normal, not drift
+    again = detector(tmp_path)
+    assert again._baseline['offers'] == pytest.approx(1.0)
+    observe(again, dict(GOOD, offers='1'), 20)
+    assert not again.stop_requested
+
+
+def test_ceiling_trips_when_the_layout_is_broken_from_the_start(tmp_path):
+    drift = detector(tmp_path)
+    observe(drift, LOST_PRICE, 20)
+    # The baseline was learned from broken pages, so the rate never rises above it
+    assert drift._baseline['price'] == pytest.approx(1.0)
+    assert not drift.stop_requested
+
+    (tmp_path / 'ceilinged').mkdir()
+    ceilinged = detector(tmp_path / 'ceilinged', ceilings=DAILY_FIELD_CEILINGS)
+    observe(ceilinged, GOOD, 1)
+    observe(ceilinged, LOST_PRICE, 9, start=1)
+    assert ceilinged.stop_requested
+    assert ceilinged._drifting == {'price'}
+
+
+def test_baselines_are_kept_per_shard():
+    us = DriftDetector('daily', DAILY_FIELD_DEFAULTS, shard='daily-us-11229')
+    de = DriftDetector('daily', DAILY_FIELD_DEFAULTS, shard='daily-de-10115')
+    assert us.state_file == 'drift_baseline_daily-us-11229.json'
+    assert de.state_file == 'drift_baseline_daily-de-10115.json'
+
+
+def test_save_replaces_the_state_file_whole(tmp_path):
+    drift = detector(tmp_path)
+    (tmp_path / 'baseline.json').write_text('{"baseline": {"price": 0.5}, "trunc')
+    observe(drift, GOOD, 20)
+    drift.save()
+
+    assert json.loads((tmp_path / 'baseline.json').read_text())['baseline']['price'] == pytest.approx(0.0)
+    assert [p.name for p in tmp_path.iterdir() if p.suffix == '.tmp'] == []
@@ -0,0 +1,113 @@
+import pytest
+
+pytest.importorskip('psycopg2')
+
+import load_planner
+from load_planner import DEFAULT_COST, LoadPlanner
+from marketplaces import ShardConfig
+
+SHARD = ShardConfig(job='daily')
+
+
+def run(planner, clock, asins, seconds):
+    """Wait for, 'scrape' and finish every ASIN; returns the start time of each"""
+    starts = []
+    for asin in asins:
+        planner.wait(asin)
+        starts.append(clock.now - planner.started)
+        clock.advance(seconds)
+        planner.done(asin, seconds)
+    return starts
+
+
+def test_equal_costs_give_equal_slot_quotas(clock):
+    planner = LoadPlanner('daily', SHARD, window_hours=1, slot_minutes=15)
+    planner.plan([f'B{i:03}' for i in range(8)])
+
+    assert planner.slots == 4
+    assert planner.quotas == [2, 2, 2, 2]
+    assert set(planner.costs.values()) == {DEFAULT_COST}
+
+
+def test_quotas_follow_historical_costs(clock, fake_conn):
+    planner = LoadPlanner('daily', SHARD, window_hours=1, slot_minutes=15)
+    planner.plan(['A', 'B', 'C', 'D'], fake_conn([('A', 30.0), ('B', 10.0), ('C', 10.0)]))
+
+    # D has no history and is planned at the median cost
+    assert planner.costs == {'A': 30.0, 'B': 10.0, 'C': 10.0, 'D': 10.0}
+    assert planner.quotas == [1, 0, 2, 1]
+
+
+def test_cost_load_failure_plans_with_equal_costs(clock, fake_conn):
+    class Broken(fake_conn):
+        def cursor(self):
+            raise RuntimeError('connection lost')
+
+    conn = Broken()
+    planner = LoadPlanner('daily', SHARD, window_hours=1)
+    planner.plan(['A', 'B'], conn)
+    assert planner.costs == {'A': DEFAULT_COST, 'B': DEFAULT_COST}
+    assert conn.rollbacks == 1
+
+
+def test_first_asin_idles_its_share_of_the_window(clock):
+    planner = LoadPlanner('daily', SHARD, window_hours=1, slot_minutes=15, max_idle=3600)
+    planner.plan([f'B{i:03}' for i in range(8)])
+
+    planner.wait('B000')
+    # 3600s * 10/80 of the remaining cost, minus the 10s the page itself takes
+    assert clock.slept == [440]
+
+
+def test_run_is_spread_over_the_window_without_bursts(clock):
+    asins = [f'B{i:03}' for i in range(40)]
+    planner = LoadPlanner('daily', SHARD, window_hours=1, slot_minutes=15, max_idle=3600)
+    planner.plan(asins)
+
+    starts = run(planner, clock, asins, seconds=10)
+
+    elapsed = clock.now - planner.started
+    assert 3600 - 10 <= elapsed <= 3600 + 10
+    per_slot = [sum(1 for start in starts if slot * 900 <= start < (slot + 1) * 900) for slot in range(4)]
+    assert per_slot == planner.quotas == [10, 10, 10, 10]
+    assert planner.eta() == 0.0
+
+
+def test_late_run_does_not_idle(clock):
+    asins = [f'B{i:03}' for i in range(8)]
+    planner = LoadPlanner('daily', SHARD, window_hours=1, slot_minutes=15)
+    planner.plan(asins)
+
+    # The first page idles its share, then takes 44x its planned cost; the run is behind from there on
+    run(planner, clock, asins[:1], seconds=440)
+    clock.slept.clear()
+    run(planner, clock, asins[1:], seconds=600)
+    assert clock.slept == []
+    assert planner.idle == 440
+
+
+def test_eta_projects_the_remaining_work_at_the_measured_rate(clock):
+    asins = [f'B{i:03}' for i in range(4)]
+    planner = LoadPlanner('daily', SHARD, window_hours=0.01, slot_minutes=15)
+    planner.plan(asins)
+    # 40s of planned work does not fit the 36s window
+    assert planner.eta() == pytest.approx(40)
+
+    run(planner, clock, asins[:2], seconds=30)
+    # 60 busy seconds for 20 planned cost seconds: 3x, so 20 cost seconds left take 60s
+    assert planner.eta() == pytest.approx(60)
+
+
+def test_save_costs_records_retries_as_one_asin(clock, fake_conn, monkeypatch):
+    written = []
+    monkeypatch.setattr(load_planner, 'execute_values', lambda cur, query, rows: written.extend(rows))
+    planner = LoadPlanner('daily', SHARD, window_hours=1)
+    planner.plan(['A', 'B'])
+    planner.done('A', 12.0)
+    planner.done('A', 3.5)
+    planner.done('B', 8.0)
+
+    conn = fake_conn()
+    planner.save_costs(conn)
+    assert sorted(written) == [('daily', SHARD.name, 'A', 15.5), ('daily', SHARD.name, 'B', 8.0)]
+    assert conn.commits == 1
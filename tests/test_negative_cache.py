@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('psycopg2')
+
+import negative_cache
+from negative_cache import BASE_TTL, MAX_TTL, NegativeCache, ttl_for
+
+
+@pytest.fixture
+def written(monkeypatch):
+    """Rows passed to execute_values by flush()"""
+    rows = []
+    monkeypatch.setattr(negative_cache, 'execute_values', lambda cur, query, values: rows.extend(values))
+    return rows
+
+
+def loaded_cache(fake_conn, *entries):
+    now = datetime.now()
+    rows = [
+        (asin, 'not_found', strikes, 'gone', now - timedelta(days=10), now - timedelta(days=1), now + expires_in)
+        for asin, strikes, expires_in in entries
+    ]
+    cache = NegativeCache('daily', 'US')
+    cache.load(fake_conn(rows))
+    return cache
+
+
+def test_ttl_doubles_per_strike_up_to_the_cap():
+    assert ttl_for(1) == BASE_TTL
+    assert ttl_for(2) == BASE_TTL * 2
+    assert ttl_for(3) == BASE_TTL * 4
+    assert ttl_for(50) == MAX_TTL
+
+
+def test_only_dead_categories_are_cached():
+    cache = NegativeCache('daily', 'US')
+    assert cache.record_dead('B001', 'captcha') is False
+    assert cache.record_dead('B002', 'unavailable', 'no longer available') is True
+
+    assert not cache.cached('B001')
+    assert cache.cached('B002')
+    assert cache.skip('B002')
+    assert not cache.probing('B002')
+
+
+def test_empty_cache_is_falsy_but_usable():
+    cache = NegativeCache('daily', 'US')
+    assert len(cache) == 0 and cache is not None
+    cache.record_dead('B001', 'not_found')
+    assert len(cache) == 1
+
+
+def test_expired_entry_is_probed_and_renewed_with_a_longer_ttl(fake_conn):
+    cache = loaded_cache(fake_conn, ('B001', 2, -timedelta(hours=1)), ('B002', 1, timedelta(days=1)))
+
+    assert cache.probing('B001') and not cache.cached('B001')
+    assert cache.cached('B002') and not cache.probing('B002')
+
+    before = datetime.now()
+    cache.record_dead('B001', 'not_found')
+    assert cache.cached('B001')
+    entry = cache._entries['B001']
+    assert entry.strikes == 3
+    assert entry.expires_at >= before + ttl_for(3)
+
+
+def test_load_failure_leaves_the_cache_empty(fake_conn):
+    class Broken(fake_conn):
+        def cursor(self):
+            raise RuntimeError('connection lost')
+
+    conn = Broken()
+    cache = NegativeCache('daily', 'US')
+    cache.load(conn)
+    assert len(cache) == 0
+    assert conn.rollbacks == 1
+
+
+def test_flush_writes_new_entries_once(fake_conn, written):
+    cache = NegativeCache('daily', 'US')
+    cache.record_dead('B001', 'not_found', 'page not found')
+    conn = fake_conn()
+
+    cache.flush(conn)
+    assert [row[:4] for row in written] == [('B001', 'US', 'not_found', 1)]
+    assert conn.commits == 1
+
+    cache.flush(conn)
+    assert len(written) == 1
+    assert conn.commits == 1
+
+
+def test_flush_deletes_revived_asins_even_when_the_cache_is_now_empty(fake_conn, written):
+    cache = loaded_cache(fake_conn, ('B001', 1, -timedelta(hours=1)))
+    cache.record_alive('B001')
+    assert len(cache) == 0
+
+    conn = fake_conn()
+    cache.flush(conn)
+    assert written == []
+    assert conn.executed == [
+        ('DELETE FROM negative_cache WHERE marketplace = %s AND asin = ANY(%s)', ('US', ['B001']))
+    ]
@@ -0,0 +1,74 @@
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip('selenium')
+pytest.importorskip('undetected_chromedriver')
+pytest.importorskip('twocaptcha')
+pytest.importorskip('psycopg2')
+pytest.importorskip('pandas')
+pytest.importorskip('schedule')
+
+from retry_queue import ScrapeFailure
+
+
+class FakeSelectors:
+    def save(self):
+        pass
+
+
+class FakeScraper:
+    saved = True
+
+    def __init__(self, proxy_pool=None, shard=None):
+        self.selectors = FakeSelectors()
+
+    def scrape_product(self, asin):
+        return {'asin': asin, 'price': '$19.99'}
+
+    def save_to_database(self, product_data):
+        return self.saved
+
+    def recycle_if_needed(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def on_demand():
+    # Imported inside the test's working directory: realtimedata opens its log file on import
+    import on_demand
+    return on_demand
+
+
+@pytest.fixture
+def worker(on_demand, monkeypatch):
+    monkeypatch.setattr(on_demand.realtimedata, 'RealtimeAmazonScraper', FakeScraper)
+    monkeypatch.setattr(on_demand, 'fetch_snapshot', lambda asin, shard: None)
+    worker = on_demand.ScrapeWorker().start()
+    yield worker
+    worker.stop()
+
+
+def test_saved_scrape_is_returned(worker):
+    job = worker.submit('B000000001')
+    assert job.future.result(timeout=5) == {'asin': 'B000000001', 'price': '$19.99'}
+
+
+def test_unsaved_scrape_fails_the_job(worker, monkeypatch):
+    monkeypatch.setattr(FakeScraper, 'saved', False)
+    job = worker.submit('B000000001')
+    with pytest.raises(ScrapeFailure) as failure:
+        job.future.result(timeout=5)
+    assert failure.value.category == 'error'
+    assert job.status() == 'failed'
+
+
+def test_payloads_use_the_read_api_serializer(on_demand):
+    payload = {'data': {'price': Decimal('19.99'), 'other_offers': [{'updated': datetime(2024, 5, 1, 12, 0)}]}}
+    assert on_demand._jsonable(payload) == {
+        'data': {'price': 19.99, 'other_offers': [{'updated': '2024-05-01T12:00:00'}]}
+    }
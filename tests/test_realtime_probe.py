@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip('selenium')
+pytest.importorskip('undetected_chromedriver')
+pytest.importorskip('twocaptcha')
+pytest.importorskip('psycopg2')
+pytest.importorskip('pandas')
+pytest.importorskip('schedule')
+
+from selenium.common.exceptions import NoSuchElementException
+
+SOLD_BY = ".//div[@id='aod-offer-soldBy']//a"
+PRICE_WHOLE = ".//div[@id='aod-offer-price']//span[@class='a-price-whole']"
+PRICE_FRACTION = ".//div[@id='aod-offer-price']//span[@class='a-price-fraction']"
+
+BUYBOX = {'seller_name': 'Amazon.com', 'price': '$19.99'}
+OFFER = {'type': 'New', 'shipped_from': 'Acme Goods', 'seller_name': 'Acme Goods', 'price': '21.50'}
+
+
+class FakeText:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeOffer:
+    def __init__(self, seller, whole, fraction):
+        self.fields = {SOLD_BY: seller, PRICE_WHOLE: whole, PRICE_FRACTION: fraction}
+
+    def find_element(self, by, xpath):
+        if xpath not in self.fields:
+            raise NoSuchElementException(xpath)
+        return FakeText(self.fields[xpath])
+
+
+class FragmentDriver:
+    """Serves an offers fragment: `pinned` and `offers` are FakeOffers, `loaded` whether any AOD markup rendered"""
+
+    def __init__(self, pinned=None, offers=None, loaded=True):
+        self.pinned = pinned
+        self.offers = offers
+        self.loaded = loaded
+        self.page_source = '<div id="aod-container"></div>'
+
+    def get(self, url):
+        pass
+
+    def find_elements(self, by, xpath):
+        if 'aod-container' in xpath:
+            return [object()] if self.loaded else []
+        if 'aod-pinned-offer' in xpath:
+            return [self.pinned] if self.pinned else []
+        if xpath.endswith("/div[@id='aod-offer']"):
+            return self.offers or []
+        return []
+
+
+@pytest.fixture
+def realtimedata():
+    import realtimedata
+    return realtimedata
+
+
+@pytest.fixture
+def scraper(realtimedata):
+    return realtimedata.RealtimeAmazonScraper()
+
+
+def stored(realtimedata, buybox, offers):
+    return {'B001': (realtimedata.offers_fingerprint(buybox, offers), datetime.now() - timedelta(hours=1))}
+
+
+def test_buybox_changes_the_fingerprint(realtimedata):
+    fingerprint = realtimedata.offers_fingerprint(BUYBOX, [OFFER])
+    # As stored: the typed buy box price from realtimedata
+    stored_buybox = {'seller_name': 'Amazon.com', 'price': Decimal('19.99')}
+    assert realtimedata.offers_fingerprint(stored_buybox, [OFFER]) == fingerprint
+    assert realtimedata.offers_fingerprint(dict(BUYBOX, price='$18.99'), [OFFER]) != fingerprint
+    assert realtimedata.offers_fingerprint(dict(BUYBOX, seller_name='Deal Depot'), [OFFER]) != fingerprint
+    assert realtimedata.offers_fingerprint(None, [OFFER]) != fingerprint
+
+
+def test_probe_reads_the_pinned_offer_and_an_empty_offer_list(scraper):
+    scraper.driver = FragmentDriver(pinned=FakeOffer('Amazon.com', '19', '99'))
+    buybox, offers = scraper.probe_offers('B001')
+    assert (buybox['seller_name'], buybox['price']) == ('Amazon.com', '19.99')
+    assert offers == []
+
+
+def test_fragment_that_did_not_render_is_inconclusive(scraper):
+    scraper.driver = FragmentDriver(loaded=False)
+    assert scraper.probe_offers('B001') is None
+
+
+def test_unchanged_buybox_without_other_offers_skips_the_full_scrape(realtimedata, scraper):
+    scraper.driver = FragmentDriver(pinned=FakeOffer('Amazon.com', '19', '99'))
+    snapshot = stored(realtimedata, {'seller_name': 'Amazon.com', 'price': Decimal('19.99')}, [])
+    assert realtimedata.probe_unchanged(scraper, 'B001', snapshot, timedelta(hours=24))
+
+
+def test_buybox_price_change_escalates(realtimedata, scraper):
+    scraper.driver = FragmentDriver(pinned=FakeOffer('Amazon.com', '17', '49'))
+    snapshot = stored(realtimedata, {'seller_name': 'Amazon.com', 'price': Decimal('19.99')}, [])
+    assert not realtimedata.probe_unchanged(scraper, 'B001', snapshot, timedelta(hours=24))
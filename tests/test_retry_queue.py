@@ -0,0 +1,86 @@
+import pytest
+
+pytest.importorskip('selenium')
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+from retry_queue import RetryQueue, ScrapeFailure, classify_failure
+
+
+@pytest.mark.parametrize('exc, page_source, category', [
+    (None, "Type the characters you see in this image", 'captcha'),
+    (None, "To discuss automated access to Amazon data please contact", 'blocked'),
+    (None, "Sorry! We couldn't find that page", 'not_found'),
+    (None, "This item is no longer available", 'unavailable'),
+    (TimeoutException('page load'), None, 'timeout'),
+    (WebDriverException('tab crashed'), None, 'error'),
+    (ScrapeFailure('captcha'), "Page Not Found", 'captcha'),
+    (None, "<html>no markers</html>", 'parse_failure'),
+    (ValueError('bad'), None, 'error'),
+])
+def test_classify_failure(exc, page_source, category):
+    assert classify_failure(exc, page_source) == category
+
+
+def test_backoff_doubles_until_the_asin_is_dead_lettered(clock):
+    queue = RetryQueue('daily', jitter=0)
+
+    assert queue.fail('B001', 'timeout', 'first') is None
+    assert queue.seconds_until_next() == 30
+    assert queue.pop_due() is None
+
+    clock.advance(30)
+    assert queue.pop_due() == 'B001'
+    assert queue.fail('B001', 'timeout', 'second') is None
+    assert queue.seconds_until_next() == 60
+    assert queue.attempts('B001') == 2
+
+    clock.advance(60)
+    assert queue.pop_due() == 'B001'
+    dead = queue.fail('B001', 'timeout', 'third')
+    assert dead is not None and dead.attempts == 3 and dead.last_error == 'third'
+    assert len(queue) == 0
+    assert queue.pop_due() is None
+    assert queue.take_dead_letters() == [dead]
+    assert queue.take_dead_letters() == []
+
+
+def test_backoff_is_capped(clock):
+    queue = RetryQueue('daily', policy={'blocked': (20, 600)}, jitter=0)
+    for _ in range(8):
+        queue.fail('B001', 'blocked')
+
+    clock.advance(3599)
+    assert queue.pop_due() is None
+    clock.advance(1)
+    assert queue.pop_due() == 'B001'
+
+
+def test_unknown_category_uses_the_error_policy(clock):
+    queue = RetryQueue('daily', jitter=0)
+    queue.fail('B001', 'mystery')
+    queue.fail('B001', 'mystery')
+    assert queue.fail('B001', 'mystery') is not None
+
+
+def test_requeue_is_due_now_and_does_not_count_an_attempt(clock):
+    queue = RetryQueue('daily', jitter=0)
+    queue.fail('B001', 'captcha')
+    queue.requeue('B001')
+
+    assert queue.attempts('B001') == 1
+    assert queue.pop_due() == 'B001'
+    # The superseded backoff entry is skipped once it comes due
+    clock.advance(3600)
+    assert queue.pop_due() is None
+
+
+def test_succeed_forgets_the_asin(clock):
+    queue = RetryQueue('daily', jitter=0)
+    queue.fail('B001', 'timeout')
+    queue.succeed('B001')
+
+    assert len(queue) == 0
+    assert queue.attempts('B001') == 0
+    clock.advance(60)
+    assert queue.pop_due() is None
@@ -0,0 +1,19 @@
+import pytest
+
+pytest.importorskip('psycopg2')
+
+from run_ledger import percentile
+
+
+@pytest.mark.parametrize('values, pct, expected', [
+    ([], 95, None),
+    ([4.0], 95, 4.0),
+    (list(range(1, 21)), 95, 19),
+    (list(range(1, 31)), 95, 29),
+    (list(range(1, 11)), 50, 5),
+    (list(range(1, 101)), 99, 99),
+    (list(range(1, 101)), 100, 100),
+    ([3, 1, 2], 0, 1),
+])
+def test_percentile_is_nearest_rank(values, pct, expected):
+    assert percentile(values, pct) == expected